@@ -0,0 +1,254 @@
+"""Cache-blocking autotuner for the tiled and packed GEMM kernels.
+
+For each hardware description in cpuconf/hw/ this derives the tile size
+of the tiled kernel and the (MC, KC, NC) blocking of the packed kernel from
+the sizes and associativities of the data caches, using the analytical
+model of Low et al., "Analytical Modeling Is Enough for High-Performance
+BLIS" (TOMS 2016):
+
+    KC  the MR x KC micro-panel of A and the KC x NR micro-panel of B stay
+        in L1, B taking at most the ways A leaves free
+    MC  the packed MC x KC block of A fills L2, minus the ways of one B
+        micro-panel and one way for C
+    NC  the packed KC x NC panel of B fills L3, minus the ways of the A
+        block; without an L3 it streams from DRAM and NC is DEFAULT_NC
+
+The tiled kernel keeps one tile each of A, B and C in L1, so its tile is
+the largest multiple of 8 with 3 tiles in all but one way of L1.
+
+Threads may run on any cluster, so on big.LITTLE systems every value is
+the smallest over the clusters: the blocking fits the smallest caches.
+
+With --refine, neighbouring candidates are timed and the fastest is kept:
+"host" runs gemm_bench on this machine (only meaningful when the host
+resembles the target), "sim" runs gemm_bench in gem5 on the described
+system and compares simulated time. The winners are stored in
+cpuconf/tuning.json, from which generic_cpu_config.py passes them to
+gemm.c as GEMM_BLOCK_SIZE and GEMM_PACKED_BLOCKS.
+
+Usage:
+    python3 autotune.py                                   # analytic, every description
+    python3 autotune.py pynqz2 --refine host --layers output/darknet/gemm_calls.txt
+"""
+import argparse
+import csv
+import math
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT_DIR, "cpuconf"))
+
+from hwdesc import HW_DIR, TUNING_FILE, data_caches, hardware_hash, load_hardware, load_tuning, save_tuning, tuning_env
+from sweep import DEFAULT_CONFIG_SCRIPT, DEFAULT_GEM5, DEFAULT_WORKDIR
+
+DEFAULT_BENCH = os.path.join(DEFAULT_WORKDIR, "gemm_bench")
+FLOAT_BYTES = 4
+# Register block (MR, NR) of the micro-kernel gem5 builds use: SSE on x86 and
+# NEON on ARM are both 4 x 8 (see gemm_micro_kernel in src/gemm.c)
+MICRO_KERNEL = (4, 8)
+DEFAULT_NC = 4096
+TILE_STEP = 8
+SIM_SECONDS_RE = re.compile(r"^(?:simSeconds|sim_seconds)\s+([0-9.eE+-]+)")
+
+
+def way_bytes(size, assoc):
+    return size // assoc
+
+
+def round_down(value, step):
+    """Largest multiple of `step` not above `value`, at least `step`."""
+    return max(step, int(value) // step * step)
+
+
+def analytic_blocking(hw, micro_kernel=MICRO_KERNEL):
+    """Tile size and (MC, KC, NC) for `hw` from the analytical model, the smallest over its clusters.
+
+    A smaller KC only shrinks the blocks the other values are sized with,
+    so the smallest of each fits the caches of every cluster.
+    """
+    per_cluster = [cluster_blocking(hw, cluster, micro_kernel) for cluster in range(len(hw["clusters"]))]
+    return {key: min(blocking[key] for blocking in per_cluster) for key in per_cluster[0]}
+
+
+def cluster_blocking(hw, cluster=0, micro_kernel=MICRO_KERNEL):
+    """Tile size and (MC, KC, NC) for the caches a core of `cluster` sees."""
+    mr, nr = micro_kernel
+    caches = data_caches(hw, cluster)
+    _, l1_size, l1_assoc = caches[0]
+
+    ways_a = max(1, math.floor((l1_assoc - 1) / (1 + nr / mr)))
+    kc = round_down(ways_a * way_bytes(l1_size, l1_assoc) // (mr * FLOAT_BYTES), TILE_STEP)
+
+    mc = 30 * mr
+    if len(caches) > 1:
+        _, size, assoc = caches[1]
+        ways_b = math.ceil(kc * nr * FLOAT_BYTES / way_bytes(size, assoc))
+        mc = max(1, assoc - 1 - ways_b) * way_bytes(size, assoc) // (kc * FLOAT_BYTES)
+    mc = round_down(mc, mr)
+
+    nc = DEFAULT_NC
+    if len(caches) > 2:
+        _, size, assoc = caches[2]
+        ways_a = math.ceil(mc * kc * FLOAT_BYTES / way_bytes(size, assoc))
+        nc = max(1, assoc - 1 - ways_a) * way_bytes(size, assoc) // (kc * FLOAT_BYTES)
+    nc = round_down(nc, nr)
+
+    tile = math.isqrt(l1_size * (l1_assoc - 1) // l1_assoc // (3 * FLOAT_BYTES))
+    return {"block_size": round_down(tile, TILE_STEP), "mc": mc, "kc": kc, "nc": nc}
+
+
+def tile_candidates(block_size):
+    """Tile sizes around the analytic one, plus the old fixed 64."""
+    sizes = {block_size + step * TILE_STEP for step in (-2, -1, 0, 1, 2)} | {64}
+    return sorted(size for size in sizes if size >= TILE_STEP)
+
+
+def packed_candidates(blocking, micro_kernel=MICRO_KERNEL):
+    """(MC, KC, NC) around the analytic blocking: MC x {1/2, 1, 2}, KC x {1/2, 1, 3/2}, NC x {1/2, 1}."""
+    mr, nr = micro_kernel
+    candidates = set()
+    for mc_scale in (0.5, 1, 2):
+        for kc_scale in (0.5, 1, 1.5):
+            for nc_scale in (0.5, 1):
+                candidates.add((
+                    round_down(blocking["mc"] * mc_scale, mr),
+                    round_down(blocking["kc"] * kc_scale, TILE_STEP),
+                    round_down(blocking["nc"] * nc_scale, nr),
+                ))
+    return sorted(candidates)
+
+
+def trial_shapes(layers_file, count):
+    """The `count` distinct (M, N, K) shapes of a call log with the most FLOPs."""
+    from process import load_gemm_layers
+
+    shapes = sorted(set(load_gemm_layers(layers_file)), key=lambda s: (-s[0] * s[1] * s[2], s))
+    return shapes[:count]
+
+
+def write_trial_layers(path, shapes):
+    """Write shapes as a gemm_calls.txt that gemm_bench can read."""
+    with open(path, "w") as file:
+        for M, N, K in shapes:
+            file.write(f"GEMM Layer: autotune -M: {M}, N: {N}, K: {K}\n")
+
+
+def blocking_env(block_size, packed_blocks):
+    return {"GEMM_BLOCK_SIZE": str(block_size), "GEMM_PACKED_BLOCKS": ",".join(map(str, packed_blocks))}
+
+
+def host_trial(bench, layers_path, method, env, workdir, reps=3):
+    """Total median host runtime of gemm_bench over the trial shapes."""
+    output = os.path.join(workdir, "trial.csv")
+    if os.path.exists(output):
+        os.remove(output)
+    subprocess.run(
+        [bench, "-m", method, "-w", "1", "-r", str(reps), "-o", output, layers_path],
+        env=dict(os.environ, **env), check=True, stdout=subprocess.DEVNULL,
+    )
+    with open(output, "r", newline="") as file:
+        return sum(float(row["Median Runtime [s]"]) for row in csv.DictReader(file))
+
+
+def sim_trial(bench, layers_path, method, env, workdir, hw_name, gem5=DEFAULT_GEM5,
+              config_script=DEFAULT_CONFIG_SCRIPT):
+    """Simulated seconds of one gemm_bench run in gem5 on `hw_name`.
+
+    gemm_bench is built without m5 ops, so the final stats dump covers the
+    whole run. Its setup (filling A and B) is the same for every candidate.
+    """
+    outdir = os.path.join(workdir, "sim")
+    command = [
+        gem5, f"--outdir={outdir}", config_script,
+        "--hw", hw_name,
+        "--binary", bench,
+        "--workload-args", f"-m {method} -w 0 -r 1 -o {os.path.join(outdir, 'trial.csv')} {layers_path}",
+        "--outdir", outdir,
+        "--checkpoint-dir", os.path.join(outdir, "checkpoints"),
+        "--gemm-method", method,
+    ]
+    subprocess.run(command, env=dict(os.environ, GEMM_LOG_DIR=outdir, **env), check=True,
+                   stdout=subprocess.DEVNULL)
+    seconds = None
+    with open(os.path.join(outdir, "stats.txt"), "r") as file:
+        for line in file:
+            match = SIM_SECONDS_RE.match(line)
+            if match:
+                seconds = float(match.group(1))
+    if seconds is None:
+        raise RuntimeError(f"no simSeconds in {outdir}/stats.txt")
+    return seconds
+
+
+def refine(hw, blocking, trial, layers_path, workdir):
+    """Time the candidates around `blocking` with `trial` and keep the fastest."""
+    packed_blocks = (blocking["mc"], blocking["kc"], blocking["nc"])
+    timings = {}
+    for size in tile_candidates(blocking["block_size"]):
+        timings[size] = trial(layers_path, "tiled", blocking_env(size, packed_blocks), workdir)
+        print(f"  {hw['name']} tiled {size}: {timings[size]:.6g} s")
+    best_tile = min(timings, key=timings.get)
+
+    timings = {}
+    for blocks in packed_candidates(blocking):
+        timings[blocks] = trial(layers_path, "packed", blocking_env(best_tile, blocks), workdir)
+        print(f"  {hw['name']} packed {','.join(map(str, blocks))}: {timings[blocks]:.6g} s")
+    mc, kc, nc = min(timings, key=timings.get)
+    return {"block_size": best_tile, "mc": mc, "kc": kc, "nc": nc}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune the GEMM cache blocking for each hardware description.")
+    parser.add_argument("configs", nargs="*", help="hardware descriptions (path or name in cpuconf/hw/; default: all)")
+    parser.add_argument("--refine", choices=("none", "host", "sim"), default="none",
+                        help="time candidates around the analytic blocking on the host or in gem5")
+    parser.add_argument("--layers", help="gemm_calls.txt or gemm_calls.bin whose largest shapes are timed")
+    parser.add_argument("--shapes", type=int, default=3, help="number of distinct shapes to time (default: 3)")
+    parser.add_argument("--bench", default=DEFAULT_BENCH, help="gemm_bench binary (static build for --refine sim)")
+    parser.add_argument("--gem5", default=DEFAULT_GEM5, help="gem5 binary for --refine sim")
+    parser.add_argument("--table", default=TUNING_FILE, help="tuning table to update (default: cpuconf/tuning.json)")
+    parser.add_argument("--dry-run", action="store_true", help="print the blocking without updating the table")
+    args = parser.parse_args()
+
+    if args.refine != "none" and not args.layers:
+        parser.error("--refine needs --layers")
+    configs = args.configs or sorted(name[:-5] for name in os.listdir(HW_DIR) if name.endswith(".json"))
+
+    table = load_tuning(args.table)
+    with tempfile.TemporaryDirectory(prefix="autotune_") as workdir:
+        layers_path = None
+        if args.refine != "none":
+            shapes = trial_shapes(args.layers, args.shapes)
+            if not shapes:
+                sys.exit(f"No GEMM layers in {args.layers}")
+            layers_path = os.path.join(workdir, "gemm_calls.txt")
+            write_trial_layers(layers_path, shapes)
+            print(f"Timing {len(shapes)} shapes: {', '.join('x'.join(map(str, s)) for s in shapes)}")
+
+        for config in configs:
+            hw = load_hardware(config)
+            blocking = analytic_blocking(hw)
+            source = "analytic"
+            if args.refine == "host":
+                trial = lambda *trial_args: host_trial(args.bench, *trial_args)
+                blocking, source = refine(hw, blocking, trial, layers_path, workdir), "host"
+            elif args.refine == "sim":
+                trial = lambda *trial_args: sim_trial(args.bench, *trial_args, hw["name"], gem5=args.gem5)
+                blocking, source = refine(hw, blocking, trial, layers_path, workdir), "sim"
+            entry = dict(blocking, source=source, hw_hash=hardware_hash(hw))
+            env = tuning_env(entry)
+            print(f"{hw['name']}: GEMM_BLOCK_SIZE={env['GEMM_BLOCK_SIZE']} "
+                  f"GEMM_PACKED_BLOCKS={env['GEMM_PACKED_BLOCKS']} ({source})")
+            table[hw["name"]] = entry
+
+    if not args.dry_run:
+        save_tuning(table, args.table)
+        print(f"Tuning table written to {args.table}")
+
+
+if __name__ == "__main__":
+    main()
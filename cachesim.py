@@ -0,0 +1,310 @@
+"""Trace-driven cache model of the gemm_nn kernels, for pre-screening before gem5.
+
+Predicts the data-cache misses of the gemm_nn, optimized (unrolled) and
+tiled kernels of src/gemm.c on the cache hierarchy of each hardware
+description in cpuconf/hw/, in minutes at most per layer instead of gem5 hours:
+
+    python3 cachesim.py output/darknet/gemm_calls.bin --hw pynqz2 --methods gemm_nn,tiled --tile-sizes 32,56
+
+Every kernel is a sequence of row updates C[i, j0:j1] += A[i, k] * B[k, j0:j1]
+(see row_updates); they differ only in the order. The updates are expanded
+chunk by chunk with numpy into the cache-line stream the kernel reads and
+writes (see line_stream), and the stream is run through one set-associative
+LRU cache per level (see lru_access). Each level sees the misses of the
+level above it. gemm_nn and optimized make the same accesses in the same
+order, so they get the same misses.
+
+The model runs one thread from a cold cache, with write-allocate caches and
+no prefetchers. It counts one miss per line fill; gem5 also counts the
+accesses waiting on a fill in flight as misses. It ignores writebacks and
+instruction fetches. Accesses are counted per load or store of
+--vector-width floats, like the SSE/NEON code gem5 runs. The L1D/L2/L3 Miss
+Rate columns follow process.py's gemm_metrics.csv. With --compare the
+prediction is merged with a gemm_metrics.csv or all_gemm_metrics.csv,
+column by column.
+"""
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT_DIR, "cpuconf"))
+
+from hwdesc import CACHE_LINE, HW_DIR, data_caches, load_hardware, tuning_for
+from process import load_gemm_layers
+
+METHODS = ("gemm_nn", "optimized", "tiled")
+FLOAT_BYTES = 4
+PAGE_BYTES = 4096
+# glibc serves matrices this large with mmap: page-aligned chunks behind a 16-byte header
+MALLOC_OFFSET = 16
+DEFAULT_TILE_SIZE = 64  # GEMM_BLOCK_SIZE default of src/gemm.c
+DEFAULT_VECTOR_WIDTH = 4  # floats per SSE/NEON load or store
+DEFAULT_CHUNK = 1 << 22  # elements of the j loops expanded at once
+DEFAULT_OUTPUT = "cachesim.csv"
+# gemm_metrics.csv column prefix of each data_caches level
+LEVEL_COLUMNS = {"l1d": "L1D", "l2": "L2", "l3": "L3"}
+
+
+def matrix_bases(M, N, K):
+    """Byte addresses of A (M x K), B (K x N) and C (M x N), allocated one after another."""
+    bases = []
+    address = PAGE_BYTES
+    for elements in (M * K, K * N, M * N):
+        bases.append(address + MALLOC_OFFSET)
+        address += -(-(elements * FLOAT_BYTES + MALLOC_OFFSET) // PAGE_BYTES) * PAGE_BYTES
+    return bases
+
+
+def row_updates(method, M, N, K, tile_size=DEFAULT_TILE_SIZE, chunk=DEFAULT_CHUNK):
+    """The row updates of a kernel in execution order, as (i, k, j0, j1) arrays per chunk.
+
+    gemm_nn and optimized run i, k, then all of j. tiled runs BLOCK_SIZE
+    tiles (ii, jj), then kk, i and k within them, over one tile of j.
+    """
+    if method == "tiled":
+        for ii in range(0, M, tile_size):
+            i, k = np.meshgrid(np.arange(ii, min(ii + tile_size, M)), np.arange(K), indexing="ij")
+            i, k = i.ravel(), k.ravel()
+            order = np.lexsort((k, i, k // tile_size))
+            i, k = i[order], k[order]
+            for jj in range(0, N, tile_size):
+                yield i, k, np.full(len(i), jj), np.full(len(i), min(jj + tile_size, N))
+        return
+    rows = max(1, chunk // max(K * N, 1))
+    for start in range(0, M, rows):
+        i, k = np.meshgrid(np.arange(start, min(start + rows, M)), np.arange(K), indexing="ij")
+        yield i.ravel(), k.ravel(), np.zeros(i.size, dtype=np.int64), np.full(i.size, N)
+
+
+def line_starts(offsets, j0, j1):
+    """The j in (j0, j1) of each update where element offsets + j begins a cache line, as (update, j)."""
+    per_line = CACHE_LINE // FLOAT_BYTES
+    first = j0 + (-(offsets + j0)) % per_line
+    first = np.where(first == j0, first + per_line, first)
+    counts = np.maximum(0, (j1 - 1 - first) // per_line + 1)
+    owner = np.repeat(np.arange(len(j0)), counts)
+    return owner, first[owner] + per_line * (np.arange(len(owner)) - (np.cumsum(counts) - counts)[owner])
+
+
+def line_stream(updates, bases, N, K, vector_width=DEFAULT_VECTOR_WIDTH):
+    """Cache lines a chunk of row updates touches, in order, and the loads and stores each stands for.
+
+    An update reads A[i, k], then alternates between B[k, j] and C[i, j].
+    Its j range is split wherever either of them enters a new line; within a
+    segment both lines are the most recently used, so one access to each
+    gives the same LRU misses as the whole alternation (with 2 or more ways).
+    Segments are found from the line starts, without expanding every element.
+    """
+    i, k, j0, j1 = updates
+    per_line = CACHE_LINE // FLOAT_BYTES
+    a_base, b_base, c_base = (base // FLOAT_BYTES for base in bases)
+    b_rows, c_rows = b_base + k * N, c_base + i * N
+    b_owner, b_starts = line_starts(b_rows, j0, j1)
+    c_owner, c_starts = line_starts(c_rows, j0, j1)
+    keys = np.sort(np.concatenate([np.arange(len(i)) * (N + 1) + j0, b_owner * (N + 1) + b_starts,
+                                   c_owner * (N + 1) + c_starts]))
+    keys = keys[np.append(True, keys[1:] != keys[:-1])]
+    segment_owner, segment_j = keys // (N + 1), keys % (N + 1)
+    last = np.append(segment_owner[1:] != segment_owner[:-1], True)
+    segment_lengths = np.where(last, j1[segment_owner], np.append(segment_j[1:], 0)) - segment_j
+
+    counts = np.bincount(segment_owner, minlength=len(i))
+    block = 1 + 2 * counts
+    block_start = np.cumsum(block) - block
+    rank = np.arange(len(keys)) - (np.cumsum(counts) - counts)[segment_owner]
+    lines = np.empty(block.sum(), dtype=np.int64)
+    weights = np.empty(block.sum())
+    lines[block_start] = (a_base + i * K + k) // per_line
+    weights[block_start] = 1
+    b_pos = block_start[segment_owner] + 1 + 2 * rank
+    lines[b_pos] = (b_rows[segment_owner] + segment_j) // per_line
+    weights[b_pos] = segment_lengths / vector_width
+    # C is loaded and stored
+    lines[b_pos + 1] = (c_rows[segment_owner] + segment_j) // per_line
+    weights[b_pos + 1] = 2 * segment_lengths / vector_width
+    return lines, weights
+
+
+def make_lru_cache(size, assoc):
+    """Empty set-associative LRU cache state of `size` bytes."""
+    sets = max(1, size // (CACHE_LINE * assoc))
+    return {
+        "sets": sets,
+        "tags": np.full((sets, assoc), -1, dtype=np.int64),
+        "stamps": np.full((sets, assoc), -1, dtype=np.int64),
+        "clock": 0,
+    }
+
+
+def lru_access(cache, lines):
+    """Run a stream of cache lines through `cache`; returns which accesses missed.
+
+    Sets are independent, so the stream is replayed in rounds that each
+    take the next access of every set at once: a round is one vectorised
+    lookup and update over the sets. An access repeating the previous one
+    of its set is a hit that changes nothing and is skipped.
+    """
+    miss = np.zeros(len(lines), dtype=bool)
+    if not len(lines):
+        return miss
+    sets = lines % cache["sets"]
+    tags = lines // cache["sets"]
+    order = np.argsort(sets, kind="stable")
+    grouped = lines[order]
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = grouped[1:] != grouped[:-1]
+    order = order[keep]
+    set_order = sets[order]
+    starts = np.flatnonzero(np.r_[True, set_order[1:] != set_order[:-1]])
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.append(starts, len(order))))
+    order = order[np.argsort(rank, kind="stable")]
+    bounds = np.append(0, np.cumsum(np.bincount(rank)))
+
+    sets, tags = sets[order], tags[order]
+    tag_table, stamp_table = cache["tags"], cache["stamps"]
+    for low, high in zip(bounds[:-1], bounds[1:]):
+        idx = order[low:high]
+        s, t = sets[low:high], tags[low:high]
+        match = tag_table[s] == t[:, None]
+        hit = match.any(axis=1)
+        way = np.where(hit, match.argmax(axis=1), stamp_table[s].argmin(axis=1))
+        tag_table[s, way] = t
+        stamp_table[s, way] = cache["clock"] + idx
+        miss[idx] = ~hit
+    cache["clock"] += len(lines)
+    return miss
+
+
+def simulate_layer(method, M, N, K, caches, tile_size=DEFAULT_TILE_SIZE, vector_width=DEFAULT_VECTOR_WIDTH,
+                   chunk=DEFAULT_CHUNK):
+    """Accesses and misses of one GEMM on `caches` (hwdesc.data_caches), from cold caches.
+
+    Returns (accesses, misses): the loads and stores of the kernel and the
+    misses of each level, innermost first; each level is accessed by the
+    misses of the one above.
+    """
+    levels = [make_lru_cache(size, assoc) for _, size, assoc in caches]
+    bases = matrix_bases(M, N, K)
+    accesses = 0.0
+    misses = np.zeros(len(levels), dtype=np.int64)
+    for updates in row_updates(method, M, N, K, tile_size, chunk):
+        lines, weights = line_stream(updates, bases, N, K, vector_width)
+        accesses += weights.sum()
+        for level, cache in enumerate(levels):
+            missed = lru_access(cache, lines)
+            misses[level] += missed.sum()
+            lines = lines[missed]
+    return accesses, misses
+
+
+def predict_row(hw, caches, method, tile_size, shape, vector_width=DEFAULT_VECTOR_WIDTH, chunk=DEFAULT_CHUNK):
+    """The prediction row of one (method, tile size, shape) on `caches` of `hw`."""
+    M, N, K = shape
+    accesses, misses = simulate_layer(method, M, N, K, caches, tile_size if method == "tiled" else 0,
+                                      vector_width, chunk)
+    row = {"config": hw["name"], "gemm_method": method, "tile_size": tile_size,
+           "Layer": f"GEMM Layer ({M}, {N}, {K})", "M": M, "N": N, "K": K}
+    sizes = {level: size for level, size, _ in caches}
+    row["L1 Cache [kB]"] = sizes["l1d"] / 1024
+    row["L2 Cache [kB]"] = sizes["l2"] / 1024 if "l2" in sizes else np.nan
+    row["L3 Cache [MB]"] = sizes["l3"] / (1 << 20) if "l3" in sizes else np.nan
+    level_accesses = accesses
+    for (level, _, _), level_misses in zip(caches, misses):
+        name = LEVEL_COLUMNS[level]
+        row[f"{name} Accesses"] = level_accesses
+        row[f"{name} Misses"] = level_misses
+        row[f"{name} Miss Rate"] = level_misses / level_accesses if level_accesses else 0.0
+        level_accesses = level_misses
+    return row
+
+
+def predict(hw, shapes, methods=METHODS, tile_sizes=None, cluster=0, vector_width=DEFAULT_VECTOR_WIDTH,
+            chunk=DEFAULT_CHUNK, workers=None):
+    """One row per (method, tile size, shape) of `hw`, with gemm_metrics.csv-style miss columns.
+
+    tile_sizes apply to the tiled kernel and default to the tuned
+    GEMM_BLOCK_SIZE of `hw` (cpuconf/tuning.json), as in its gem5 runs.
+    Layers are simulated in a process pool, one worker per host core by
+    default.
+    """
+    caches = data_caches(hw, cluster)
+    if not tile_sizes:
+        tuning = tuning_for(hw)
+        tile_sizes = [tuning["block_size"] if tuning else DEFAULT_TILE_SIZE]
+    jobs = [(method, tile_size, shape) for method in methods
+            for tile_size in (tile_sizes if method == "tiled" else [np.nan]) for shape in shapes]
+    rows = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = {executor.submit(predict_row, hw, caches, *job, vector_width, chunk): index
+                   for index, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            row = rows[futures[future]] = future.result()
+            tile = "" if np.isnan(row["tile_size"]) else f" bs{row['tile_size']}"
+            print(f"{hw['name']} {row['gemm_method']}{tile} ({row['M']}, {row['N']}, {row['K']}): "
+                  + ", ".join(f"{LEVEL_COLUMNS[level]} {row[f'{LEVEL_COLUMNS[level]} Miss Rate']:.4f}"
+                              for level, _, _ in caches))
+    return pd.DataFrame(rows)
+
+
+def compare(predicted, measured):
+    """Predicted and gem5 miss rates side by side, matched on shape and, if present, config, method and tile size."""
+    keys = ["M", "N", "K"] + [key for key in ("config", "gemm_method", "tile_size") if key in measured.columns]
+    rates = [f"{name} Miss Rate" for name in LEVEL_COLUMNS.values()
+             if f"{name} Miss Rate" in predicted.columns and f"{name} Miss Rate" in measured.columns]
+    if not rates:
+        print("Warning: the measured metrics have no miss rate columns to compare with.")
+    measured = measured[keys + rates].drop_duplicates(subset=keys)
+    predicted = predicted.copy()
+    if "tile_size" in keys:
+        for df in (predicted, measured):
+            df["tile_size"] = pd.to_numeric(df["tile_size"], errors="coerce")
+    return predicted.merge(measured, on=keys, how="inner", suffixes=(" (model)", " (gem5)"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Predict GEMM cache misses with a trace-driven LRU model.")
+    parser.add_argument("layers", help="gemm_calls.bin or gemm_calls.txt whose distinct shapes are modelled")
+    parser.add_argument("--hw", action="append",
+                        help="hardware description (path or name in cpuconf/hw/); repeatable (default: all)")
+    parser.add_argument("--cluster", help="cluster whose caches the thread uses (default: the first)")
+    parser.add_argument("--methods", default=",".join(METHODS), help=f"GEMM kernels (default: {','.join(METHODS)})")
+    parser.add_argument("--tile-sizes", help="BLOCK_SIZE values of the tiled kernel, e.g. 32,56 (default: tuned)")
+    parser.add_argument("--vector-width", type=int, default=DEFAULT_VECTOR_WIDTH,
+                        help=f"floats per load or store (default: {DEFAULT_VECTOR_WIDTH})")
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK,
+                        help=f"j-loop elements expanded at once (default: {DEFAULT_CHUNK})")
+    parser.add_argument("--workers", type=int, help="worker processes (default: number of host cores)")
+    parser.add_argument("--compare", help="gemm_metrics.csv or all_gemm_metrics.csv to put the gem5 miss rates next to")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help=f"output CSV (default: {DEFAULT_OUTPUT})")
+    args = parser.parse_args()
+
+    methods = args.methods.split(",")
+    unknown = [method for method in methods if method not in METHODS]
+    if unknown:
+        parser.error(f"unknown method(s) {', '.join(unknown)}; choose from {', '.join(METHODS)}")
+    shapes = list(dict.fromkeys(tuple(int(d) for d in layer) for layer in load_gemm_layers(args.layers)))
+    tile_sizes = [int(size) for size in args.tile_sizes.split(",")] if args.tile_sizes else None
+    frames = []
+    for path in args.hw or sorted(glob.glob(os.path.join(HW_DIR, "*.json"))):
+        hw = load_hardware(path)
+        names = [cluster["name"] for cluster in hw["clusters"]]
+        cluster = names.index(args.cluster) if args.cluster in names else 0
+        frames.append(predict(hw, shapes, methods, tile_sizes, cluster, args.vector_width, args.chunk,
+                              args.workers))
+    df = pd.concat(frames, ignore_index=True)
+
+    if args.compare:
+        df = compare(df, pd.read_csv(args.compare))
+        print(f"{len(df)} predicted rows matched a row of {args.compare}")
+    df.to_csv(args.output, index=False)
+    print(f"Predictions for {len(shapes)} shapes saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Per-core, per-cluster and system aggregation of multi-CPU gem5 stats.
+
+gem5 names the stats of a core after where the configuration put it:
+system.cpu for a single core, system.cpu0..N for a multi-core system and
+system.big_cores0..3 / system.little_cores0..3 for a big.LITTLE one (see
+build_system in cpuconf/generic_cpu_config.py). Cores are found from the
+stat names, and a core's cluster is its name without the trailing number.
+
+aggregate_cores works on the blocks x stats matrix of process.py, so every
+block is aggregated at once:
+
+    CPI           cycles / committed instructions, where the cycles of a
+                  core are its CPI x instructions; idle cores have none
+    FLOPs         scalar FP + 4 x vector FP instructions, as in
+                  calculate_metrics
+    miss rates    misses / accesses of the L1D caches, of every L2 (per
+                  core, per cluster or shared) and of the L3
+    imbalance     max / mean - 1 over the cores that ran a thread, from
+                  committed instructions and from cycles, in percent
+
+Only numpy is needed.
+"""
+import numpy as np
+
+# Stats aggregate_cores reads, as wildcard entries for compile_stat_filter
+CORE_STATS = (
+    "system.*.cpi",
+    "system.*.numCycles",
+    "system.*.commitStats0.numInsts",
+    "system.*.commitStats0.numFpInsts",
+    "system.*.commitStats0.numVecInsts",
+    "system.*.power_state.pwrStateResidencyTicks::ON",
+    "system.*.dcache.overallAccesses::total",
+    "system.*.dcache.overallMisses::total",
+    "system.*.l2cache.overallAccesses::total",
+    "system.*.l2cache.overallMisses::total",
+    # Caches directly under system: l2cache, l3cache and <cluster>_l2cache
+    "system.*.overallAccesses::total",
+    "system.*.overallMisses::total",
+)
+# FLOPs per committed vector FP instruction
+VECTOR_WIDTH = 4
+
+
+def core_names(columns):
+    """Names of the cores with stats in `columns`, e.g. ["cpu"] or ["big_cores0", ..., "little_cores3"].
+
+    A core is any system.<name> with a cpi stat; numbered cores sort numerically.
+    """
+    cores = [name[len("system."):-len(".cpi")] for name in columns
+             if name.startswith("system.") and name.endswith(".cpi") and name.count(".") == 2]
+    return sorted(cores, key=lambda core: (cluster_name(core), int(core[len(cluster_name(core)):] or -1)))
+
+
+def cluster_name(core):
+    """Cluster of a core: its name without the trailing core number."""
+    return core.rstrip("0123456789") or core
+
+
+def stat_matrix(values, columns, names, default=0.0):
+    """blocks x len(names) array of the named stats, `default` where missing."""
+    matrix = np.full((values.shape[0], len(names)), default)
+    for i, name in enumerate(names):
+        idx = columns.get(name)
+        if idx is not None:
+            matrix[:, i] = values[:, idx]
+    return np.where(np.isnan(matrix), default, matrix)
+
+
+def imbalance(matrix, active):
+    """max / mean - 1 in percent over the active cores of every block; NaN without any."""
+    count = active.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.where(active, matrix, 0).sum(axis=1) / count
+        peak = np.where(active, matrix, -np.inf).max(axis=1) if matrix.shape[1] else np.zeros(len(count))
+        return np.where(count > 0, 100.0 * (peak / mean - 1), np.nan)
+
+
+def ratio(numerator, denominator):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
+
+
+def aggregate_cores(values, columns):
+    """Aggregate the core stats of every block of a stats matrix.
+
+    Returns (system, units). `system` has the number of "cores" and one
+    array per block for the whole system: "threads", "insts", "cycles",
+    "cpi", "fp_insts", "vec_insts", "flops", "on_ticks", the "l1d", "l2"
+    and "l3" miss rates and the "insts_imbalance" and "cycles_imbalance"
+    percentages. `units`
+    maps metric column names to arrays: per-core columns such as
+    "CPI [cpu0]" when there is more than one core, and per-cluster columns
+    such as "Cluster CPI [big_cores]" when there is more than one cluster.
+    """
+    cores = core_names(columns)
+    clusters = list(dict.fromkeys(cluster_name(core) for core in cores))
+    # cores x clusters membership, so per-cluster sums are one matrix product
+    membership = np.array([[cluster_name(core) == cluster for cluster in clusters] for core in cores], dtype=float)
+    membership = membership.reshape(len(cores), len(clusters))
+
+    def per_core(suffix, default=0.0):
+        return stat_matrix(values, columns, [f"system.{core}.{suffix}" for core in cores], default)
+
+    insts = per_core("commitStats0.numInsts")
+    active = insts > 0
+    cycles = np.where(active, per_core("cpi"), 0.0) * insts
+    elapsed = per_core("numCycles")
+    flops = per_core("commitStats0.numFpInsts") + VECTOR_WIDTH * per_core("commitStats0.numVecInsts")
+    l1d_accesses = per_core("dcache.overallAccesses::total")
+    l1d_misses = per_core("dcache.overallMisses::total")
+
+    def shared(names, stat):
+        return stat_matrix(values, columns, [f"system.{name}.{stat}" for name in names]).sum(axis=1)
+
+    # L2s private to a core or shared by a cluster, per cluster; then the
+    # system-wide L2 on top for the system miss rate
+    cluster_l2 = [f"system.{cluster}_l2cache" for cluster in clusters]
+    cluster_l2_accesses = (per_core("l2cache.overallAccesses::total") @ membership
+                           + stat_matrix(values, columns, [f"{l2}.overallAccesses::total" for l2 in cluster_l2]))
+    cluster_l2_misses = (per_core("l2cache.overallMisses::total") @ membership
+                         + stat_matrix(values, columns, [f"{l2}.overallMisses::total" for l2 in cluster_l2]))
+    l2_accesses = cluster_l2_accesses.sum(axis=1) + shared(["l2cache"], "overallAccesses::total")
+    l2_misses = cluster_l2_misses.sum(axis=1) + shared(["l2cache"], "overallMisses::total")
+
+    system = {
+        "cores": len(cores),
+        "threads": active.sum(axis=1),
+        "insts": insts.sum(axis=1),
+        "cycles": cycles.sum(axis=1),
+        "cpi": ratio(cycles.sum(axis=1), insts.sum(axis=1)),
+        "fp_insts": per_core("commitStats0.numFpInsts").sum(axis=1),
+        "vec_insts": per_core("commitStats0.numVecInsts").sum(axis=1),
+        "flops": flops.sum(axis=1),
+        "on_ticks": per_core("power_state.pwrStateResidencyTicks::ON").sum(axis=1),
+        "l1d": ratio(l1d_misses.sum(axis=1), l1d_accesses.sum(axis=1)),
+        "l2": ratio(l2_misses, l2_accesses),
+        "l3": ratio(shared(["l3cache"], "overallMisses::total"), shared(["l3cache"], "overallAccesses::total")),
+        "insts_imbalance": imbalance(insts, active),
+        "cycles_imbalance": imbalance(elapsed, active),
+    }
+
+    units = {}
+    if len(cores) > 1:
+        core_cpi = ratio(cycles, insts)
+        core_l1d = ratio(l1d_misses, l1d_accesses)
+        for i, core in enumerate(cores):
+            units[f"CPI [{core}]"] = core_cpi[:, i]
+            units[f"Instructions [{core}]"] = insts[:, i]
+            units[f"FLOPs [{core}]"] = flops[:, i]
+            units[f"L1D Miss Rate [{core}]"] = core_l1d[:, i]
+    if len(clusters) > 1:
+        cluster_insts = insts @ membership
+        cluster_cpi = ratio(cycles @ membership, cluster_insts)
+        cluster_flops = flops @ membership
+        cluster_l1d = ratio(l1d_misses @ membership, l1d_accesses @ membership)
+        cluster_l2 = ratio(cluster_l2_misses, cluster_l2_accesses)
+        cluster_threads = active.astype(float) @ membership
+        for j, cluster in enumerate(clusters):
+            units[f"Cluster Threads [{cluster}]"] = cluster_threads[:, j]
+            units[f"Cluster CPI [{cluster}]"] = cluster_cpi[:, j]
+            units[f"Cluster Instructions [{cluster}]"] = cluster_insts[:, j]
+            units[f"Cluster FLOPs [{cluster}]"] = cluster_flops[:, j]
+            units[f"Cluster L1D Miss Rate [{cluster}]"] = cluster_l1d[:, j]
+            units[f"Cluster L2 Miss Rate [{cluster}]"] = cluster_l2[:, j]
+    return system, units
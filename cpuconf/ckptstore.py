@@ -0,0 +1,253 @@
+"""Content-addressed store of gem5 checkpoints taken at the first GEMM call.
+
+Every design point of a workload boots the same binary, loads the same
+network and weights and runs the same setup code before its first GEMM.
+gemm.c marks that point with m5_checkpoint, and generic_cpu_config.py
+--checkpoint-store saves the checkpoint there once per workload. Later runs
+of the same workload restore it, on any hardware description it is
+compatible with, and only simulate the GEMMs.
+
+An entry is keyed by everything that decides the checkpointed state:
+
+    binary       content hash of the workload binary
+    args         its arguments, with files they name (cfg, weights, image)
+                 hashed by content, and its working directory
+    env          the process environment, which lives in simulated memory
+    memory       isa and mem_size of the hardware description
+    cores        the clusters in build order with their core counts, which
+                 fix the SimObject paths and thread contexts of the checkpoint,
+                 and whether they have fast-forward twins
+
+Cache sizes, clocks, core models and DRAM are not part of the key: gem5
+restores architectural state and memory contents only.
+
+Entries are directories STORE/<key> holding gem5's checkpoint files and
+entry.json. They are written to a temporary directory and renamed into
+place, so a crashed run never leaves a half-written entry. Eviction drops
+the least recently used entries beyond the entry, size and age limits:
+
+    python3 cpuconf/ckptstore.py list
+    python3 cpuconf/ckptstore.py evict --max-gb 100
+    python3 cpuconf/ckptstore.py remove <key>
+
+Only the standard library is used.
+"""
+import argparse
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from hwdesc import CHECKPOINT_ROOT
+
+DEFAULT_STORE = os.path.join(CHECKPOINT_ROOT, "store")
+ENTRY_FILE = "entry.json"
+LOCK_FILE = ".lock"
+TMP_PREFIX = ".tmp-"
+# Default retention limits for evict
+DEFAULT_LIMITS = {"max_entries": 32, "max_gb": 200.0, "max_age_days": 30.0}
+
+
+def file_sha256(path):
+    """sha256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def workload_key(binary, args, env, hw, fast_forward=False, cwd=None):
+    """Store key of a workload on a hardware description, and what it was computed from.
+
+    `env` is the process environment as a list of KEY=VALUE strings.
+    fast_forward checkpoints hold their thread state in the AtomicSimpleCPU
+    twins, so they get their own entries. Returns (key, info); info is
+    saved in the entry's entry.json.
+    """
+    cwd = cwd or os.getcwd()
+    files = {}
+    for arg in args:
+        path = os.path.join(cwd, arg)
+        if os.path.isfile(path):
+            files[arg] = file_sha256(path)
+    info = {
+        "binary": os.path.abspath(binary),
+        "binary_sha256": file_sha256(binary),
+        "args": list(args),
+        "files": files,
+        "cwd": cwd,
+        "env": sorted(env),
+        "isa": hw["isa"],
+        "mem_size": hw["mem_size"],
+        "cores": [[cluster["name"], cluster["count"]] for cluster in hw["clusters"]],
+        "fast_forward": fast_forward,
+    }
+    content = {key: value for key, value in info.items() if key != "binary"}
+    key = hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()[:24]
+    return key, info
+
+
+@contextlib.contextmanager
+def store_lock(store):
+    """Hold an exclusive lock on a store while entries are added, touched or removed."""
+    os.makedirs(store, exist_ok=True)
+    with open(os.path.join(store, LOCK_FILE), "a") as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def _read_entry(path):
+    try:
+        with open(os.path.join(path, ENTRY_FILE), "r") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_entry(path, entry):
+    tmp = os.path.join(path, ENTRY_FILE + ".tmp")
+    with open(tmp, "w") as file:
+        json.dump(entry, file, indent=4)
+    os.replace(tmp, os.path.join(path, ENTRY_FILE))
+
+
+def directory_bytes(path):
+    """Total size of the files under `path`."""
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def lookup(store, key):
+    """Directory of the entry for `key`, or None; a hit updates its last use."""
+    path = os.path.join(store, key)
+    if not os.path.isdir(path):
+        return None
+    with store_lock(store):
+        entry = _read_entry(path)
+        if entry is None:
+            return None
+        entry["last_used"] = time.time()
+        entry["hits"] = entry.get("hits", 0) + 1
+        _write_entry(path, entry)
+    return path
+
+
+def begin(store, key):
+    """Empty temporary directory for m5.checkpoint, to be passed to commit."""
+    os.makedirs(store, exist_ok=True)
+    tmp = os.path.join(store, f"{TMP_PREFIX}{key}-{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    return tmp
+
+
+def commit(store, key, tmp, info, tick=None):
+    """Move the checkpoint in `tmp` into the store as the entry for `key`.
+
+    If another run committed the same key first, its entry is kept. Returns
+    the entry directory.
+    """
+    now = time.time()
+    _write_entry(tmp, {"key": key, "created": now, "last_used": now, "hits": 0, "tick": tick,
+                       "bytes": directory_bytes(tmp), **info})
+    path = os.path.join(store, key)
+    with store_lock(store):
+        if os.path.isdir(path):
+            shutil.rmtree(tmp)
+        else:
+            os.rename(tmp, path)
+    return path
+
+
+def entries(store):
+    """entry.json of every complete entry in the store, least recently used first."""
+    if not os.path.isdir(store):
+        return []
+    found = []
+    for name in os.listdir(store):
+        path = os.path.join(store, name)
+        if name.startswith(".") or not os.path.isdir(path):
+            continue
+        entry = _read_entry(path)
+        if entry is not None:
+            entry["path"] = path
+            found.append(entry)
+    return sorted(found, key=lambda entry: entry.get("last_used", 0))
+
+
+def evict(store, max_entries=None, max_gb=None, max_age_days=None, keep=()):
+    """Remove entries unused for max_age_days and the least recently used ones beyond the other limits.
+
+    Entries whose key is in `keep` are never removed; limits left as None
+    are not applied. Returns the removed keys.
+    """
+    removed = []
+    with store_lock(store):
+        current = entries(store)
+        now = time.time()
+        total = sum(entry.get("bytes", 0) for entry in current)
+        for entry in current:
+            remaining = len(current) - len(removed)
+            too_old = max_age_days is not None and now - entry.get("last_used", 0) > max_age_days * 86400
+            too_many = max_entries is not None and remaining > max_entries
+            too_big = max_gb is not None and total > max_gb * (1 << 30)
+            if entry["key"] in keep or not (too_old or too_many or too_big):
+                continue
+            shutil.rmtree(entry["path"])
+            total -= entry.get("bytes", 0)
+            removed.append(entry["key"])
+    for key in removed:
+        print(f"Evicted checkpoint {key} from {store}")
+    return removed
+
+
+def remove(store, key):
+    """Remove one entry; returns whether it existed."""
+    path = os.path.join(store, key)
+    with store_lock(store):
+        if not os.path.isdir(path):
+            return False
+        shutil.rmtree(path)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List and prune the gem5 checkpoint store.")
+    parser.add_argument("--store", default=DEFAULT_STORE, help=f"checkpoint store directory (default: {DEFAULT_STORE})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list entries, least recently used first")
+    evict_parser = commands.add_parser("evict", help="apply the retention limits")
+    evict_parser.add_argument("--max-entries", type=int, default=DEFAULT_LIMITS["max_entries"])
+    evict_parser.add_argument("--max-gb", type=float, default=DEFAULT_LIMITS["max_gb"])
+    evict_parser.add_argument("--max-age-days", type=float, default=DEFAULT_LIMITS["max_age_days"])
+    remove_parser = commands.add_parser("remove", help="remove entries by key")
+    remove_parser.add_argument("keys", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for entry in entries(args.store):
+            used = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.get("last_used", 0)))
+            cores = ",".join(f"{name}x{count}" for name, count in entry.get("cores", []))
+            print(f"{entry['key']}  {entry.get('bytes', 0) / (1 << 30):7.2f} GiB  hits {entry.get('hits', 0):4d}  "
+                  f"last used {used}  {os.path.basename(entry.get('binary', ''))} {' '.join(entry.get('args', []))} "
+                  f"[{entry.get('isa')}, {entry.get('mem_size')}, {cores}]")
+    elif args.command == "evict":
+        evict(args.store, args.max_entries, args.max_gb, args.max_age_days)
+    else:
+        missing = [key for key in args.keys if not remove(args.store, key)]
+        if missing:
+            print(f"No such checkpoint(s): {', '.join(missing)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
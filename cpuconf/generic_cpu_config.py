@@ -0,0 +1,628 @@
+"""Generic gem5 SE-mode configuration driven by a hardware description.
+
+Builds the system described by a JSON file in cpuconf/hw/ (see hwdesc.py),
+runs a darknet network on it and handles checkpoints the same way for
+every design point:
+
+    gem5.opt cpuconf/generic_cpu_config.py --hw IntelCorei7_11370H --network darknet
+
+The per-platform scripts in cpuconf/ call run_config() with fixed values.
+"""
+import argparse
+import itertools
+import json
+import os
+import shlex
+import shutil
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import m5
+from m5.objects import *
+
+import ckptstore
+from hwdesc import (CHECKPOINT_ROOT, DARKNET_BINARY, NETWORKS, OUTPUT_ROOT, REPLAY_BINARY, hardware_hash, load_hardware,
+                    order_clusters, total_cores, tuning_env, tuning_for)
+
+DEFAULT_CHECKPOINT_TICK = 3700000000000
+# Cache blocking variable each GEMM method uses, recorded as run.json's tile_size
+METHOD_BLOCKING = {"tiled": "GEMM_BLOCK_SIZE", "packed": "GEMM_PACKED_BLOCKS"}
+FORWARDED_ENV_PREFIXES = ("GEMM_", "OMP_")
+# Where the simulated process sees the run's output directory when runs
+# share store checkpoints, and the GEMM_ENV_FILE it reads from there
+STORE_RUN_DIR = "/gemm_run"
+STORE_ENV_FILE = "gemm.env"
+# Outputs of the sampled-simulation passes, read by sampling.py and process.py
+ROI_INSTS_FILE = "roi_insts.json"
+SAMPLES_FILE = "samples.json"
+# Exit cause of the instruction-count stops that delimit samples
+SAMPLE_STOP = "sample stop"
+# Numbers the stops of run_insts, so a stop left over from an earlier sample is told apart
+sample_stops = itertools.count()
+
+
+# Function to check if the checkpoint directory is empty
+def is_checkpoint_dir_empty(dir_path):
+    return not os.path.isdir(dir_path) or not os.listdir(dir_path)
+
+
+# Function to clear the checkpoint directory
+def clear_checkpoint_dir(dir_path):
+    if os.path.exists(dir_path):
+        shutil.rmtree(dir_path)
+        print(f"Cleared existing checkpoint directory: {dir_path}")
+
+
+def make_cache(spec):
+    """Create a gem5 Cache from a cache entry of a hardware description."""
+    return Cache(
+        size=spec["size"],
+        assoc=spec["assoc"],
+        tag_latency=spec["latency"],
+        data_latency=spec["latency"],
+        response_latency=spec["latency"],
+        mshrs=spec["mshrs"],
+        tgts_per_mshr=spec["tgts_per_mshr"],
+    )
+
+
+def connect_l1(core, bus, port_core=None):
+    """Attach a core's L1 caches to the CPU side of `bus`.
+
+    The caches are fed by `port_core` if given: the fast-forward core that
+    runs first and hands the ports over to `core` at each ROI.
+    """
+    port_core = port_core or core
+    port_core.icache_port = core.icache.cpu_side
+    port_core.dcache_port = core.dcache.cpu_side
+    core.icache.mem_side = bus.cpu_side_ports
+    core.dcache.mem_side = bus.cpu_side_ports
+
+
+def build_system(hw, fast_forward=False):
+    """Build root.system from a normalised hardware description.
+
+    Returns (root, cores, ff_cores). A cluster with a single core is
+    exposed as system.<name> and larger clusters as system.<name>0..N,
+    which is what the stat names in stats.txt follow.
+
+    With fast_forward, every core gets an AtomicSimpleCPU twin under
+    system.fast_forward (ff_cores, in the same order) that owns the ports
+    and runs first; the described cores start switched out. Otherwise
+    ff_cores is empty.
+    """
+    root = Root(full_system=False)
+    system = root.system = System()
+
+    system.clk_domain = SrcClockDomain(clock=hw["clock"], voltage_domain=VoltageDomain())
+    atomic = fast_forward or all(cluster["core"] == "AtomicSimpleCPU" for cluster in hw["clusters"])
+    system.mem_mode = "atomic" if atomic else "timing"
+    if fast_forward:
+        # The ROI markers in gemm.c are work items; exiting on them lets
+        # run_simulation's work_items handler switch cores at each ROI
+        system.exit_on_work_items = True
+        system.fast_forward = SubSystem()
+    system.mem_ranges = [AddrRange(hw["mem_size"])]
+
+    # Define memory bus
+    system.membus = SystemXBar()
+
+    # Shared caches, outermost first: each level hangs off the bus below it
+    lower_bus = system.membus
+    for level in ("l3", "l2"):
+        if level in hw:
+            cache = make_cache(hw[level])
+            bus = L2XBar()
+            setattr(system, f"{level}cache", cache)
+            setattr(system, f"to{level}bus", bus)
+            cache.mem_side = lower_bus.cpu_side_ports
+            bus.mem_side_ports = cache.cpu_side
+            lower_bus = bus
+
+    cores = []
+    ff_cores = []
+    for cluster in hw["clusters"]:
+        cpu_class = getattr(m5.objects, cluster["core"])
+        cluster_cores = [cpu_class(cpu_id=len(cores) + i, switched_out=fast_forward) for i in range(cluster["count"])]
+        name = cluster["name"]
+        setattr(system, name, cluster_cores[0] if len(cluster_cores) == 1 else cluster_cores)
+        # Cores that own the ports and interrupt controllers at start-up;
+        # the fast-forward twins sit one level down, so core_stats.py does
+        # not count them as cores
+        cluster_ff = [AtomicSimpleCPU(cpu_id=core.cpu_id) for core in cluster_cores] if fast_forward else []
+        if fast_forward:
+            setattr(system.fast_forward, name, cluster_ff[0] if len(cluster_ff) == 1 else cluster_ff)
+        port_cores = cluster_ff or cluster_cores
+
+        if "clock" in cluster:
+            clk_domain = SrcClockDomain(clock=cluster["clock"], voltage_domain=VoltageDomain())
+            setattr(system, f"{name}_clk_domain", clk_domain)
+            for core in cluster_cores + cluster_ff:
+                core.clk_domain = clk_domain
+
+        for core in port_cores:
+            # Create interrupt controller for the CPU (X86-specific wiring);
+            # switching cores hands it over with the ports
+            core.createInterruptController()
+            if hw["isa"] == "x86":
+                core.interrupts[0].pio = system.membus.mem_side_ports
+                core.interrupts[0].int_requestor = system.membus.cpu_side_ports
+                core.interrupts[0].int_responder = system.membus.mem_side_ports
+        for core in cluster_cores:
+            core.icache = make_cache(cluster["l1i"])
+            core.dcache = make_cache(cluster["l1d"])
+
+        l2 = cluster.get("l2")
+        if l2 and l2["private"]:
+            # One L2 per core behind its own crossbar
+            for core, port_core in zip(cluster_cores, port_cores):
+                core.l2cache = make_cache(l2)
+                core.tol2bus = L2XBar()
+                connect_l1(core, core.tol2bus, port_core)
+                core.tol2bus.mem_side_ports = core.l2cache.cpu_side
+                core.l2cache.mem_side = lower_bus.cpu_side_ports
+        elif l2:
+            # One L2 shared by the cluster
+            cluster_l2 = make_cache(l2)
+            cluster_bus = L2XBar()
+            setattr(system, f"{name}_l2cache", cluster_l2)
+            setattr(system, f"{name}_tol2bus", cluster_bus)
+            for core, port_core in zip(cluster_cores, port_cores):
+                connect_l1(core, cluster_bus, port_core)
+            cluster_bus.mem_side_ports = cluster_l2.cpu_side
+            cluster_l2.mem_side = lower_bus.cpu_side_ports
+        else:
+            for core, port_core in zip(cluster_cores, port_cores):
+                connect_l1(core, lower_bus, port_core)
+
+        cores.extend(cluster_cores)
+        ff_cores.extend(cluster_ff)
+
+    # Memory controller
+    system.mem_ctrl = MemCtrl()
+    system.mem_ctrl.dram = getattr(m5.objects, hw["dram"])(range=system.mem_ranges[0])
+    system.mem_ctrl.port = system.membus.mem_side_ports
+
+    # Connect the system port to the memory bus
+    system.system_port = system.membus.cpu_side_ports
+
+    return root, cores, ff_cores
+
+
+def workload_env(overrides=None):
+    """Host GEMM_* and OMP_* variables to pass into the simulated process.
+
+    gem5 does not forward the host environment to SE-mode processes, so
+    settings such as GEMM_LOG_DIR set by simulate.sh or sweep.py have to be
+    copied into Process.env explicitly. `overrides` take precedence.
+    """
+    env = {key: value for key, value in os.environ.items() if key.startswith(FORWARDED_ENV_PREFIXES)}
+    env.update(overrides or {})
+    return [f"{key}={value}" for key, value in sorted(env.items())]
+
+
+def store_env(system, outdir, env):
+    """Process environment of a run restorable from the checkpoint store.
+
+    The environment is part of the checkpointed memory, so the process
+    gets the same two variables in every run: GEMM_LOG_DIR and
+    GEMM_ENV_FILE point into STORE_RUN_DIR, which gem5 redirects to this
+    run's `outdir`. The run's own GEMM_* and OMP_* settings (`env`) go into
+    the env file, which gemm.c reads at the first GEMM call.
+    """
+    with open(os.path.join(outdir, STORE_ENV_FILE), "w") as file:
+        file.writelines(f"{line}\n" for line in env if not line.startswith("GEMM_LOG_DIR="))
+    system.redirect_paths = [RedirectPath(app_path=STORE_RUN_DIR, host_paths=[outdir])]
+    return [f"GEMM_ENV_FILE={STORE_RUN_DIR}/{STORE_ENV_FILE}", f"GEMM_LOG_DIR={STORE_RUN_DIR}"]
+
+
+def attach_workload(system, cores, binary_path, args, env):
+    """Run one SE-mode process with environment `env`, shared by every core."""
+    print(f"Binary Path: {binary_path}")
+    print(f"Arguments: {args}")
+    print(f"Environment: {env}")
+
+    system.workload = SEWorkload.init_compatible(binary_path)
+    process = Process(pid=100, cmd=[binary_path] + args, env=env)
+    for core in cores:
+        core.workload = process
+        core.createThreads()
+
+
+def write_json(path, data):
+    with open(path, "w") as file:
+        json.dump(data, file, indent=4)
+
+
+def switch_cores(system, ff_cores, cores, detailed):
+    """Hand the ports to the detailed cores (detailed=True) or back to the AtomicSimpleCPU twins."""
+    pairs = zip(ff_cores, cores) if detailed else zip(cores, ff_cores)
+    m5.switchCpus(system, list(pairs), verbose=False)
+
+
+def run_insts(core, insts):
+    """Simulate `insts` more instructions of `core`'s first thread.
+
+    Returns None when they are done, or the exit event that stopped the
+    simulation first (e.g. the ROI's workend). A stop is not cancelled when
+    its ROI ends first, so stops of earlier calls are skipped.
+    """
+    cause = f"{SAMPLE_STOP} {next(sample_stops)}"
+    core.scheduleInstStop(0, insts, cause)
+    while True:
+        exit_event = m5.simulate()
+        if exit_event.getCause() == cause:
+            return None
+        if not exit_event.getCause().startswith(SAMPLE_STOP):
+            return exit_event
+
+
+def switch_work_items(system, ff_cores, cores):
+    """Work-item handler of a fast-forward run: each ROI runs on the detailed cores."""
+    detailed = [False]
+
+    def handle(exit_event):
+        if (exit_event.getCause() == "workbegin") != detailed[0]:
+            detailed[0] = not detailed[0]
+            switch_cores(system, ff_cores, cores, detailed[0])
+
+    return handle
+
+
+def bbv_work_items(core, outdir, interval):
+    """Work-item handler of a --bbv-interval pass: logs each ROI's instruction range.
+
+    `core` runs the workload's thread and carries the SimPoint probe;
+    roi_insts.json gets its committed instructions at every workbegin and
+    workend, counted like the probe's intervals from the start of the run.
+    """
+    log = {"interval": interval, "rois": []}
+
+    def handle(exit_event):
+        if exit_event.getCause() == "workbegin":
+            log["rois"].append({"call": exit_event.getCode(), "begin": core.totalInsts()})
+        elif log["rois"] and "end" not in log["rois"][-1]:
+            log["rois"][-1]["end"] = core.totalInsts()
+            write_json(os.path.join(outdir, ROI_INSTS_FILE), log)
+
+    return handle
+
+
+def sample_roi(system, ff_cores, cores, roi, warmup, samples):
+    """Simulate the samples of one simpoints.json ROI, starting at its workbegin.
+
+    Between samples the ROI runs on the AtomicSimpleCPU twins. Each sample
+    switches to the detailed cores up to `warmup` instructions early, or
+    stays on them when it follows the previous one, and is measured between
+    m5.stats.reset and m5.stats.dump; completed samples are appended to
+    `samples`. Returns None after the last sample, back on the twins, or the
+    exit event that ended the ROI first.
+    """
+    position = 0
+    detailed = False
+    pending = None
+    for sample in roi["samples"]:
+        start = max(sample["offset"] - warmup, position)
+        if start > position:
+            if detailed:
+                switch_cores(system, ff_cores, cores, False)
+                detailed = False
+            pending = run_insts(ff_cores[0], start - position)
+            if pending:
+                break
+        if not detailed:
+            switch_cores(system, ff_cores, cores, True)
+            detailed = True
+        warm = sample["offset"] - start
+        pending = run_insts(cores[0], warm) if warm > 0 else None
+        if pending:
+            break
+        m5.stats.reset()
+        pending = run_insts(cores[0], sample["length"])
+        if pending:
+            break
+        m5.stats.dump()
+        samples.append({"call": roi["call"], "cluster": sample["cluster"], "offset": sample["offset"],
+                        "insts": sample["length"]})
+        position = sample["offset"] + sample["length"]
+    if detailed:
+        switch_cores(system, ff_cores, cores, False)
+    return pending
+
+
+def sampled_work_items(system, ff_cores, cores, simpoints, outdir):
+    """Work-item handler of a --simpoints pass: samples every ROI listed in `simpoints`.
+
+    samples.json is rewritten after each ROI with the completed samples and
+    the clusters of their ROIs, for sampling.reconstruct_samples.
+    """
+    rois = {roi["call"]: roi for roi in simpoints["rois"]}
+    log = {"interval": simpoints["interval"], "warmup": simpoints["warmup"], "rois": [], "samples": []}
+
+    def handle(exit_event):
+        if exit_event.getCause() != "workbegin":
+            return None
+        roi = rois.get(exit_event.getCode())
+        if roi is None:
+            print(f"Warning: GEMM call {exit_event.getCode()} has no simpoints; it is not sampled.")
+            return None
+        done = len(log["samples"])
+        pending = sample_roi(system, ff_cores, cores, roi, simpoints["warmup"], log["samples"])
+        log["rois"].append({key: roi[key] for key in ("call", "insts", "clusters")})
+        write_json(os.path.join(outdir, SAMPLES_FILE), log)
+        print(f"Sampled {len(log['samples']) - done} of {len(roi['samples'])} intervals of GEMM call {roi['call']}")
+        return pending
+
+    return handle
+
+
+def run_simulation(checkpoint_dir, resume_from_checkpoint=False, fast_forward_tick=None,
+                   checkpoint_tick=DEFAULT_CHECKPOINT_TICK, store=None, work_items=None):
+    """Instantiate the system and simulate until the workload exits.
+
+    With a `store` dict (dir, key, info and the evict limits) the run
+    restores the store entry for its key if there is one. Otherwise it
+    saves one when the workload reaches its first GEMM call (the first
+    "checkpoint" exit), and checkpoint_dir is not used.
+
+    `work_items` handles the "workbegin" and "workend" exits of a
+    fast-forward build_system (see switch_work_items, bbv_work_items and
+    sampled_work_items). It may simulate on its own and returns the exit
+    event it stopped at, if that still has to be handled here.
+    """
+    entry = ckptstore.lookup(store["dir"], store["key"]) if store else None
+    if store:
+        checkpoint_tick = None
+    # Handle checkpoints
+    if entry:
+        print(f"Restoring first-GEMM checkpoint {store['key']} from {entry}")
+        m5.instantiate(entry)
+    elif resume_from_checkpoint and not is_checkpoint_dir_empty(checkpoint_dir):
+        print(f"Resuming simulation from checkpoint: {checkpoint_dir}")
+        m5.instantiate(checkpoint_dir)
+    else:
+        if not resume_from_checkpoint and not store:
+            clear_checkpoint_dir(checkpoint_dir)  # Clear previous checkpoints if any
+            print("Starting fresh simulation...")
+        m5.instantiate()
+
+        # Fast-forward logic
+        if fast_forward_tick is not None:
+            print(f"Fast-forwarding simulation to tick {fast_forward_tick}...")
+            exit_event = m5.simulate(fast_forward_tick)
+            print(f"Fast-forward completed at tick {m5.curTick()} with reason: {exit_event.getCause()}")
+        else:
+            print("No fast-forward tick specified. Continuing without fast-forward.")
+
+    # Detailed simulation
+    print("Starting detailed simulation...")
+    checkpoint_created = False  # Track if the checkpoint is created
+    pending = None
+
+    while True:
+        exit_event = pending or m5.simulate()
+        pending = None
+        print(f"Exited at tick {m5.curTick()} with reason: {exit_event.getCause()}")
+
+        # Create a checkpoint at the specified tick
+        if not checkpoint_created and checkpoint_tick is not None and m5.curTick() >= checkpoint_tick:
+            print(f"Creating checkpoint at tick {m5.curTick()}...")
+            m5.checkpoint(checkpoint_dir)
+            print(f"Checkpoint created at: {checkpoint_dir}")
+            checkpoint_created = True  # Ensure the checkpoint is created only once
+
+        if work_items and exit_event.getCause() in ("workbegin", "workend"):
+            pending = work_items(exit_event)
+            continue
+        if exit_event.getCause().startswith(SAMPLE_STOP):
+            # Left over from a sample whose ROI ended before it
+            continue
+        if exit_event.getCause() == "checkpoint" and store and not entry:
+            tmp = ckptstore.begin(store["dir"], store["key"])
+            m5.checkpoint(tmp)
+            entry = ckptstore.commit(store["dir"], store["key"], tmp, store["info"], m5.curTick())
+            print(f"Saved first-GEMM checkpoint {store['key']} to {entry}")
+            ckptstore.evict(store["dir"], keep=[store["key"]], **store["limits"])
+            continue
+        if exit_event.getCause() == "checkpoint":
+            print(f"Checkpoint created at tick {m5.curTick()}. Continuing simulation...")
+            continue
+        else:
+            print("Simulation completed.")
+            break
+
+    print(f"Simulation ended at tick {m5.curTick()} with reason: {exit_event.getCause()}")
+
+
+def run_config(hw_path, network="darknet", binary_path=DARKNET_BINARY, args=None, outdir=None,
+               checkpoint_dir=None, resume_from_checkpoint=False, fast_forward_tick=None, run_tags=None,
+               threads=None, placement=None, schedule=None, checkpoint_store=None, store_limits=None,
+               fast_forward=False, replay=None, replay_calls=None, bbv_interval=None, simpoints=None):
+    """Build the system in `hw_path`, run `network` on it and write run.json.
+
+    outdir defaults to OUTPUT_ROOT/<hw name>/<network>. run.json records the
+    config, network, hardware hash and DRAM model (plus any `run_tags`) for
+    process.py --batch and the shape memo.
+
+    threads sets OMP_NUM_THREADS of the workload, placement is the list of
+    clusters its threads fill first (see hwdesc.order_clusters) and schedule
+    the OpenMP loop schedule, e.g. "dynamic,4" (OMP_SCHEDULE).
+
+    checkpoint_store is a ckptstore directory: the run restores the
+    checkpoint its workload saved at the first GEMM call, or saves it, and
+    store_limits are the ckptstore.evict limits applied after saving.
+
+    fast_forward runs everything outside the GEMM ROIs on AtomicSimpleCPU
+    cores and switches to the described cores for each ROI, so only the
+    profiled kernels are simulated in detail.
+
+    replay is a gemm_calls.bin or gemm_calls.txt of an earlier run of
+    `network`: instead of darknet, gemm_replay (REPLAY_BINARY unless
+    binary_path is given) makes the same GEMM calls, or only those in
+    replay_calls ("3,7,12" or "unique"), and every call is profiled unless
+    GEMM_PROFILE says otherwise.
+
+    bbv_interval and simpoints are the two passes of sampled simulation
+    (see sampling.py). bbv_interval runs the profiled ROIs on
+    AtomicSimpleCPU and writes the basic-block vector of every interval of
+    that many instructions to simpoint.bb.gz, plus roi_insts.json.
+    simpoints is the simpoints.json that sampling.py picked from that
+    output: only its intervals are simulated on the described cores, and
+    samples.json lists them for process.py. Both passes fast-forward, run a
+    single thread and profile every GEMM call unless GEMM_PROFILE says
+    otherwise.
+    """
+    hw = load_hardware(hw_path)
+    if threads is not None and not 1 <= threads <= total_cores(hw):
+        raise ValueError(f"{hw['name']} has {total_cores(hw)} cores, cannot run {threads} threads")
+    sampled = bbv_interval is not None or simpoints is not None
+    if sampled and threads not in (None, 1):
+        raise ValueError("sampled simulation runs a single thread")
+    fast_forward = fast_forward or sampled
+    if replay:
+        binary_path = REPLAY_BINARY if binary_path == DARKNET_BINARY else binary_path
+        selection = ["-u"] if replay_calls == "unique" else ["-c", replay_calls] if replay_calls else []
+        args = selection + [os.path.abspath(replay)]
+    args = NETWORKS[network] if args is None else args
+    outdir = outdir or os.path.join(OUTPUT_ROOT, hw["name"], network)
+    checkpoint_dir = checkpoint_dir or os.path.join(CHECKPOINT_ROOT, hw["name"], network)
+
+    # Set output directory
+    os.makedirs(outdir, exist_ok=True)
+    m5.core.setOutputDir(outdir)
+    run_info = {"config": hw["name"], "network": network, "hw_hash": hardware_hash(hw), "dram": hw["dram"]}
+    run_info.update(run_tags or {})
+    if placement:
+        run_info["placement"] = ",".join(placement)
+    if fast_forward:
+        run_info["fast_forward"] = "atomic"
+    if replay:
+        run_info["workload"] = "replay"
+        run_info["trace"] = os.path.abspath(replay)
+    if simpoints is not None:
+        run_info["sampling"] = "simpoints"
+        run_info["simpoints"] = os.path.abspath(simpoints)
+    elif bbv_interval is not None:
+        run_info["sampling"] = "bbv"
+        run_info["bbv_interval"] = bbv_interval
+
+    # The binary picks its GEMM kernel at run time from GEMM_METHOD, and
+    # its cache blocking from the tuning table unless the caller set it
+    env_overrides = {}
+    if run_info.get("gemm_method"):
+        env_overrides["GEMM_METHOD"] = run_info["gemm_method"]
+    if (replay or sampled) and "GEMM_PROFILE" not in os.environ:
+        env_overrides["GEMM_PROFILE"] = "all"
+    if sampled:
+        # Both passes run the same single-thread instruction stream, with
+        # the stats left to the config (see gemm.c)
+        env_overrides["GEMM_SAMPLED"] = "1"
+        threads = 1
+    if threads is not None:
+        env_overrides["OMP_NUM_THREADS"] = str(threads)
+    if schedule:
+        env_overrides["OMP_SCHEDULE"] = schedule
+    # Requested thread count and schedule; the threads that actually ran are
+    # counted from the per-core stats by process.py
+    for key, variable in (("threads", "OMP_NUM_THREADS"), ("schedule", "OMP_SCHEDULE")):
+        value = env_overrides.get(variable, os.environ.get(variable))
+        if value:
+            run_info[key] = int(value) if key == "threads" else value
+    tuning = tuning_for(hw)
+    if tuning:
+        for key, value in tuning_env(tuning).items():
+            env_overrides.setdefault(key, os.environ.get(key, value))
+        blocking = METHOD_BLOCKING.get(run_info.get("gemm_method"))
+        if blocking and "tile_size" not in run_info:
+            run_info["tile_size"] = env_overrides[blocking]
+        print(f"GEMM blocking: {env_overrides['GEMM_BLOCK_SIZE']} (tiled), {env_overrides['GEMM_PACKED_BLOCKS']} (packed)")
+
+    built_hw = order_clusters(hw, placement) if placement else hw
+    root, cores, ff_cores = build_system(built_hw, fast_forward)
+    env = workload_env(env_overrides)
+    store = None
+    if checkpoint_store:
+        env = store_env(root.system, outdir, env)
+        key, info = ckptstore.workload_key(binary_path, args, env, built_hw, fast_forward)
+        limits = dict(ckptstore.DEFAULT_LIMITS, **(store_limits or {}))
+        store = {"dir": checkpoint_store, "key": key, "info": info, "limits": limits}
+        run_info["checkpoint"] = key
+    with open(os.path.join(outdir, "run.json"), "w") as file:
+        json.dump(run_info, file, indent=4)
+
+    attach_workload(root.system, cores + ff_cores, binary_path, args, env)
+    work_items = None
+    if simpoints is not None:
+        with open(simpoints, "r") as file:
+            work_items = sampled_work_items(root.system, ff_cores, cores, json.load(file), outdir)
+    elif bbv_interval is not None:
+        # The single thread starts on the first core
+        ff_cores[0].addSimPointProbe(bbv_interval)
+        work_items = bbv_work_items(ff_cores[0], outdir, bbv_interval)
+    elif fast_forward:
+        work_items = switch_work_items(root.system, ff_cores, cores)
+    run_simulation(checkpoint_dir, resume_from_checkpoint, fast_forward_tick, store=store, work_items=work_items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a darknet network on a described gem5 system.")
+    parser.add_argument("--hw", required=True, help="hardware description (path or name in cpuconf/hw/)")
+    parser.add_argument("--network", default="darknet", choices=sorted(NETWORKS), help="darknet network to run")
+    parser.add_argument("--binary", default=DARKNET_BINARY, help="workload binary")
+    parser.add_argument("--workload-args", help="arguments of --binary as one string (default: the network's darknet command)")
+    parser.add_argument("--outdir", help="stats output directory (default: OUTPUT_ROOT/<hw name>/<network>)")
+    parser.add_argument("--checkpoint-dir", help="checkpoint directory")
+    parser.add_argument("--resume", action="store_true", help="resume from the checkpoint directory")
+    parser.add_argument("--fast-forward-tick", type=int, help="tick to fast-forward to before detailed simulation")
+    parser.add_argument("--fast-forward", action="store_true",
+                        help="run outside the GEMM ROIs on AtomicSimpleCPU and switch to the described cores for each ROI")
+    parser.add_argument("--gemm-method", help="GEMM kernel to run (sets GEMM_METHOD), recorded in run.json")
+    parser.add_argument("--threading", help="threading mode the binary was built with, recorded in run.json")
+    parser.add_argument("--tile-size", type=int, help="GEMM tile size of the run, recorded in run.json")
+    parser.add_argument("--threads", type=int, help="OpenMP threads of the workload (sets OMP_NUM_THREADS)")
+    parser.add_argument("--placement", help="comma-separated clusters the threads fill first, e.g. little_cores,big_cores")
+    parser.add_argument("--schedule", help="OpenMP loop schedule kind[,chunk], e.g. dynamic,4 (sets OMP_SCHEDULE)")
+    parser.add_argument("--checkpoint-store", nargs="?", const=ckptstore.DEFAULT_STORE,
+                        help="restore or save the checkpoint at the first GEMM call in this content-addressed store "
+                             f"(default: {ckptstore.DEFAULT_STORE})")
+    parser.add_argument("--store-max-entries", type=int, help="entries kept in the checkpoint store")
+    parser.add_argument("--store-max-gb", type=float, help="checkpoint store size limit in GiB")
+    parser.add_argument("--store-max-age-days", type=float, help="days an unused store checkpoint is kept")
+    parser.add_argument("--replay", help="replay the GEMM calls of this gemm_calls.bin/.txt with gemm_replay instead of "
+                                          "running the network")
+    parser.add_argument("--replay-calls", help="call numbers to replay, e.g. 3,7,12, or 'unique' for one call per shape")
+    parser.add_argument("--bbv-interval", type=int,
+                        help="sampling profile pass: basic-block vectors of the ROIs per this many instructions")
+    parser.add_argument("--simpoints", help="sampling detailed pass: simulate only the intervals in this simpoints.json")
+    args = parser.parse_args()
+
+    limits = (("max_entries", args.store_max_entries), ("max_gb", args.store_max_gb),
+              ("max_age_days", args.store_max_age_days))
+    tags = (("gemm_method", args.gemm_method), ("threading", args.threading), ("tile_size", args.tile_size))
+    run_tags = {key: value for key, value in tags if value is not None}
+    run_config(
+        args.hw,
+        network=args.network,
+        binary_path=args.binary,
+        args=shlex.split(args.workload_args) if args.workload_args is not None else None,
+        outdir=args.outdir,
+        checkpoint_dir=args.checkpoint_dir,
+        resume_from_checkpoint=args.resume,
+        fast_forward_tick=args.fast_forward_tick,
+        run_tags=run_tags,
+        threads=args.threads,
+        placement=args.placement.split(",") if args.placement else None,
+        schedule=args.schedule,
+        checkpoint_store=args.checkpoint_store,
+        store_limits={key: value for key, value in limits if value is not None},
+        fast_forward=args.fast_forward,
+        replay=args.replay,
+        replay_calls=args.replay_calls,
+        bbv_interval=args.bbv_interval,
+        simpoints=args.simpoints,
+    )
+
+
+if __name__ == "__m5_main__":
+    main()
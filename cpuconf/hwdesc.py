@@ -0,0 +1,395 @@
+"""Declarative hardware descriptions for the GEMM-ArchProfiler gem5 configs.
+
+A hardware description is a JSON file in cpuconf/hw/ describing the clock,
+memory, CPU clusters and cache hierarchy of one design point. This module
+only uses the standard library, so descriptions can be loaded and validated
+without gem5 installed:
+
+    python3 cpuconf/hwdesc.py cpuconf/hw/*.json
+
+generic_cpu_config.py turns a validated description into a gem5 system.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+
+HW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hw")
+# Cache blocking per hardware description, written by autotune.py
+TUNING_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tuning.json")
+OUTPUT_ROOT = "/opt/GEMM-ArchProfiler/output"
+CHECKPOINT_ROOT = "/opt/GEMM-ArchProfiler/output/checkpoints"
+DARKNET_BINARY = "/opt/GEMM-ArchProfiler/darknet/darknet"
+# GEMM call replay without the network, built by `make replay`
+REPLAY_BINARY = "/opt/GEMM-ArchProfiler/darknet/gemm_replay"
+
+# darknet command line for each supported network
+NETWORKS = {
+    "darknet": ["classifier", "predict", "cfg/imagenet1k.data", "cfg/darknet53.cfg", "darknet53.weights", "data/dog.jpg"],
+    "densenet": ["classifier", "predict", "cfg/imagenet1k.data", "cfg/densenet201.cfg", "densenet201.weights", "data/dog.jpg"],
+    "resnet": ["classifier", "predict", "cfg/imagenet1k.data", "cfg/resnet152.cfg", "resnet152.weights", "data/dog.jpg"],
+}
+
+CORE_TYPES = ("O3CPU", "MinorCPU", "TimingSimpleCPU", "AtomicSimpleCPU")
+ISAS = ("x86", "arm", "riscv")
+
+# DRAM interfaces available in gem5's src/mem/DRAMInterface.py with the
+# peak bandwidth of one channel in bytes/s (transfer rate x bus width)
+DRAM_PEAK_BANDWIDTH = {
+    "DDR3_1600_8x8": 1600e6 * 8,
+    "DDR3_2133_8x8": 2133e6 * 8,
+    "DDR4_2400_16x4": 2400e6 * 8,
+    "DDR4_2400_8x8": 2400e6 * 8,
+    "DDR4_2400_4x16": 2400e6 * 8,
+    "DDR5_4400_4x8": 4400e6 * 4,
+    "DDR5_6400_4x8": 6400e6 * 4,
+    "DDR5_8400_4x8": 8400e6 * 4,
+    "LPDDR2_S4_1066_1x32": 1066e6 * 4,
+    "LPDDR3_1600_1x32": 1600e6 * 4,
+    "LPDDR5_5500_1x16_BG_BL32": 5500e6 * 2,
+    "LPDDR5_6400_1x16_BG_BL32": 6400e6 * 2,
+    "WideIO_200_1x128": 200e6 * 16,
+    "GDDR5_4000_2x32": 4000e6 * 8,
+    "HBM_1000_4H_1x128": 1000e6 * 16,
+}
+DRAM_MODELS = tuple(DRAM_PEAK_BANDWIDTH)
+
+# Single-precision FP throughput defaults for a cluster: SIMD width in bits,
+# number of FP/SIMD pipes and whether they issue fused multiply-adds
+FP_DEFAULTS = {"simd_bits": 128, "fp_pipes": 1, "fma": False}
+
+CACHE_LINE = 64  # bytes, gem5's default cache_line_size
+
+# MSHR defaults per cache level, as used by the original baseline config
+CACHE_DEFAULTS = {
+    "l1i": {"mshrs": 16, "tgts_per_mshr": 8},
+    "l1d": {"mshrs": 16, "tgts_per_mshr": 8},
+    "l2": {"mshrs": 32, "tgts_per_mshr": 16},
+    "l3": {"mshrs": 64, "tgts_per_mshr": 32},
+}
+
+SIZE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]i?B|B)\s*$", re.IGNORECASE)
+CLOCK_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([KMG]?Hz)\s*$", re.IGNORECASE)
+NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+SIZE_UNITS = {"b": 1, "kb": 1 << 10, "mb": 1 << 20, "gb": 1 << 30, "tb": 1 << 40}
+CLOCK_UNITS = {"hz": 1, "khz": 1e3, "mhz": 1e6, "ghz": 1e9}
+
+
+def parse_size(text):
+    """Convert a gem5 memory size such as "32KiB" or "512MB" to bytes.
+
+    As in gem5, memory sizes are binary whether or not the "i" is given.
+    """
+    match = SIZE_RE.match(str(text))
+    if not match:
+        raise ValueError(f"invalid size {text!r}")
+    value, unit = match.groups()
+    return int(float(value) * SIZE_UNITS[unit.lower().replace("i", "")])
+
+
+def parse_clock(text):
+    """Convert a gem5 clock such as "3.3GHz" to Hz."""
+    match = CLOCK_RE.match(str(text))
+    if not match:
+        raise ValueError(f"invalid clock {text!r}")
+    value, unit = match.groups()
+    return float(value) * CLOCK_UNITS[unit.lower()]
+
+
+def _check_positive_int(errors, where, value):
+    if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+        errors.append(f"{where}: expected a positive integer, got {value!r}")
+        return False
+    return True
+
+
+def _check_cache(errors, where, spec):
+    if not isinstance(spec, dict):
+        errors.append(f"{where}: expected an object, got {spec!r}")
+        return
+    for key in ("size", "assoc", "latency"):
+        if key not in spec:
+            errors.append(f"{where}: missing '{key}'")
+    try:
+        size = parse_size(spec.get("size", ""))
+    except ValueError as e:
+        errors.append(f"{where}.size: {e}")
+        size = None
+    assoc_ok = _check_positive_int(errors, f"{where}.assoc", spec.get("assoc"))
+    _check_positive_int(errors, f"{where}.latency", spec.get("latency"))
+    for key in ("mshrs", "tgts_per_mshr"):
+        if key in spec:
+            _check_positive_int(errors, f"{where}.{key}", spec[key])
+
+    # gem5's indexing policies require a power-of-two number of sets
+    if size and assoc_ok:
+        lines = size // CACHE_LINE
+        sets = lines // spec["assoc"]
+        if size % CACHE_LINE or lines % spec["assoc"] or sets & (sets - 1):
+            errors.append(
+                f"{where}: {spec['size']} with assoc {spec['assoc']} gives {lines / spec['assoc']:g} sets; "
+                f"gem5 needs a power-of-two number of {CACHE_LINE}-byte line sets"
+            )
+
+
+def validate_hardware(hw):
+    """Return a list of problems with a hardware description (empty if valid)."""
+    errors = []
+    if not isinstance(hw, dict):
+        return [f"expected a JSON object, got {type(hw).__name__}"]
+
+    if not isinstance(hw.get("name"), str) or not hw["name"]:
+        errors.append("name: expected a non-empty string")
+    if hw.get("isa", "x86") not in ISAS:
+        errors.append(f"isa: expected one of {', '.join(ISAS)}, got {hw.get('isa')!r}")
+    try:
+        parse_clock(hw.get("clock", ""))
+    except ValueError as e:
+        errors.append(f"clock: {e}")
+    try:
+        parse_size(hw.get("mem_size", ""))
+    except ValueError as e:
+        errors.append(f"mem_size: {e}")
+    if hw.get("dram") not in DRAM_MODELS:
+        errors.append(f"dram: unknown gem5 DRAM model {hw.get('dram')!r}")
+
+    clusters = hw.get("clusters")
+    if not isinstance(clusters, list) or not clusters:
+        errors.append("clusters: expected a non-empty list")
+        clusters = []
+    names = set()
+    for i, cluster in enumerate(clusters):
+        where = f"clusters[{i}]"
+        if not isinstance(cluster, dict):
+            errors.append(f"{where}: expected an object")
+            continue
+        name = cluster.get("name")
+        if not isinstance(name, str) or not NAME_RE.match(name):
+            errors.append(f"{where}.name: expected an identifier, got {name!r}")
+        elif name in names:
+            errors.append(f"{where}.name: duplicate cluster name {name!r}")
+        names.add(name)
+        if cluster.get("core") not in CORE_TYPES:
+            errors.append(f"{where}.core: expected one of {', '.join(CORE_TYPES)}, got {cluster.get('core')!r}")
+        _check_positive_int(errors, f"{where}.count", cluster.get("count"))
+        for key in ("simd_bits", "fp_pipes"):
+            if key in cluster:
+                _check_positive_int(errors, f"{where}.{key}", cluster[key])
+        if "simd_bits" in cluster and isinstance(cluster["simd_bits"], int) and cluster["simd_bits"] % 32:
+            errors.append(f"{where}.simd_bits: must be a multiple of 32, got {cluster['simd_bits']}")
+        if "fma" in cluster and not isinstance(cluster["fma"], bool):
+            errors.append(f"{where}.fma: expected true or false, got {cluster['fma']!r}")
+        if "clock" in cluster:
+            try:
+                parse_clock(cluster["clock"])
+            except ValueError as e:
+                errors.append(f"{where}.clock: {e}")
+        for level in ("l1i", "l1d"):
+            if level not in cluster:
+                errors.append(f"{where}: missing '{level}'")
+            else:
+                _check_cache(errors, f"{where}.{level}", cluster[level])
+        if "l2" in cluster:
+            _check_cache(errors, f"{where}.l2", cluster["l2"])
+            if "l2" in hw:
+                errors.append(f"{where}.l2: cluster L2 cannot be combined with a system-level l2")
+
+    for level in ("l2", "l3"):
+        if level in hw:
+            _check_cache(errors, level, hw[level])
+
+    return errors
+
+
+def normalize_hardware(hw):
+    """Fill in optional fields of a validated description with their defaults."""
+    hw = json.loads(json.dumps(hw))
+    hw.setdefault("isa", "x86")
+    for cluster in hw["clusters"]:
+        for key, value in FP_DEFAULTS.items():
+            cluster.setdefault(key, value)
+        for level in ("l1i", "l1d", "l2"):
+            if level in cluster:
+                for key, value in CACHE_DEFAULTS[level].items():
+                    cluster[level].setdefault(key, value)
+        if "l2" in cluster:
+            cluster["l2"].setdefault("private", False)
+    for level in ("l2", "l3"):
+        if level in hw:
+            for key, value in CACHE_DEFAULTS[level].items():
+                hw[level].setdefault(key, value)
+    return hw
+
+
+def resolve_hardware_path(path):
+    """Accept a path or a bare name such as "IntelCorei7_11370H" found in cpuconf/hw/."""
+    if os.path.exists(path):
+        return path
+    candidate = os.path.join(HW_DIR, path if path.endswith(".json") else path + ".json")
+    if os.path.exists(candidate):
+        return candidate
+    raise FileNotFoundError(f"hardware description not found: {path}")
+
+
+def load_hardware(path):
+    """Load, validate and normalise a hardware description.
+
+    Raises ValueError listing every problem if the description is invalid.
+    """
+    path = resolve_hardware_path(path)
+    with open(path, "r") as file:
+        hw = json.load(file)
+    errors = validate_hardware(hw)
+    if errors:
+        raise ValueError(f"invalid hardware description {path}:\n  " + "\n  ".join(errors))
+    return normalize_hardware(hw)
+
+
+def hardware_hash(hw):
+    """Short content hash of a normalised description.
+
+    The name and description are left out, so renaming a file does not
+    invalidate results memoised for the same hardware.
+    """
+    content = {key: value for key, value in hw.items() if key not in ("name", "description")}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def total_cores(hw):
+    """Number of cores over all clusters."""
+    return sum(cluster["count"] for cluster in hw["clusters"])
+
+
+def order_clusters(hw, placement):
+    """Copy of `hw` with its clusters in `placement` order.
+
+    `placement` is a list of cluster names, e.g. ["little_cores",
+    "big_cores"]; clusters it leaves out follow in their original order.
+    gem5 numbers cores in cluster order, and in SE mode each thread the
+    workload clones runs on the idle core with the lowest number, so this
+    decides which cores a multi-threaded run fills first.
+    """
+    names = [cluster["name"] for cluster in hw["clusters"]]
+    unknown = [name for name in placement if name not in names]
+    if unknown:
+        raise ValueError(f"unknown cluster(s) {', '.join(unknown)} in placement; {hw['name']} has {', '.join(names)}")
+    order = list(dict.fromkeys(placement)) + [name for name in names if name not in placement]
+    hw = json.loads(json.dumps(hw))
+    hw["clusters"].sort(key=lambda cluster: order.index(cluster["name"]))
+    return hw
+
+
+def peak_flops(hw, threads=None):
+    """Peak single-precision FLOP/s of the first `threads` cores (default: all).
+
+    Each core contributes clock x (simd_bits / 32) lanes x fp_pipes, doubled
+    for FMA. Cores are taken in cluster order, as gem5 numbers them.
+    """
+    remaining = total_cores(hw) if threads is None else threads
+    total = 0.0
+    for cluster in hw["clusters"]:
+        count = min(cluster["count"], remaining)
+        per_cycle = cluster["simd_bits"] // 32 * cluster["fp_pipes"] * (2 if cluster["fma"] else 1)
+        total += count * parse_clock(cluster.get("clock", hw["clock"])) * per_cycle
+        remaining -= count
+        if remaining <= 0:
+            break
+    return total
+
+
+def peak_bandwidth(hw):
+    """Peak DRAM bandwidth in bytes/s of the description's memory controller."""
+    return DRAM_PEAK_BANDWIDTH[hw["dram"]]
+
+
+def data_caches(hw, cluster=0):
+    """Data caches seen by a core of `cluster`, innermost first.
+
+    Returns [(level, size in bytes, assoc)], e.g. [("l1d", 49152, 12),
+    ("l2", 1310720, 20), ("l3", 12582912, 24)].
+    """
+    spec = hw["clusters"][cluster]
+    caches = [("l1d", spec["l1d"])]
+    if "l2" in spec:
+        caches.append(("l2", spec["l2"]))
+    for level in ("l2", "l3"):
+        if level in hw:
+            caches.append((level, hw[level]))
+    return [(level, parse_size(cache["size"]), cache["assoc"]) for level, cache in caches]
+
+
+def load_tuning(path=TUNING_FILE):
+    """The tuning table as {config name: entry}; a missing file is an empty table."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def save_tuning(table, path=TUNING_FILE):
+    """Write the tuning table atomically, sorted by config name."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(table, file, indent=4, sort_keys=True)
+        file.write("\n")
+    os.replace(tmp_path, path)
+
+
+def tuning_for(hw, path=TUNING_FILE):
+    """The tuning table entry of `hw`, or None.
+
+    An entry whose hw_hash differs from the description was tuned for other
+    hardware and is ignored.
+    """
+    entry = load_tuning(path).get(hw["name"])
+    if entry and entry.get("hw_hash") != hardware_hash(hw):
+        print(f"Ignoring stale tuning for {hw['name']} in {path}; rerun autotune.py")
+        return None
+    return entry
+
+
+def tuning_env(entry):
+    """GEMM_* variables that pass a tuning table entry to gemm.c."""
+    return {
+        "GEMM_BLOCK_SIZE": str(entry["block_size"]),
+        "GEMM_PACKED_BLOCKS": f"{entry['mc']},{entry['kc']},{entry['nc']}",
+    }
+
+
+def describe(hw):
+    """One-line summary of a hardware description."""
+    cores = " + ".join(f"{c['count']}x {c['core']} ({c['name']})" for c in hw["clusters"])
+    caches = [f"L1D {hw['clusters'][0]['l1d']['size']}"]
+    for cluster in hw["clusters"]:
+        if "l2" in cluster:
+            kind = "private" if cluster["l2"]["private"] else "shared"
+            caches.append(f"L2 {cluster['l2']['size']} {kind} ({cluster['name']})")
+    for level in ("l2", "l3"):
+        if level in hw:
+            caches.append(f"{level.upper()} {hw[level]['size']} shared")
+    return f"{hw['name']}: {cores} @ {hw['clock']}, {', '.join(caches)}, {hw['mem_size']} {hw['dram']}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate gem5 hardware descriptions without gem5.")
+    parser.add_argument("descriptions", nargs="*", help="JSON files or names in cpuconf/hw/ (default: all)")
+    args = parser.parse_args()
+
+    paths = args.descriptions or sorted(
+        os.path.join(HW_DIR, name) for name in os.listdir(HW_DIR) if name.endswith(".json")
+    )
+    failed = 0
+    for path in paths:
+        try:
+            print(describe(load_hardware(path)))
+        except (OSError, ValueError) as e:
+            failed += 1
+            print(e)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Cache, clock and DRAM parameters of a run from gem5's config.json/config.ini.
+
+gem5 writes the full configuration of the simulated system to config.json
+and config.ini in its --outdir, next to stats.txt. run_config_columns
+indexes it once per run into the configuration columns of gemm_metrics.csv:
+
+    L1 Cache [kB]       L1 data cache of the first core (cpu_id 0)
+    L2 Cache [kB]       the L2 that core uses: private, per cluster or shared
+    L3 Cache [MB]       the shared L3
+    CPU Clock [MHz]     clock domain of the first core
+    Memory Clock [MHz]  DRAM interface clock, 1 / tCK
+    DRAM                DRAM model of the hardware description, e.g. DDR4_2400_8x8
+
+gem5 records every DRAM model as its C++ class, DRAMInterface, so the DRAM
+column comes from the "dram" that generic_cpu_config.py writes to run.json
+instead. Values gem5 did not configure (no L3, or no config file at all)
+are NaN, or empty for DRAM.
+"""
+import configparser
+import json
+import math
+import os
+import re
+
+CONFIG_FILES = ("config.json", "config.ini")
+RUN_INFO_FILE = "run.json"
+CONFIG_COLUMNS = (
+    "L1 Cache [kB]", "L2 Cache [kB]", "L3 Cache [MB]", "CPU Clock [MHz]", "Memory Clock [MHz]", "DRAM"
+)
+TICKS_PER_US = 1e6  # gem5 ticks are picoseconds
+SIZE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]i?B|B)?\s*$", re.IGNORECASE)
+SIZE_UNITS = {"": 1, "b": 1, "kb": 1 << 10, "mb": 1 << 20, "gb": 1 << 30, "tb": 1 << 40}
+
+
+def _walk_json(node, objects):
+    """Collect the SimObjects of a config.json tree as {path: {param: value}}."""
+    if isinstance(node, list):
+        for child in node:
+            _walk_json(child, objects)
+    elif isinstance(node, dict):
+        if "type" in node and "path" in node:
+            objects[node["path"]] = {key: value for key, value in node.items() if not isinstance(value, (dict, list))
+                                     or (isinstance(value, list) and not any(isinstance(v, dict) for v in value))}
+        for value in node.values():
+            if isinstance(value, (dict, list)):
+                _walk_json(value, objects)
+
+
+def load_gem5_config(run_dir):
+    """SimObjects of the run as {path: {param: value}}, or {} without a config file.
+
+    config.json is preferred; config.ini values are strings.
+    """
+    json_file, ini_file = (os.path.join(run_dir, name) for name in CONFIG_FILES)
+    objects = {}
+    try:
+        if os.path.exists(json_file):
+            with open(json_file, "r") as file:
+                _walk_json(json.load(file), objects)
+        elif os.path.exists(ini_file):
+            parser = configparser.ConfigParser(interpolation=None, strict=False)
+            parser.optionxform = str
+            parser.read(ini_file)
+            objects = {section: dict(parser[section]) for section in parser.sections()}
+    except (OSError, ValueError, configparser.Error) as e:
+        print(f"Warning: ignoring unreadable gem5 config in {run_dir}: {e}")
+        return {}
+    return objects
+
+
+def _number(value):
+    """First number of a gem5 parameter value (int, list or string such as "500" or "32KiB"); NaN if none."""
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if isinstance(value, bool) or value is None:
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = SIZE_RE.match(str(value).split()[0] if str(value).split() else "")
+    if not match:
+        return math.nan
+    number, unit = match.groups()
+    return float(number) * SIZE_UNITS[(unit or "").lower().replace("i", "")]
+
+
+def _first_core(objects):
+    """Path of the core with the lowest cpu_id, or None."""
+    cores = [path for path, params in objects.items()
+             if str(params.get("type", "")).endswith("CPU") and "cpu_id" in params and path.count(".") == 1]
+    return min(cores, key=lambda path: (_number(objects[path]["cpu_id"]), path)) if cores else None
+
+
+def run_config_columns(objects, dram=""):
+    """The CONFIG_COLUMNS values of one run from load_gem5_config and its DRAM model name."""
+    columns = dict.fromkeys(CONFIG_COLUMNS, math.nan)
+    columns["DRAM"] = dram or ""
+    core = _first_core(objects)
+
+    def size(path):
+        return _number(objects[path].get("size")) if path in objects else math.nan
+
+    if core:
+        cluster = core[len("system."):].rstrip("0123456789")
+        columns["L1 Cache [kB]"] = size(f"{core}.dcache") / 1024
+        for l2 in (f"{core}.l2cache", f"system.{cluster}_l2cache", "system.l2cache"):
+            if l2 in objects:
+                columns["L2 Cache [kB]"] = size(l2) / 1024
+                break
+        domain = str(objects[core].get("clk_domain", ""))
+        ticks = _number(objects.get(domain, {}).get("clock"))
+        if ticks > 0:
+            columns["CPU Clock [MHz]"] = TICKS_PER_US / ticks
+    columns["L3 Cache [MB]"] = size("system.l3cache") / (1 << 20)
+
+    # The DRAM interface is the object with a tCK, e.g. system.mem_ctrl.dram
+    for path, params in sorted(objects.items()):
+        if "tCK" in params:
+            tck = _number(params["tCK"])
+            if tck > 0:
+                columns["Memory Clock [MHz]"] = TICKS_PER_US / tck
+            break
+    return columns
+
+
+def run_dram(run_dir):
+    """DRAM model name recorded in the run's run.json, or "" without one."""
+    try:
+        with open(os.path.join(run_dir, RUN_INFO_FILE), "r") as file:
+            return str(json.load(file).get("dram") or "")
+    except (OSError, ValueError, AttributeError):
+        return ""
+
+
+def load_run_config(run_dir):
+    """The CONFIG_COLUMNS values of the run in run_dir."""
+    return run_config_columns(load_gem5_config(run_dir), run_dram(run_dir))
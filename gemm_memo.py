@@ -0,0 +1,93 @@
+"""Shape-keyed store of characterised GEMM layers (gemm_memo.csv).
+
+Darknet networks call GEMM with the same (M, N, K) many times, and on the
+same hardware with the same kernel every such call produces practically
+the same stats block. The memo keeps one row of gemm_metrics columns per
+
+    (M, N, K, gemm_method, threading, threads, placement, schedule, tile_size, hw_hash)
+
+where hw_hash is the content hash of the hardware description written to
+run.json by generic_cpu_config.py. process.py --memo fills layers that a
+run did not simulate from it and adds newly simulated layers; sweep.py
+writes the shapes already in the memo to memo_shapes.txt in each job's
+directory and points GEMM_SKIP_SHAPES at it, so gemm.c runs those layers
+without profiling them.
+
+Only the standard library is used, so sweep.py can read the memo without
+numpy or pandas.
+"""
+import csv
+import os
+
+DEFAULT_MEMO_FILE = "/opt/GEMM-ArchProfiler/output/gemm_memo.csv"
+MEMO_KEY_COLUMNS = (
+    "M", "N", "K", "gemm_method", "threading", "threads", "placement", "schedule", "tile_size", "hw_hash"
+)
+# Per-run list of the shapes gem5 was told not to profile
+SHAPES_FILE = "memo_shapes.txt"
+
+
+def run_key(metadata):
+    """The non-shape part of a memo key, from run metadata (run.json)."""
+    return tuple(str(metadata.get(column) or "") for column in MEMO_KEY_COLUMNS[3:])
+
+
+def memo_key(M, N, K, key):
+    """Full memo key of one layer shape run under `key` (see run_key)."""
+    return (int(M), int(N), int(K)) + tuple(key)
+
+
+def load_memo(path):
+    """Load the memo as {memo key: {column: value}}; a missing file is an empty memo."""
+    memo = {}
+    if not os.path.exists(path):
+        return memo
+    with open(path, "r", newline="") as file:
+        for row in csv.DictReader(file):
+            key = memo_key(row.pop("M"), row.pop("N"), row.pop("K"), (row.pop(c, "") for c in MEMO_KEY_COLUMNS[3:]))
+            source = row.pop("run_dir", "")
+            memo[key] = {column: float(value) if value != "" else float("nan") for column, value in row.items()}
+            memo[key]["run_dir"] = source
+    return memo
+
+
+def save_memo(path, memo):
+    """Write the memo atomically, sorted by key."""
+    if not memo:
+        return
+    # Runs on different core counts have different per-core columns
+    value_columns = list(dict.fromkeys(column for row in memo.values() for column in row if column != "run_dir"))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(list(MEMO_KEY_COLUMNS) + value_columns + ["run_dir"])
+        for key in sorted(memo):
+            row = memo[key]
+            writer.writerow(list(key) + [row.get(column, "") for column in value_columns] + [row.get("run_dir", "")])
+    os.replace(tmp_path, path)
+
+
+def known_shapes(memo, key):
+    """Sorted (M, N, K) shapes already characterised under `key`."""
+    key = tuple(key)
+    return sorted(stored[:3] for stored in memo if stored[3:] == key)
+
+
+def write_shapes_file(path, shapes):
+    """Write one "M N K" line per shape, the format gemm.c reads from GEMM_SKIP_SHAPES."""
+    with open(path, "w") as file:
+        for M, N, K in shapes:
+            file.write(f"{M} {N} {K}\n")
+
+
+def read_shapes_file(path):
+    """Set of (M, N, K) shapes in a shapes file; empty if it does not exist."""
+    shapes = set()
+    if os.path.exists(path):
+        with open(path, "r") as file:
+            for line in file:
+                fields = line.split()
+                if len(fields) == 3:
+                    shapes.add(tuple(int(field) for field in fields))
+    return shapes
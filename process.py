@@ -1,38 +1,255 @@
+import argparse
+import hashlib
+import json
+import os
 import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 import pandas as pd
 
+from core_stats import CORE_STATS, aggregate_cores
+from gem5_config import CONFIG_COLUMNS, load_run_config, run_config_columns
+from gemm_memo import DEFAULT_MEMO_FILE, SHAPES_FILE, load_memo, memo_key, read_shapes_file, run_key, save_memo
+from sampling import read_samples, reconstruct_samples
+
+STATS_BEGIN_RE = re.compile(r"-+ Begin Simulation Statistics\s+-+")
+STATS_END_RE = re.compile(r"-+ End Simulation Statistics\s+-+")
+DEFAULT_OUTPUT_ROOT = "/opt/GEMM-ArchProfiler/output"
+RUN_METADATA_FILE = "run.json"
+RUN_METADATA_COLUMNS = (
+    "config", "network", "workload", "sampling", "gemm_method", "threading", "threads", "placement", "schedule", "tile_size",
+    "hw_hash"
+)
+KNOWN_NETWORKS = ("darknet", "densenet", "resnet")
+KNOWN_GEMM_METHODS = ("gemm_nn", "tiled", "optimized", "packed")
+KNOWN_THREADING = ("single", "openmp")
+PROFILE_LOG_FILE = "gemm_profile.txt"
+CALL_LOG_FILE = "gemm_calls.bin"
+CALL_LOG_MAGIC = b"GEMMCALL"
+CALL_LOG_HEADER_SIZE = 16
+# One record of gemm_calls.bin, matching gemm_call_record in src/gemm.c
+GEMM_CALL_DTYPE = np.dtype(
+    [
+        ("call", "<i4"),
+        ("layer", "<i4"),
+        ("ta", "<i4"),
+        ("tb", "<i4"),
+        ("M", "<i4"),
+        ("N", "<i4"),
+        ("K", "<i4"),
+        ("lda", "<i4"),
+        ("ldb", "<i4"),
+        ("ldc", "<i4"),
+        ("alpha", "<f4"),
+        ("beta", "<f4"),
+    ]
+)
+TILED_DIR_RE = re.compile(r"^(\w+?)_bs(\d+)$")
+THREADS_DIR_RE = re.compile(r"^(\w+?)_t(\d+)$")
+GEMM_LAYER_RE = re.compile(r"M:\s*(\d+),\s*N:\s*(\d+),\s*K:\s*(\d+)")
+STATS_CACHE_VERSION = 1
+STAT_LINE_RE = re.compile(r"([\w\.:]+)\s+([\d\.Ee+-]+)\s+(.*)")
+# Power of one busy core in W: the gem5 configs have no power model, so
+# CPU energy is this times the time each core was on
+CORE_POWER = 50
+
+# Stats read by calculate_metrics; the default allow-list for extract_stats.
+# CORE_STATS covers every core, e.g. system.cpu, system.cpu0 or system.big_cores3
+METRIC_STATS = (
+    "simSeconds",
+    "system.clk_domain.clock",
+    "system.mem_ctrl.avgRdBWSys",
+    "system.mem_ctrl.dram.rank0.totalEnergy",
+    "system.mem_ctrl.dram.rank1.totalEnergy",
+) + CORE_STATS
+
+
+def parse_gemm_layer_line(line):
+    """Return (M, N, K) for a "GEMM Layer:" line of gemm_calls.txt, else None."""
+    line = line.strip()
+    if line.startswith("GEMM Layer:"):
+        # Extract GEMM layer details
+        match = GEMM_LAYER_RE.search(line)
+        if match:
+            return tuple(map(int, match.groups()))
+    return None
+
 
 def parse_gemm_layers(layers_file):
     """Parse GEMM layers from gemm_calls.txt."""
     layers = []
     with open(layers_file, "r") as file:
         for line in file:
-            line = line.strip()
-            if line.startswith("GEMM Layer:"):
-                # Extract GEMM layer details
-                match = re.search(r"M:\s*(\d+),\s*N:\s*(\d+),\s*K:\s*(\d+)", line)
-                if match:
-                    M, N, K = map(int, match.groups())
-                    layers.append((M, N, K))
+            layer = parse_gemm_layer_line(line)
+            if layer:
+                layers.append(layer)
     return layers
 
 
+def read_call_log(call_log, offset=0):
+    """Memory-map the complete records of gemm_calls.bin after byte `offset`.
+
+    Returns (records, offset) with records a read-only structured array of
+    GEMM_CALL_DTYPE and offset just past the last complete record; offset 0
+    means "after the header". A partially written record is left for the
+    next call.
+    """
+    empty = np.empty(0, dtype=GEMM_CALL_DTYPE)
+    if not os.path.exists(call_log):
+        return empty, offset
+    with open(call_log, "rb") as file:
+        header = file.read(CALL_LOG_HEADER_SIZE)
+    if len(header) < CALL_LOG_HEADER_SIZE:
+        return empty, offset
+    record_size = int(np.frombuffer(header, dtype="<u4", count=1, offset=12)[0])
+    if header[:8] != CALL_LOG_MAGIC or record_size != GEMM_CALL_DTYPE.itemsize:
+        raise ValueError(f"{call_log}: not a gemm_calls.bin with {GEMM_CALL_DTYPE.itemsize}-byte records")
+
+    offset = max(offset, CALL_LOG_HEADER_SIZE)
+    count = (os.path.getsize(call_log) - offset) // GEMM_CALL_DTYPE.itemsize
+    if count <= 0:
+        return empty, offset
+    records = np.memmap(call_log, dtype=GEMM_CALL_DTYPE, mode="r", offset=offset, shape=(count,))
+    return records, offset + count * GEMM_CALL_DTYPE.itemsize
+
+
+def call_log_layers(records):
+    """(M, N, K) of every call among call log records.
+
+    Transposed calls (TA or TB set) are included: gemm.c computes and
+    profiles them like gemm_nn calls, so each has its own stats block.
+    """
+    return list(zip(records["M"].tolist(), records["N"].tolist(), records["K"].tolist()))
+
+
+def read_call_log_layers_from(call_log, offset=0):
+    """Like read_gemm_layers_from, for the calls in gemm_calls.bin."""
+    records, offset = read_call_log(call_log, offset)
+    return call_log_layers(records), offset
+
+
+def load_gemm_layers(layers_file):
+    """GEMM layers from gemm_calls.bin (by extension) or the text gemm_calls.txt."""
+    if layers_file.endswith(".bin"):
+        return call_log_layers(read_call_log(layers_file)[0])
+    return parse_gemm_layers(layers_file)
+
+
+def layer_call_numbers(layers_file, count):
+    """Call number of each layer: from gemm_calls.bin, or 1..count for a text log."""
+    if layers_file.endswith(".bin"):
+        return read_call_log(layers_file)[0]["call"][:count].astype(np.int64)
+    return np.arange(1, count + 1)
+
+
+def run_layers_file(run_dir):
+    """The call log of a run directory, preferring the binary gemm_calls.bin."""
+    call_log = os.path.join(run_dir, CALL_LOG_FILE)
+    return call_log if os.path.exists(call_log) else os.path.join(run_dir, "gemm_calls.txt")
+
+
+def parse_profile_line(line):
+    """Return (M, N, K) for a "call M N K" line of gemm_profile.txt, else None."""
+    fields = line.split()
+    if len(fields) == 4 and all(field.isdigit() for field in fields):
+        return tuple(map(int, fields[1:]))
+    return None
+
+
+def read_gemm_layers_from(layers_file, offset=0, parse_line=parse_gemm_layer_line):
+    """Parse the GEMM layers appended to gemm_calls.txt after byte `offset`.
+
+    Returns (layers, offset) where the new offset points just past the last
+    complete line, so a partially written line is picked up next time.
+    With parse_line=parse_profile_line it reads gemm_profile.txt instead.
+    """
+    layers = []
+    if not os.path.exists(layers_file):
+        return layers, offset
+    with open(layers_file, "rb") as file:
+        file.seek(offset)
+        for line in file:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            layer = parse_line(line.decode(errors="replace"))
+            if layer:
+                layers.append(layer)
+    return layers, offset
+
+
+def iter_stats_blocks(stats_file):
+    """Yield stats.txt blocks one at a time, reading the file line by line.
+
+    Only blocks closed by an End marker are yielded, so a dump that is
+    still being written by gem5 never produces a truncated block.
+    """
+    block = []
+    in_block = False
+    with open(stats_file, "r") as file:
+        for line in file:
+            if STATS_BEGIN_RE.match(line):
+                block = []
+                in_block = True
+            elif STATS_END_RE.match(line):
+                content = "".join(block).strip()
+                if in_block and content:
+                    yield content
+                block = []
+                in_block = False
+            elif in_block:
+                block.append(line)
+
+
+def read_stats_blocks_from(stats_file, offset=0):
+    """Return the complete stats blocks appended to stats.txt after byte `offset`.
+
+    Returns (blocks, offset) where the new offset points just past the last
+    End marker read, so an unfinished block is re-read on the next call and
+    everything before `offset` is never read again.
+    """
+    blocks = []
+    if not os.path.exists(stats_file):
+        return blocks, offset
+    block = []
+    in_block = False
+    position = offset
+    with open(stats_file, "rb") as file:
+        file.seek(offset)
+        for raw_line in file:
+            if not raw_line.endswith(b"\n"):
+                break
+            position += len(raw_line)
+            line = raw_line.decode(errors="replace")
+            if STATS_BEGIN_RE.match(line):
+                block = []
+                in_block = True
+            elif STATS_END_RE.match(line):
+                content = "".join(block).strip()
+                if in_block and content:
+                    blocks.append(content)
+                block = []
+                in_block = False
+                offset = position
+            elif in_block:
+                block.append(line)
+    return blocks, offset
+
+
 def parse_stats_file(stats_file):
     """Split stats.txt into individual blocks."""
-    with open(stats_file, "r") as file:
-        content = file.read()
-    blocks = re.split(r"---------- End Simulation Statistics\s+----------", content)
-    return [block.strip() for block in blocks if block.strip()]
+    return list(iter_stats_blocks(stats_file))
 
 
 def extract_units_and_values(block):
     """Extract stats and units from a stats block."""
     stats_data = {}
     units = {}
-    stat_pattern = re.compile(r"([\w\.:]+)\s+([\d\.Ee+-]+)\s+(.*)")
 
     for line in block.splitlines():
-        match = stat_pattern.match(line.strip())
+        match = STAT_LINE_RE.match(line.strip())
         if match:
             parameter_name, value, unit = match.groups()
             stats_data[parameter_name] = float(value)
@@ -41,101 +258,756 @@ def extract_units_and_values(block):
     return stats_data, units
 
 
-def calculate_metrics(stats, M, N, K):
-    """Calculate the requested metrics."""
-    metrics = {}
+def compile_stat_filter(allow):
+    """Split an allow-list into exact stat names, name prefixes and wildcards.
 
-    # Calculate FLOPs
-    scalar_fp_ops = stats.get("system.cpu.commitStats0.numFpInsts", 0)
-    vector_fp_ops = stats.get("system.cpu.commitStats0.numVecInsts", 0)
-    sim_seconds = stats.get("simSeconds", 1e-9)  # Avoid division by zero
+    Entries ending in "." or ":" (e.g. "system.cpu.commitStats0.") are
+    treated as prefixes. A "*" stands for one component of the dotted name,
+    so "system.*.cpi" matches system.cpu0.cpi and system.big_cores3.cpi.
+    Everything else must match the stat name exactly.
+    """
+    names = set()
+    prefixes = []
+    wildcards = []
+    for entry in allow:
+        if "*" in entry:
+            head, _, tail = entry.partition("*")
+            wildcards.append((head, tail))
+        elif entry.endswith((".", ":")):
+            prefixes.append(entry)
+        else:
+            names.add(entry)
+    return frozenset(names), tuple(prefixes), tuple(wildcards)
 
-    # Assuming each vector FP operation performs 4 FLOPs
-    vector_width = 4  # Adjust based on your architecture
-    total_flops = scalar_fp_ops + (vector_fp_ops * vector_width)
-    flop_rate = total_flops / sim_seconds  # FLOP rate (FLOPs/s)
 
-    runtime_seconds = stats.get("simSeconds", 0)
-    cpi = stats.get("system.cpu.cpi", 0)
+def match_wildcard(name, wildcards):
+    """True if `name` matches one of the (head, tail) wildcards of compile_stat_filter."""
+    for head, tail in wildcards:
+        if len(name) > len(head) + len(tail) and name.startswith(head) and name.endswith(tail):
+            if "." not in name[len(head):len(name) - len(tail)]:
+                return True
+    return False
 
-    sim_frequency = 1e12  # 1 THz (ticks/second) as default in GEM5
-    clock_period_ticks = stats.get("system.clk_domain.clock", 1)  # Default to 1 if not found
-    clock_frequency_hz = sim_frequency / clock_period_ticks
-    mem_clock_mhz = clock_frequency_hz / 1e6  # Convert Hz to MHz
 
-    mem_clock = mem_clock_mhz
-    l1_cache = 32  # kB (static assumption)
-    l2_cache = 256  # kB (static assumption)
-    l3_cache = 3  # MB (static assumption)
-    avg_read_bw = stats.get("system.mem_ctrl.avgRdBWSys", 0) / 1e6  # MB/s
+METRIC_FILTER = compile_stat_filter(METRIC_STATS)
 
-    # DRAM energy
-    dram_energy = stats.get("system.mem_ctrl.dram.rank0.totalEnergy", 0) + stats.get(
-        "system.mem_ctrl.dram.rank1.totalEnergy", 0
+
+def extract_stats(block, stat_filter=None, with_units=False):
+    """Extract only the allow-listed stats from a stats block.
+
+    Fast path for extract_units_and_values: lines are tokenised with
+    str.split and only names accepted by `stat_filter` (from
+    compile_stat_filter, defaulting to METRIC_STATS) are converted to
+    float. Returns the stats dict, or (stats, units) when `with_units` is set.
+    """
+    names, prefixes, wildcards = stat_filter or METRIC_FILTER
+    # Cheap suffix test before the full wildcard match
+    tails = tuple(tail for _, tail in wildcards)
+    stats_data = {}
+    units = {} if with_units else None
+
+    for line in block.splitlines():
+        # Only the name is split off until the line is known to be wanted
+        name, _, rest = line.partition(" ")
+        if (
+            name not in names
+            and not (prefixes and name.startswith(prefixes))
+            and not (tails and name.endswith(tails) and match_wildcard(name, wildcards))
+        ):
+            continue
+        fields = rest.split(None, 1)
+        if not fields:
+            continue
+        try:
+            stats_data[name] = float(fields[0])
+        except ValueError:
+            continue
+        if with_units:
+            units[name] = fields[1] if len(fields) > 1 else ""
+
+    if with_units:
+        return stats_data, units
+    return stats_data
+
+
+def build_stats_matrix(blocks, stat_filter=None, capacity=64):
+    """Fill one float64 array of blocks x stats from an iterable of stats blocks.
+
+    Returns (values, columns) where columns maps a stat name to its column
+    index. Stats missing from a block are NaN, and stats missing from every
+    block have no column. The array is preallocated
+    for `capacity` blocks and doubled whenever it fills up.
+    """
+    stat_filter = stat_filter or METRIC_FILTER
+    columns = {name: idx for idx, name in enumerate(sorted(stat_filter[0]))}
+    values = np.full((max(capacity, 1), max(len(columns), 1)), np.nan)
+
+    num_blocks = 0
+    for block in blocks:
+        if num_blocks == values.shape[0]:
+            values = np.vstack([values, np.full_like(values, np.nan)])
+        row = values[num_blocks]
+        for name, value in extract_stats(block, stat_filter).items():
+            idx = columns.get(name)
+            if idx is None:
+                # New stat matched by a prefix or wildcard: widen the array by one column
+                idx = columns[name] = len(columns)
+                if idx == values.shape[1]:
+                    values = np.hstack([values, np.full((values.shape[0], values.shape[1]), np.nan)])
+                    row = values[num_blocks]
+            row[idx] = value
+        num_blocks += 1
+
+    # Drop allow-listed stats that no block has, e.g. system.cpu.* on a
+    # multi-core system, so that only the cores that exist show up
+    values = values[:num_blocks, : len(columns)]
+    present = [name for name, idx in columns.items() if not np.isnan(values[:, idx]).all()]
+    return values[:, [columns[name] for name in present]], {name: idx for idx, name in enumerate(present)}
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file, read in 1 MiB chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stats_cache_path(stats_file):
+    """Path of the parse cache kept next to stats_file (stats.txt -> stats.cache.npz)."""
+    return os.path.splitext(stats_file)[0] + ".cache.npz"
+
+
+def load_stats_matrix(stats_file, stat_filter=None, capacity=64, use_cache=True):
+    """build_stats_matrix for a stats file, backed by an .npz parse cache.
+
+    The cache is keyed by the file size, mtime and SHA-256 of stats_file
+    plus the stat filter. A matching size and mtime is trusted as is; if
+    only the mtime differs the content hash decides and the cache is
+    re-stamped. Any other change rebuilds the cache.
+    """
+    stat_filter = stat_filter or METRIC_FILTER
+    if not use_cache:
+        return build_stats_matrix(iter_stats_blocks(stats_file), stat_filter, capacity)
+
+    cache_file = stats_cache_path(stats_file)
+    stat = os.stat(stats_file)
+    filter_key = "\n#".join(
+        "\n".join(sorted(entries))
+        for entries in (stat_filter[0], stat_filter[1], (head + "*" + tail for head, tail in stat_filter[2]))
     )
+    digest = None
+
+    values = None
+    if os.path.exists(cache_file):
+        try:
+            with np.load(cache_file, allow_pickle=False) as cached:
+                valid = (
+                    int(cached["version"]) == STATS_CACHE_VERSION
+                    and int(cached["size"]) == stat.st_size
+                    and str(cached["filter"]) == filter_key
+                )
+                mtime_changed = int(cached["mtime_ns"]) != stat.st_mtime_ns
+                if valid and mtime_changed:
+                    digest = file_digest(stats_file)
+                    valid = str(cached["sha256"]) == digest
+                if valid:
+                    values = cached["values"]
+                    columns = {name: idx for idx, name in enumerate(cached["columns"].tolist())}
+                    print(f"Loaded parsed stats from cache {cache_file}")
+                    if not mtime_changed:
+                        return values, columns
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Warning: ignoring unreadable stats cache {cache_file}: {e}")
+
+    if values is None:
+        values, columns = build_stats_matrix(iter_stats_blocks(stats_file), stat_filter, capacity)
+    if digest is None:
+        digest = file_digest(stats_file)
+
+    # Write to a temporary file first so an interrupted run never leaves a
+    # half-written cache behind
+    tmp_file = cache_file + ".tmp"
+    try:
+        with open(tmp_file, "wb") as file:
+            np.savez(
+                file,
+                version=STATS_CACHE_VERSION,
+                size=stat.st_size,
+                mtime_ns=stat.st_mtime_ns,
+                sha256=digest,
+                filter=filter_key,
+                columns=np.array(list(columns), dtype=str),
+                values=values,
+            )
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"Warning: could not write stats cache {cache_file}: {e}")
+    return values, columns
+
+
+def stat_column(values, columns, name, default=0.0):
+    """Return one stat for every block, with `default` where it is missing."""
+    idx = columns.get(name)
+    if idx is None:
+        return np.full(values.shape[0], default)
+    column = values[:, idx]
+    return np.where(np.isnan(column), default, column)
+
+
+def calculate_metrics(stats, M, N, K, config=None):
+    """Calculate the requested metrics for one stats dict (see calculate_metrics_columnar)."""
+    columns = {name: idx for idx, name in enumerate(stats)}
+    values = np.array([list(stats.values())], dtype=float).reshape(1, len(columns))
+    return calculate_metrics_columnar(values, columns, [(M, N, K)], config).iloc[0].to_dict()
+
+
+def calculate_metrics_columnar(values, columns, layers, config=None):
+    """Vectorised calculate_metrics over every block of a stats matrix.
+
+    Row i of `values` is paired with layers[i]; the result has one row
+    per layer. `config` holds the run's cache, clock and DRAM columns from
+    gem5_config.run_config_columns; without it they are empty, and the CPU
+    clock comes from the stats. Core stats are aggregated over every core of the system
+    (see core_stats.aggregate_cores), so multi-core runs report the whole
+    system, followed by per-core and per-cluster columns.
+    """
+    layers = np.asarray(layers, dtype=np.int64).reshape(-1, 3)
+
+    def col(name, default=0.0):
+        return stat_column(values, columns, name, default)
+
+    system, units = aggregate_cores(values, columns)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # FLOPs of all cores, assuming each vector FP operation performs 4
+        total_flops = system["flops"]
+        sim_seconds = col("simSeconds", 1e-9)  # Avoid division by zero
+        flop_rate = total_flops / sim_seconds
+
+        runtime_seconds = col("simSeconds")
+        # Instruction-weighted over the cores that ran
+        cpi = np.nan_to_num(system["cpi"])
+
+        sim_frequency = 1e12  # 1 THz (ticks/second) as default in GEM5
+        config = dict(run_config_columns({}), **(config or {}))
+        cpu_clock_mhz = config["CPU Clock [MHz]"]
+        if np.isnan(cpu_clock_mhz):
+            cpu_clock_mhz = sim_frequency / col("system.clk_domain.clock", 1) / 1e6
+
+        avg_read_bw = col("system.mem_ctrl.avgRdBWSys") / 1e6  # MB/s
+
+        # DRAM energy, reported by gem5 in pJ
+        dram_energy = (col("system.mem_ctrl.dram.rank0.totalEnergy") + col(
+            "system.mem_ctrl.dram.rank1.totalEnergy"
+        )) / 1e12
 
-    # CPU energy calculation
-    cpu_residency_ticks = stats.get("system.cpu.power_state.pwrStateResidencyTicks::ON", 0)
-    cpu_clock = stats.get("system.clk_domain.clock", 1)  # In ticks
-    cpu_power = 50  # Assume a default CPU power consumption in Watts
-    cpu_energy = (cpu_residency_ticks / cpu_clock) * cpu_power
-
-    # Total energy and power
-    total_energy = dram_energy + cpu_energy
-    total_power = total_energy / runtime_seconds if runtime_seconds else 0
-
-    # Compute derived metrics
-    metrics["Layer"] = f"GEMM Layer ({M}, {N}, {K})"
-    metrics["M"] = M
-    metrics["N"] = N
-    metrics["K"] = K
-    metrics["L1 Cache [kB]"] = l1_cache
-    metrics["L2 Cache [kB]"] = l2_cache
-    metrics["L3 Cache [MB]"] = l3_cache
-    metrics["Memory Clock [MHz]"] = mem_clock
-    metrics["Mean Runtime (RDTSC) [s]"] = runtime_seconds
-    metrics["Mean CPI"] = cpi
-    metrics["Mean DP [MFLOP/s]"] = flop_rate / 1e6
-    metrics["Memory Bandwidth [MB/s]"] = avg_read_bw
-    metrics["Energy [J]"] = total_energy
-    metrics["Power [W]"] = total_power
-    metrics["Operational Intensity"] = total_flops / avg_read_bw if avg_read_bw else 0
-    metrics["MaxFLOPS"] = total_flops
-
-    return metrics
-
-
-def generate_csv(layers_file, stats_file, output_csv):
-    """Generate CSV combining GEMM parameters and statistics."""
+        # CPU energy: time each core was on, at CORE_POWER
+        cpu_energy = system["on_ticks"] / sim_frequency * CORE_POWER
+
+        # Total energy and power
+        total_energy = dram_energy + cpu_energy
+        total_power = np.where(runtime_seconds != 0, total_energy / runtime_seconds, 0)
+        operational_intensity = np.where(avg_read_bw != 0, total_flops / avg_read_bw, 0)
+
+    M, N, K = layers[:, 0], layers[:, 1], layers[:, 2]
+    df = pd.DataFrame(
+        {
+            "Layer": [f"GEMM Layer ({m}, {n}, {k})" for m, n, k in layers.tolist()],
+            "M": M,
+            "N": N,
+            "K": K,
+            "L1 Cache [kB]": config["L1 Cache [kB]"],
+            "L2 Cache [kB]": config["L2 Cache [kB]"],
+            "L3 Cache [MB]": config["L3 Cache [MB]"],
+            "CPU Clock [MHz]": cpu_clock_mhz,
+            "Memory Clock [MHz]": config["Memory Clock [MHz]"],
+            "DRAM": config["DRAM"],
+            "Mean Runtime (RDTSC) [s]": runtime_seconds,
+            "Mean CPI": cpi,
+            "Mean DP [MFLOP/s]": flop_rate / 1e6,
+            "Memory Bandwidth [MB/s]": avg_read_bw,
+            "Energy [J]": total_energy,
+            "Power [W]": total_power,
+            "Operational Intensity": operational_intensity,
+            "MaxFLOPS": total_flops,
+            # A core that committed instructions ran a thread
+            "Threads": system["threads"],
+            "L1D Miss Rate": system["l1d"],
+            "L2 Miss Rate": system["l2"],
+            "L3 Miss Rate": system["l3"],
+            "Load Imbalance [%]": system["insts_imbalance"],
+            "Cycle Imbalance [%]": system["cycles_imbalance"],
+        }
+    )
+    for column, unit_values in units.items():
+        df[column] = unit_values
+    return df
+
+
+def profiled_layer_indices(layers, profiled=None, skipped=()):
+    """Indices of the layers that have a stats block, in block order.
+
+    `profiled` is the list of shapes in gemm_profile.txt, one per stats
+    block; each is matched to the next layer of that shape. Without a
+    profile log, every layer whose shape is not in `skipped` has a block.
+    """
+    if profiled is None:
+        return [i for i, layer in enumerate(layers) if tuple(layer) not in skipped]
+    indices = []
+    for i, layer in enumerate(layers):
+        if len(indices) < len(profiled) and tuple(layer) == tuple(profiled[len(indices)]):
+            indices.append(i)
+    if len(indices) < len(profiled):
+        print(f"Warning: {len(profiled) - len(indices)} profiled GEMM calls do not match a layer in the call log.")
+    return indices
+
+
+def merge_layer_metrics(values, columns, layers, simulated, config=None):
+    """Metrics for every layer when only the layers in `simulated` were profiled.
+
+    The layers at the `simulated` indices take the stats blocks in order.
+    The other layers copy the first simulated layer of the same shape, or
+    get NaN metrics. A Source column marks rows as "simulated", "repeat" or
+    "missing" (for fill_from_memo).
+    """
+    num_rows = min(len(simulated), values.shape[0])
+    if values.shape[0] > len(simulated):
+        print(f"Warning: {values.shape[0] - len(simulated)} stats blocks have no corresponding profiled GEMM layer.")
+
+    measured = calculate_metrics_columnar(values[:num_rows], columns, [layers[i] for i in simulated[:num_rows]], config)
+    df = calculate_metrics_columnar(np.full((len(layers), values.shape[1]), np.nan), columns, layers, config)
+    stat_columns = memo_columns(df)
+    df[stat_columns] = np.nan
+    df.loc[simulated[:num_rows], stat_columns] = measured[stat_columns].to_numpy()
+    df["Source"] = "missing"
+    df.loc[simulated[:num_rows], "Source"] = "simulated"
+
+    # Repeated shapes reuse the run's own measurement
+    first = {}
+    for i in simulated[:num_rows]:
+        first.setdefault(tuple(layers[i]), i)
+    for i in df.index[df["Source"] == "missing"]:
+        source = first.get(tuple(layers[i]))
+        if source is not None:
+            df.loc[i, stat_columns] = df.loc[source, stat_columns]
+            df.at[i, "Source"] = "repeat"
+    return df
+
+
+def sampled_layer_indices(layers_file, layers, calls):
+    """Indices of the layers of the sampled `calls`, and which calls are in the call log."""
+    index = {call: i for i, call in enumerate(layer_call_numbers(layers_file, len(layers)))}
+    found = np.array([call in index for call in calls], dtype=bool)
+    if not found.all():
+        print(f"Warning: {(~found).sum()} sampled GEMM calls are not in the call log.")
+    return [index[call] for call in calls if call in index], found
+
+
+def add_sampling_columns(df, layers, simulated, calls, runtime_ci, cpi_ci, samples):
+    """Sample counts and confidence intervals of a sampled run's layers.
+
+    Runtime CI [s] and CPI CI are the half-widths of the confidence
+    intervals of the runtime and the Mean CPI. Repeated shapes take their
+    source's values.
+    """
+    counts = {}
+    for sample in samples["samples"]:
+        counts[sample["call"]] = counts.get(sample["call"], 0) + 1
+    own, by_shape = {}, {}
+    for i, call, runtime, cpi in zip(simulated, calls, runtime_ci, cpi_ci):
+        own[i] = (counts.get(call, 0), runtime, cpi)
+        by_shape.setdefault(tuple(layers[i]), own[i])
+    rows = [own.get(i, by_shape.get(tuple(layer), (0, np.nan, np.nan))) for i, layer in enumerate(layers)]
+    df["Samples"] = [count for count, _, _ in rows]
+    df["Runtime CI [s]"] = [runtime for _, runtime, _ in rows]
+    df["CPI CI"] = [cpi for _, _, cpi in rows]
+
+
+def memo_columns(df):
+    """The stat-derived metric columns of a gemm_metrics DataFrame, as kept in the memo."""
+    metrics = df.columns[df.columns.get_loc("K") + 1:]
+    return [column for column in metrics if column not in CONFIG_COLUMNS and column != "Source"]
+
+
+def fill_from_memo(df, memo, key):
+    """Fill the "missing" rows of `df` from the memo; returns the number filled."""
+    metric_columns = memo_columns(df)
+    filled = 0
+    for i in df.index[df["Source"] == "missing"]:
+        row = memo.get(memo_key(df.at[i, "M"], df.at[i, "N"], df.at[i, "K"], key))
+        if row is not None:
+            df.loc[i, metric_columns] = [row.get(column, np.nan) for column in metric_columns]
+            df.at[i, "Source"] = "memo"
+            filled += 1
+    return filled
+
+
+def update_memo(memo, df, metadata, run_dir):
+    """Add the simulated layers of one run to the memo; returns the number added.
+
+    Runs without a hardware hash in run.json cannot be keyed and are skipped.
+    """
+    if not metadata.get("hw_hash"):
+        print(f"Warning: no hw_hash in {os.path.join(run_dir, RUN_METADATA_FILE)}; not adding it to the memo.")
+        return 0
+    key = run_key(metadata)
+    metric_columns = memo_columns(df)
+    rows = df[df["Source"] == "simulated"] if "Source" in df.columns else df
+    for _, row in rows.iterrows():
+        memo[memo_key(row["M"], row["N"], row["K"], key)] = dict(
+            {column: float(row[column]) for column in metric_columns}, run_dir=run_dir
+        )
+    return len(rows)
+
+
+def generate_csv(layers_file, stats_file, output_csv, use_cache=True, memo=None, metadata=None):
+    """Generate CSV combining GEMM parameters and statistics.
+
+    When gemm.c logged the profiled calls to gemm_profile.txt or skipped
+    the shapes in memo_shapes.txt (both next to stats.txt), stats blocks
+    are matched to those layers only, and a Source column is added. Layers
+    that were not profiled copy a profiled layer of the same shape or, with
+    a `memo` (see gemm_memo.py), are filled from it under the run's
+    `metadata`.
+
+    A sampled run (samples.json next to stats.txt, see sampling.py) has
+    one stats block per sampled interval. Each sampled call's stats are
+    reconstructed from its intervals first, and Samples, Runtime CI [s] and
+    CPI CI columns are added.
+    """
     # Parse GEMM layers
-    layers = parse_gemm_layers(layers_file)
+    layers = load_gemm_layers(layers_file)
 
     print(f"Found {len(layers)} GEMM layers.")  # Debugging information
 
-    # Parse stats file into blocks
-    stats_blocks = parse_stats_file(stats_file)
+    # Stream the stats blocks into one blocks x stats array, or reuse the
+    # parse cache if stats.txt has not changed since the last run
+    values, columns = load_stats_matrix(stats_file, capacity=len(layers), use_cache=use_cache)
+    num_blocks = values.shape[0]
 
-    print(f"Found {len(stats_blocks)} stats blocks.")  # Debugging information
+    print(f"Found {num_blocks} stats blocks.")  # Debugging information
 
-    # Ensure the number of stats blocks matches or exceeds GEMM layers
-    if len(stats_blocks) < len(layers):
+    run_dir = os.path.dirname(os.path.abspath(stats_file))
+    # Cache, clock and DRAM parameters gem5 wrote next to stats.txt, joined onto every row
+    config = load_run_config(run_dir)
+    skipped = read_shapes_file(os.path.join(run_dir, SHAPES_FILE))
+    profile_log = os.path.join(run_dir, PROFILE_LOG_FILE)
+    profiled = read_gemm_layers_from(profile_log, 0, parse_profile_line)[0] if os.path.exists(profile_log) else None
+    samples = read_samples(run_dir)
+    if samples is not None:
+        values, calls, runtime_ci, cpi_ci = reconstruct_samples(values, columns, samples)
+        print(f"Reconstructed {len(calls)} GEMM calls from {num_blocks} sampled intervals.")
+        simulated, found = sampled_layer_indices(layers_file, layers, calls)
+        values, calls, runtime_ci, cpi_ci = values[found], np.asarray(calls)[found], runtime_ci[found], cpi_ci[found]
+    if memo is not None or skipped or profiled is not None or samples is not None:
+        if samples is None:
+            simulated = profiled_layer_indices(layers, profiled, skipped)
+        df = merge_layer_metrics(values, columns, layers, simulated, config)
+        if samples is not None:
+            add_sampling_columns(df, layers, simulated, calls, runtime_ci, cpi_ci, samples)
+        filled = fill_from_memo(df, memo, run_key(metadata or {})) if memo else 0
+        counts = df["Source"].value_counts()
         print(
-            f"Warning: {len(layers) - len(stats_blocks)} GEMM layers do not have corresponding stats blocks."
+            f"{counts.get('simulated', 0)} layers simulated, {counts.get('repeat', 0)} repeated shapes, "
+            f"{filled} filled from the memo, {counts.get('missing', 0)} missing."
         )
-        layers = layers[: len(stats_blocks)]  # Truncate layers to match stats blocks
+    else:
+        # Warn if some GEMM layers have no corresponding stats blocks
+        if num_blocks < len(layers):
+            print(
+                f"Warning: {len(layers) - num_blocks} GEMM layers do not have corresponding stats blocks."
+            )
+        num_rows = min(num_blocks, len(layers))
 
-    # Combine metrics for each layer
-    combined_metrics = []
-    for (M, N, K), block in zip(layers, stats_blocks):
-        stats_data, _ = extract_units_and_values(block)
-        metrics = calculate_metrics(stats_data, M, N, K)
-        combined_metrics.append(metrics)
+        # Compute all layers at once
+        df = calculate_metrics_columnar(values[:num_rows], columns, layers[:num_rows], config)
 
-    # Convert to DataFrame and save as CSV
-    df = pd.DataFrame(combined_metrics)
     df.to_csv(output_csv, index=False)
     print(f"CSV file saved to {output_csv}")
+    return df
+
+
+def find_run_dirs(root):
+    """Return every directory under root holding stats.txt and gemm_calls.bin or gemm_calls.txt."""
+    run_dirs = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        # gem5 checkpoints can be large and never contain stats dumps
+        dirnames[:] = sorted(d for d in dirnames if d != "checkpoints" and not d.startswith("cpt."))
+        if "stats.txt" in filenames and (CALL_LOG_FILE in filenames or "gemm_calls.txt" in filenames):
+            run_dirs.append(dirpath)
+    return run_dirs
+
+
+def run_metadata(run_dir, root):
+    """Describe a run by config, network, GEMM method and threading.
+
+    Values come from run.json in the run directory when present. Otherwise
+    they are guessed from the directory names below root, e.g.
+    IntelCorei7_11370H/darknet/tiled_bs32/openmp as written by sweep.py.
+    """
+    metadata = dict.fromkeys(RUN_METADATA_COLUMNS, "")
+    rel_path = os.path.relpath(run_dir, root)
+    for part in ([] if rel_path == "." else rel_path.split(os.sep)):
+        key = part.lower()
+        tiled = TILED_DIR_RE.match(key)
+        threads = THREADS_DIR_RE.match(key)
+        if tiled:
+            metadata["gemm_method"], metadata["tile_size"] = tiled.groups()
+        elif threads and threads.group(1) in KNOWN_THREADING:
+            metadata["threading"], metadata["threads"] = threads.groups()
+        elif key in KNOWN_NETWORKS:
+            metadata["network"] = key
+        elif key in KNOWN_GEMM_METHODS:
+            metadata["gemm_method"] = key
+        elif key in KNOWN_THREADING:
+            metadata["threading"] = key
+        elif not metadata["config"]:
+            metadata["config"] = part
+
+    metadata_file = os.path.join(run_dir, RUN_METADATA_FILE)
+    if os.path.exists(metadata_file):
+        with open(metadata_file, "r") as file:
+            stored = json.load(file)
+        metadata.update({key: str(stored[key]) for key in RUN_METADATA_COLUMNS if key in stored})
+    return metadata
+
+
+def process_run(run_dir, root, use_cache=True, memo=None):
+    """Generate gemm_metrics.csv for one run directory and tag rows with its metadata."""
+    metadata = run_metadata(run_dir, root)
+    df = generate_csv(
+        run_layers_file(run_dir),
+        os.path.join(run_dir, "stats.txt"),
+        os.path.join(run_dir, "gemm_metrics.csv"),
+        use_cache=use_cache,
+        memo=memo,
+        metadata=metadata,
+    )
+    for position, (key, value) in enumerate(metadata.items()):
+        df.insert(position, key, value)
+    df.insert(len(RUN_METADATA_COLUMNS), "run_dir", os.path.relpath(run_dir, root))
+    return df
+
+
+def batch_process(root=DEFAULT_OUTPUT_ROOT, output_csv=None, workers=None, use_cache=True, memo_file=None):
+    """Process every run directory under root in parallel and merge the results.
+
+    Runs are spread over a process pool with one worker per host core by
+    default. The merged table is written to root/all_gemm_metrics.csv.
+    With `memo_file`, layers are filled from and added to the shape memo;
+    layers characterised by another run of the same batch are filled too.
+    """
+    output_csv = output_csv or os.path.join(root, "all_gemm_metrics.csv")
+    run_dirs = find_run_dirs(root)
+    print(f"Found {len(run_dirs)} run directories under {root}.")
+    if not run_dirs:
+        return None
+
+    memo = load_memo(memo_file) if memo_file else None
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = {executor.submit(process_run, run_dir, root, use_cache, memo): run_dir for run_dir in run_dirs}
+        for future in as_completed(futures):
+            run_dir = futures[future]
+            try:
+                results[run_dir] = future.result()
+            except Exception as e:
+                print(f"Warning: failed to process {run_dir}: {e}")
+
+    if memo is not None:
+        added = sum(update_memo(memo, df, run_metadata(run_dir, root), run_dir) for run_dir, df in results.items())
+        # Second pass for layers only characterised by another run of this batch
+        for run_dir, df in results.items():
+            if fill_from_memo(df, memo, run_key(run_metadata(run_dir, root))):
+                df.drop(columns=list(RUN_METADATA_COLUMNS) + ["run_dir"]).to_csv(
+                    os.path.join(run_dir, "gemm_metrics.csv"), index=False
+                )
+        save_memo(memo_file, memo)
+        print(f"Memo {memo_file}: {added} layers added or updated, {len(memo)} entries.")
+
+    # Keep the merged table in a stable, directory-sorted order
+    frames = [results[run_dir] for run_dir in run_dirs if run_dir in results]
+    if not frames:
+        return None
+    df = pd.concat(frames, ignore_index=True)
+    df.to_csv(output_csv, index=False)
+    print(f"Consolidated CSV with {len(df)} rows from {len(frames)} runs saved to {output_csv}")
+    return df
+
+
+def follow_layer_source(outdir):
+    """(path, reader) of the call log that follow_run pairs with stats blocks."""
+    profile_log = os.path.join(outdir, PROFILE_LOG_FILE)
+    if os.path.exists(profile_log):
+        return profile_log, lambda path, offset: read_gemm_layers_from(path, offset, parse_profile_line)
+    call_log = os.path.join(outdir, CALL_LOG_FILE)
+    if os.path.exists(call_log):
+        return call_log, read_call_log_layers_from
+    return os.path.join(outdir, "gemm_calls.txt"), read_gemm_layers_from
+
+
+def follow_run(outdir, output_csv=None, interval=10.0):
+    """Tail gemm_calls.txt and stats.txt in `outdir` while gem5 is running.
+
+    Byte offsets into both files are kept between polls, so only newly
+    appended complete blocks are parsed. Each new layer is appended to
+    gemm_metrics.csv and its CPI and bandwidth printed. Stops on Ctrl-C.
+    When gemm.c profiles a subset of calls (GEMM_PROFILE), blocks are paired
+    with the calls in gemm_profile.txt, and otherwise with gemm_calls.bin
+    when it exists.
+    """
+    layers_file, read_layers_from = follow_layer_source(outdir)
+    stats_file = os.path.join(outdir, "stats.txt")
+    output_csv = output_csv or os.path.join(outdir, "gemm_metrics.csv")
+
+    layers_offset = stats_offset = 0
+    pending_layers, pending_blocks = [], []
+    num_rows = 0
+    write_header = True
+    config = None
+
+    print(f"Following {stats_file} (Ctrl-C to stop)...")
+    try:
+        while True:
+            # gem5 restarted and truncated the files: start over
+            if os.path.exists(stats_file) and os.path.getsize(stats_file) < stats_offset:
+                print("stats.txt was truncated; restarting from the beginning.")
+                layers_offset = stats_offset = 0
+                pending_layers, pending_blocks = [], []
+                num_rows = 0
+                write_header = True
+
+            # gemm.c creates its logs before the first stats block
+            if not num_rows and follow_layer_source(outdir)[0] != layers_file:
+                layers_file, read_layers_from = follow_layer_source(outdir)
+                layers_offset, pending_layers = 0, []
+
+            new_layers, layers_offset = read_layers_from(layers_file, layers_offset)
+            new_blocks, stats_offset = read_stats_blocks_from(stats_file, stats_offset)
+            pending_layers.extend(new_layers)
+            pending_blocks.extend(new_blocks)
+
+            num_new = min(len(pending_layers), len(pending_blocks))
+            if num_new:
+                values, columns = build_stats_matrix(pending_blocks[:num_new], capacity=num_new)
+                # gem5 writes config.json before the first stats dump
+                config = config or load_run_config(outdir)
+                df = calculate_metrics_columnar(values, columns, pending_layers[:num_new], config)
+                df.to_csv(output_csv, mode="w" if write_header else "a", header=write_header, index=False)
+                write_header = False
+                del pending_layers[:num_new]
+                del pending_blocks[:num_new]
+
+                live = df[["Layer", "Mean CPI", "Memory Bandwidth [MB/s]"]]
+                for layer, cpi, bandwidth in live.itertuples(index=False, name=None):
+                    num_rows += 1
+                    print(f"[{num_rows}] {layer}: CPI {cpi:.3f}, bandwidth {bandwidth:.2f} MB/s")
+
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print(f"\nStopped following. {num_rows} layers written to {output_csv}")
+
+
+def benchmark_parsers(stats_file, num_blocks=1000):
+    """Time the regex and allow-list parsers on stats_file replicated num_blocks times."""
+    block = next(iter_stats_blocks(stats_file))
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as tmp:
+        for _ in range(num_blocks):
+            tmp.write("\n---------- Begin Simulation Statistics ----------\n")
+            tmp.write(block)
+            tmp.write("\n---------- End Simulation Statistics   ----------\n")
+        bench_file = tmp.name
+
+    try:
+        start = time.perf_counter()
+        for block in iter_stats_blocks(bench_file):
+            pass
+        read_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for block in iter_stats_blocks(bench_file):
+            extract_units_and_values(block)
+        regex_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for block in iter_stats_blocks(bench_file):
+            extract_stats(block)
+        fast_seconds = time.perf_counter() - start
+    finally:
+        os.remove(bench_file)
+
+    print(f"Blocks parsed: {num_blocks}")
+    print(f"iter_stats_blocks only: {read_seconds:.3f} s")
+    print(f"extract_units_and_values: {regex_seconds:.3f} s")
+    print(f"extract_stats (allow-list): {fast_seconds:.3f} s")
+    print(f"Speedup: {regex_seconds / fast_seconds:.1f}x "
+          f"({(regex_seconds - read_seconds) / max(fast_seconds - read_seconds, 1e-9):.1f}x excluding file reading)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Combine the GEMM call log and gem5 stats.txt into gemm_metrics.csv.")
+    parser.add_argument(
+        "--layers",
+        help="GEMM call log, gemm_calls.bin or gemm_calls.txt (default: whichever is next to --stats, preferring .bin)",
+    )
+    parser.add_argument("--stats", default="stats.txt", help="gem5 stats dump (default: stats.txt)")
+    parser.add_argument(
+        "--output",
+        help="output CSV (default: gemm_metrics.csv, or ROOT/all_gemm_metrics.csv with --batch)",
+    )
+    parser.add_argument(
+        "--follow",
+        metavar="OUTDIR",
+        help="tail OUTDIR/stats.txt and the GEMM call log while gem5 runs, appending rows as blocks complete",
+    )
+    parser.add_argument(
+        "--batch",
+        nargs="?",
+        const=DEFAULT_OUTPUT_ROOT,
+        metavar="ROOT",
+        help=f"process every run directory under ROOT (default: {DEFAULT_OUTPUT_ROOT}) and merge the results",
+    )
+    parser.add_argument("--workers", type=int, help="worker processes for --batch (default: number of host cores)")
+    parser.add_argument("--interval", type=float, default=10.0, help="polling interval in seconds for --follow")
+    parser.add_argument("--no-cache", action="store_true", help="always re-parse stats.txt, ignoring stats.cache.npz")
+    parser.add_argument(
+        "--memo",
+        nargs="?",
+        const=DEFAULT_MEMO_FILE,
+        metavar="FILE",
+        help=f"fill unprofiled layers from, and add simulated layers to, the shape memo (default: {DEFAULT_MEMO_FILE})",
+    )
+    parser.add_argument(
+        "--benchmark-parser",
+        type=int,
+        metavar="BLOCKS",
+        help="benchmark the stats parsers on --stats replicated BLOCKS times (e.g. 1000)",
+    )
+    args = parser.parse_args()
+    layers_file = args.layers or run_layers_file(os.path.dirname(args.stats) or ".")
+
+    if args.benchmark_parser:
+        benchmark_parsers(args.stats, args.benchmark_parser)
+    elif args.follow:
+        follow_run(args.follow, args.output, interval=args.interval)
+    elif args.batch:
+        batch_process(args.batch, args.output, workers=args.workers, use_cache=not args.no_cache, memo_file=args.memo)
+    elif args.memo:
+        run_dir = os.path.dirname(os.path.abspath(args.stats))
+        metadata = run_metadata(run_dir, run_dir)
+        memo = load_memo(args.memo)
+        df = generate_csv(
+            layers_file, args.stats, args.output or "gemm_metrics.csv", use_cache=not args.no_cache,
+            memo=memo, metadata=metadata,
+        )
+        if update_memo(memo, df, metadata, run_dir):
+            save_memo(args.memo, memo)
+            print(f"Memo {args.memo}: {len(memo)} entries.")
+    else:
+        generate_csv(layers_file, args.stats, args.output or "gemm_metrics.csv", use_cache=not args.no_cache)
 
 
-# Example usage
-generate_csv("gemm_calls.txt", "stats.txt", "gemm_metrics.csv")
+if __name__ == "__main__":
+    main()
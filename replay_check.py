@@ -0,0 +1,121 @@
+"""Check a gemm_replay run against the full-network run it replays.
+
+generic_cpu_config.py --replay simulates the GEMM calls of a network's
+gemm_calls.bin with src/gemm_replay.c instead of darknet. The replay keeps
+the original call numbers, so its rows can be matched call by call with the
+full run's gemm_metrics.csv. For every call both runs simulated, the
+replay's metrics are compared with the full run's:
+
+    Mean Runtime (RDTSC) [s], Mean CPI    relative error, checked against
+                                          --tolerance
+    L1D/L2 Miss Rate                      absolute difference
+    Memory Bandwidth [MB/s]               relative error
+
+The replay starts each GEMM with its own matrices in the cache, where
+darknet has the previous layer's working set, so small layers are expected
+to differ most. The comparison is written to replay_check.csv in the replay
+directory; the exit status is 1 if a checked metric is off by more than the
+tolerance.
+
+Usage:
+    python3 replay_check.py output/replay/darknet output/darknet [--calls 3,7,12] [--tolerance 0.05]
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from process import generate_csv, layer_call_numbers, run_layers_file
+
+METRICS_FILE = "gemm_metrics.csv"
+CHECK_FILE = "replay_check.csv"
+# Metrics compared by relative error; the first CHECKED_METRICS are held to --tolerance
+RELATIVE_METRICS = ("Mean Runtime (RDTSC) [s]", "Mean CPI", "Memory Bandwidth [MB/s]")
+CHECKED_METRICS = RELATIVE_METRICS[:2]
+# Metrics compared by absolute difference
+ABSOLUTE_METRICS = ("L1D Miss Rate", "L2 Miss Rate")
+
+
+def run_metrics(run_dir):
+    """gemm_metrics.csv of a run with a Call column, regenerated if stats.txt is newer."""
+    metrics_file = os.path.join(run_dir, METRICS_FILE)
+    stats_file = os.path.join(run_dir, "stats.txt")
+    layers_file = run_layers_file(run_dir)
+    if not os.path.exists(metrics_file) or os.path.getmtime(metrics_file) < os.path.getmtime(stats_file):
+        df = generate_csv(layers_file, stats_file, metrics_file)
+    else:
+        df = pd.read_csv(metrics_file)
+    # Rows follow the call log
+    df.insert(0, "Call", layer_call_numbers(layers_file, len(df)))
+    if "Source" in df.columns:
+        df = df[df["Source"] != "missing"]
+    return df
+
+
+def compare_runs(replay, full, calls=None):
+    """One row per call simulated in both runs, with both runs' metrics and their errors."""
+    metrics = [m for m in RELATIVE_METRICS + ABSOLUTE_METRICS if m in replay.columns and m in full.columns]
+    df = full[["Call", "Layer", "M", "N", "K"] + metrics].merge(
+        replay[["Call", "M", "N", "K"] + metrics], on="Call", suffixes=(" (full)", " (replay)")
+    )
+    if calls:
+        df = df[df["Call"].isin(calls)]
+    shape_full, shape_replay = (df[[f"{d} ({run})" for d in "MNK"]].to_numpy() for run in ("full", "replay"))
+    mismatched = (shape_full != shape_replay).any(axis=1)
+    if mismatched.any():
+        print(f"Warning: {mismatched.sum()} calls have a different shape in the two runs and are left out.")
+    df = df[~mismatched].drop(columns=[f"{d} (replay)" for d in "MNK"])
+    df = df.rename(columns={f"{d} (full)": d for d in "MNK"}).reset_index(drop=True)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for metric in metrics:
+            full_values, replay_values = df[f"{metric} (full)"], df[f"{metric} (replay)"]
+            if metric in ABSOLUTE_METRICS:
+                df[f"{metric} Difference"] = replay_values - full_values
+            else:
+                df[f"{metric} Error [%]"] = 100.0 * (replay_values - full_values) / full_values.where(full_values != 0)
+    return df
+
+
+def summarize(df, tolerance):
+    """Print the mean and worst error per metric; returns whether the checked metrics are within tolerance."""
+    ok = True
+    for column in [c for c in df.columns if c.endswith((" Error [%]", " Difference"))]:
+        errors = df[column].abs()
+        worst = errors.idxmax() if errors.notna().any() else None
+        line = f"{column}: mean {errors.mean():.3g}, max {errors.max():.3g}"
+        if worst is not None:
+            line += f" ({df.at[worst, 'Layer']}, call {df.at[worst, 'Call']})"
+        metric = column[:-len(" Error [%]")] if column.endswith(" Error [%]") else None
+        if metric in CHECKED_METRICS and errors.max() > 100.0 * tolerance:
+            ok = False
+            line += " FAILED"
+        print(line)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a gemm_replay run with the full-network run it replays.")
+    parser.add_argument("replay_dir", help="output directory of the generic_cpu_config.py --replay run")
+    parser.add_argument("full_dir", help="output directory of the full-network run")
+    parser.add_argument("--calls", help="compare only these call numbers, e.g. 3,7,12 (default: every common call)")
+    parser.add_argument("--tolerance", type=float, default=0.05,
+                        help="largest relative runtime and CPI error accepted (default: 0.05)")
+    parser.add_argument("--output", help=f"comparison CSV (default: REPLAY_DIR/{CHECK_FILE})")
+    args = parser.parse_args()
+
+    calls = [int(call) for call in args.calls.split(",")] if args.calls else None
+    df = compare_runs(run_metrics(args.replay_dir), run_metrics(args.full_dir), calls)
+    if df.empty:
+        print("No GEMM calls were simulated in both runs.")
+        sys.exit(1)
+    output = args.output or os.path.join(args.replay_dir, CHECK_FILE)
+    df.to_csv(output, index=False)
+    print(f"Compared {len(df)} GEMM calls; comparison saved to {output}")
+    sys.exit(0 if summarize(df, args.tolerance) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Roofline analysis of GEMM layers from gemm_metrics.csv.
+
+Derives a compute ceiling (clock x cores x SIMD lanes x FP pipes x FMA) and
+a DRAM bandwidth ceiling (gem5 DRAM model) from each run's hardware
+description in cpuconf/hw/, places every GEMM layer on its roofline and
+classifies it as memory- or compute-bound. Works on a single run's
+gemm_metrics.csv (with --hw) or on the all_gemm_metrics.csv written by
+process.py --batch, whose config column selects the description per row.
+
+Usage:
+    python3 roofline.py all_gemm_metrics.csv --plot-dir roofline/
+    python3 roofline.py gemm_metrics.csv --hw IntelCorei7_11370H
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "cpuconf"))
+
+from hwdesc import load_hardware, order_clusters, peak_bandwidth, peak_flops, total_cores
+
+ROOFLINE_COLUMNS = (
+    "Roofline OI [FLOP/B]",
+    "Achieved [GFLOP/s]",
+    "Peak Compute [GFLOP/s]",
+    "Peak Bandwidth [GB/s]",
+    "Ridge Point [FLOP/B]",
+    "Attainable [GFLOP/s]",
+    "Bound",
+    "Efficiency [%]",
+    "Gap [GFLOP/s]",
+)
+
+
+def row_threads(df, hardware):
+    """Threads each row ran with.
+
+    Uses a Threads column when present, otherwise every core for OpenMP
+    runs and a single thread for everything else (the default build).
+    """
+    if "Threads" in df.columns:
+        return df["Threads"].fillna(1).clip(lower=1).astype(int).to_numpy()
+    threads = np.ones(len(df), dtype=int)
+    if "threading" in df.columns:
+        for i, (threading, hw) in enumerate(zip(df["threading"], hardware)):
+            if threading == "openmp" and hw is not None:
+                threads[i] = total_cores(hw)
+    return threads
+
+
+def row_hardware(df, default_hw=None):
+    """Hardware description for every row, from its config column or `default_hw`."""
+    cache = {}
+
+    def lookup(name):
+        if name not in cache:
+            try:
+                cache[name] = load_hardware(name)
+            except (OSError, ValueError):
+                print(f"Warning: no hardware description for config {name!r}; using --hw")
+                cache[name] = None
+        return cache[name]
+
+    default = load_hardware(default_hw) if default_hw else None
+    if "config" not in df.columns:
+        return [default] * len(df)
+    return [(lookup(name) if isinstance(name, str) and name else None) or default for name in df["config"]]
+
+
+def compute_roofline(df, default_hw=None, flops="algorithmic"):
+    """Add roofline columns to a gemm_metrics DataFrame.
+
+    flops="algorithmic" counts 2*M*N*K per layer; "measured" uses the
+    MaxFLOPS column derived from gem5's FP instruction counters. DRAM
+    traffic is Memory Bandwidth x runtime. Rows without a hardware
+    description get NaN ceilings.
+    """
+    df = df.copy()
+    hardware = row_hardware(df, default_hw)
+    threads = row_threads(df, hardware)
+
+    # Threads fill the clusters in placement order (see hwdesc.order_clusters)
+    placements = df["placement"].fillna("").astype(str) if "placement" in df.columns else [""] * len(df)
+
+    # Ceilings are per (description, threads, placement), so compute each once
+    ceilings = {}
+    peak_compute = np.full(len(df), np.nan)
+    peak_bw = np.full(len(df), np.nan)
+    for i, (hw, n, placement) in enumerate(zip(hardware, threads, placements)):
+        if hw is None:
+            continue
+        key = (hw["name"], n, placement)
+        if key not in ceilings:
+            placed = order_clusters(hw, placement.split(",")) if placement else hw
+            ceilings[key] = (peak_flops(placed, n), peak_bandwidth(hw))
+        peak_compute[i], peak_bw[i] = ceilings[key]
+
+    runtime = df["Mean Runtime (RDTSC) [s]"].to_numpy(dtype=float)
+    if flops == "measured":
+        layer_flops = df["MaxFLOPS"].to_numpy(dtype=float)
+    else:
+        layer_flops = 2.0 * df["M"].to_numpy(dtype=float) * df["N"].to_numpy(dtype=float) * df["K"].to_numpy(dtype=float)
+    dram_bytes = df["Memory Bandwidth [MB/s]"].to_numpy(dtype=float) * 1e6 * runtime
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        intensity = np.where(dram_bytes > 0, layer_flops / dram_bytes, np.inf)
+        achieved = np.where(runtime > 0, layer_flops / runtime, np.nan)
+        memory_roof = intensity * peak_bw
+        attainable = np.minimum(peak_compute, memory_roof)
+        efficiency = 100.0 * achieved / attainable
+
+    bound = np.where(np.isnan(attainable), "", np.where(memory_roof < peak_compute, "memory", "compute"))
+
+    df["Roofline OI [FLOP/B]"] = intensity
+    df["Achieved [GFLOP/s]"] = achieved / 1e9
+    df["Peak Compute [GFLOP/s]"] = peak_compute / 1e9
+    df["Peak Bandwidth [GB/s]"] = peak_bw / 1e9
+    df["Ridge Point [FLOP/B]"] = peak_compute / peak_bw
+    df["Attainable [GFLOP/s]"] = attainable / 1e9
+    df["Bound"] = bound
+    df["Efficiency [%]"] = efficiency
+    df["Gap [GFLOP/s]"] = (attainable - achieved) / 1e9
+    return df
+
+
+def plot_roofline(df, plot_dir):
+    """Write one roofline plot per config (and thread count) into plot_dir."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    os.makedirs(plot_dir, exist_ok=True)
+    config = df["config"].fillna("") if "config" in df.columns else pd.Series([""] * len(df), index=df.index)
+    groups = df.assign(_config=config.replace("", "run")).groupby(
+        ["_config", "Peak Compute [GFLOP/s]", "Peak Bandwidth [GB/s]"]
+    )
+    label_column = "gemm_method" if "gemm_method" in df.columns else None
+
+    paths = []
+    for (name, peak, bandwidth), group in groups:
+        intensity = group["Roofline OI [FLOP/B]"].replace(np.inf, np.nan)
+        finite = intensity.dropna()
+        low = min(finite.min() / 4, 0.01) if len(finite) else 0.01
+        high = max(finite.max() * 4, 100 * peak / bandwidth) if len(finite) else 100 * peak / bandwidth
+        x = np.logspace(np.log10(low), np.log10(high), 200)
+
+        fig, ax = plt.subplots(figsize=(7, 5))
+        ax.loglog(x, np.minimum(peak, x * bandwidth), color="black", label="roofline")
+        ax.axvline(peak / bandwidth, color="grey", linestyle=":", linewidth=1)
+        labels = group[label_column] if label_column else pd.Series(["layers"] * len(group), index=group.index)
+        for label, points in group.groupby(labels):
+            ax.scatter(points["Roofline OI [FLOP/B]"], points["Achieved [GFLOP/s]"], s=18, label=str(label))
+        ax.set_xlabel("Operational intensity [FLOP/byte]")
+        ax.set_ylabel("Performance [GFLOP/s]")
+        ax.set_title(f"{name}: {peak:g} GFLOP/s, {bandwidth:g} GB/s")
+        ax.legend(fontsize="small")
+        ax.grid(True, which="both", linewidth=0.3)
+
+        path = os.path.join(plot_dir, f"roofline_{name}_{peak:g}GFLOPs.png")
+        fig.savefig(path, dpi=120, bbox_inches="tight")
+        plt.close(fig)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Roofline analysis of GEMM layers in gemm_metrics.csv.")
+    parser.add_argument("metrics", help="gemm_metrics.csv or all_gemm_metrics.csv")
+    parser.add_argument("--hw", help="hardware description for rows without a known config column")
+    parser.add_argument("--flops", choices=("algorithmic", "measured"), default="algorithmic",
+                        help="2*M*N*K per layer (default) or the MaxFLOPS instruction count")
+    parser.add_argument("--output", help="output CSV (default: <metrics>_roofline.csv)")
+    parser.add_argument("--plot-dir", help="write roofline plots (needs matplotlib) to this directory")
+    args = parser.parse_args()
+
+    df = compute_roofline(pd.read_csv(args.metrics, keep_default_na=False, na_values=[""]), args.hw, args.flops)
+    output = args.output or os.path.splitext(args.metrics)[0] + "_roofline.csv"
+    df.to_csv(output, index=False)
+    print(f"Roofline CSV saved to {output}")
+
+    classified = df[df["Bound"] != ""]
+    print(f"{len(classified)} of {len(df)} layers classified: "
+          f"{(classified['Bound'] == 'memory').sum()} memory-bound, {(classified['Bound'] == 'compute').sum()} compute-bound.")
+
+    if args.plot_dir:
+        for path in plot_roofline(classified, args.plot_dir):
+            print(f"Plot saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
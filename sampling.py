@@ -0,0 +1,296 @@
+"""Sampled simulation of GEMM ROIs: SimPoint-style interval selection and reconstruction.
+
+A large layer such as (1024, 512, 512) spends a third of a simulated second
+in its ROI, which takes hours under O3. Sampling simulates a few intervals
+of each ROI in detail and estimates the rest:
+
+ 1. Profile pass, generic_cpu_config.py --bbv-interval N: everything runs on
+    AtomicSimpleCPU. gem5's SimPoint probe writes the basic-block vector of
+    every N-instruction interval to simpoint.bb.gz. roi_insts.json records
+    the instruction count at each ROI's begin and end.
+ 2. python3 sampling.py PROFILE_DIR: the intervals inside each ROI are
+    clustered on their basic-block vectors, and a few intervals per cluster
+    are picked (see select_simpoints). The result is simpoints.json.
+ 3. Detailed pass, generic_cpu_config.py --simpoints simpoints.json: the run
+    fast-forwards on AtomicSimpleCPU. For every picked interval it switches
+    to the configured cores `warmup` instructions early, then resets stats,
+    simulates the interval and dumps. samples.json lists the dumped samples
+    with the cluster sizes of their ROI.
+
+process.py reconstructs one stats row per ROI from the samples
+(reconstruct_samples). Every stat is estimated per instruction, stratified
+by cluster and scaled by the cluster's instructions. The confidence
+intervals of the ROI's runtime and CPI come from the spread of the samples
+within each cluster.
+
+Both passes run single-threaded, since instruction offsets only identify
+the same interval again in a deterministic single-thread stream. Only numpy
+is needed.
+"""
+import argparse
+import gzip
+import json
+import os
+from statistics import NormalDist
+
+import numpy as np
+
+from core_stats import aggregate_cores
+
+BBV_FILE = "simpoint.bb.gz"
+ROI_FILE = "roi_insts.json"
+SIMPOINTS_FILE = "simpoints.json"
+SAMPLES_FILE = "samples.json"
+# SimPoint defaults: random projection of the basic-block vectors to 15
+# dimensions, and the smallest k whose BIC reaches 90% of the best k's range
+PROJECTED_DIMS = 15
+MAX_CLUSTERS = 10
+BIC_THRESHOLD = 0.9
+DEFAULT_WARMUP = 1000000
+DEFAULT_PER_CLUSTER = 2
+DEFAULT_CONFIDENCE = 0.95
+
+
+def read_bbv(path):
+    """Basic-block vectors of simpoint.bb.gz as an intervals x blocks array of instruction counts."""
+    rows = []
+    block_ids = {}
+    with gzip.open(path, "rt") as file:
+        for line in file:
+            if not line.startswith("T"):
+                continue
+            row = {}
+            for field in line[1:].split():
+                _, block, count = field.split(":")
+                row[block_ids.setdefault(block, len(block_ids))] = int(count)
+            rows.append(row)
+    matrix = np.zeros((len(rows), len(block_ids)))
+    for i, row in enumerate(rows):
+        matrix[i, list(row)] = list(row.values())
+    return matrix
+
+
+def project(bbv, dims=PROJECTED_DIMS, seed=0):
+    """Normalise each vector to sum 1 and project it to `dims` random dimensions."""
+    totals = bbv.sum(axis=1, keepdims=True)
+    normalised = np.divide(bbv, totals, out=np.zeros_like(bbv), where=totals > 0)
+    projection = np.random.default_rng(seed).uniform(-1, 1, (bbv.shape[1], dims))
+    return normalised @ projection
+
+
+def kmeans(points, k, seed=0, iterations=100):
+    """k-means with k-means++ seeding; returns (labels, centers)."""
+    rng = np.random.default_rng(seed)
+    centers = points[[rng.integers(len(points))]]
+    while len(centers) < k:
+        distance = ((points[:, None, :] - centers[None]) ** 2).sum(axis=2).min(axis=1)
+        if distance.sum() == 0:
+            break
+        centers = np.vstack([centers, points[rng.choice(len(points), p=distance / distance.sum())]])
+    for _ in range(iterations):
+        labels = ((points[:, None, :] - centers[None]) ** 2).sum(axis=2).argmin(axis=1)
+        counts = np.bincount(labels, minlength=len(centers))
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, points)
+        updated = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+        if np.allclose(updated, centers):
+            break
+        centers = updated
+    return labels, centers
+
+
+def bic(points, labels, centers):
+    """Bayesian information criterion of a clustering, as in SimPoint (Pelleg and Moore's X-means)."""
+    n, d = points.shape
+    k = len(centers)
+    counts = np.bincount(labels, minlength=k)
+    distortion = ((points - centers[labels]) ** 2).sum()
+    variance = distortion / max(n - k, 1) / d
+    if variance <= 0:
+        return np.inf
+    used = counts[counts > 0]
+    likelihood = (used * np.log(used) - used * np.log(n) - used * d / 2 * np.log(2 * np.pi * variance)
+                  - (used - 1) * d / 2).sum()
+    return likelihood - k * (d + 1) / 2 * np.log(n)
+
+
+def choose_clusters(points, max_k=MAX_CLUSTERS, threshold=BIC_THRESHOLD, seed=0):
+    """Labels and centers of the smallest k whose BIC is within `threshold` of the best range."""
+    results = [kmeans(points, k, seed) for k in range(1, min(max_k, len(points)) + 1)]
+    scores = np.array([bic(points, labels, centers) for labels, centers in results])
+    if not np.isfinite(scores).all():
+        # Identical intervals: one cluster (or the first k that separates them exactly)
+        return results[int(np.argmax(scores))]
+    low, high = scores.min(), scores.max()
+    best = next(i for i, score in enumerate(scores) if high == low or (score - low) / (high - low) >= threshold)
+    return results[best]
+
+
+def select_simpoints(bbv, rois, interval, max_k=MAX_CLUSTERS, per_cluster=DEFAULT_PER_CLUSTER,
+                     warmup=DEFAULT_WARMUP, seed=0):
+    """Pick the intervals of every ROI to simulate in detail.
+
+    `rois` are roi_insts.json entries ({"call", "begin", "end"} in
+    instructions). Only intervals entirely inside a ROI are clustered; the
+    partial intervals at its edges count towards the cluster of the nearest
+    full interval. Per cluster, the interval closest to the centroid and
+    up to per_cluster - 1 random others are sampled; two or more give the
+    cluster's spread. A ROI with no full interval is simulated whole.
+    Sample offsets are instructions from the ROI's begin.
+    """
+    rng = np.random.default_rng(seed)
+    selected = []
+    for roi in rois:
+        begin, end = roi["begin"], roi["end"]
+        first, last = -(-begin // interval), end // interval  # full intervals [first, last)
+        entry = {"call": roi["call"], "insts": end - begin}
+        if last - first < 1 or last > len(bbv):
+            entry["clusters"] = [{"insts": end - begin, "intervals": 1}]
+            entry["samples"] = [{"offset": 0, "length": end - begin, "cluster": 0}]
+            selected.append(entry)
+            continue
+        points = project(bbv[first:last], seed=seed)
+        labels, centers = choose_clusters(points, max_k, seed=seed)
+        insts = np.bincount(labels, minlength=len(centers)) * float(interval)
+        insts[labels[0]] += first * interval - begin
+        insts[labels[-1]] += end - last * interval
+        clusters, samples = [], []
+        for cluster in np.unique(labels):
+            members = np.flatnonzero(labels == cluster)
+            nearest = members[((points[members] - centers[cluster]) ** 2).sum(axis=1).argmin()]
+            others = rng.permutation(members[members != nearest])[:max(per_cluster - 1, 0)]
+            clusters.append({"insts": int(insts[cluster]), "intervals": int(len(members))})
+            for index in sorted([nearest, *others]):
+                samples.append({"offset": int((first + index) * interval - begin), "length": int(interval),
+                                "cluster": len(clusters) - 1})
+        entry["clusters"] = clusters
+        entry["samples"] = sorted(samples, key=lambda sample: sample["offset"])
+        selected.append(entry)
+    return {"interval": interval, "warmup": warmup, "rois": selected}
+
+
+def stratified_total(per_inst, cluster, weights, sizes):
+    """Stratified estimate of a ROI total from per-instruction sample values, and its variance.
+
+    per_inst is samples x stats, cluster the cluster index of each sample,
+    weights the instructions and sizes the intervals of each cluster. A
+    cluster with a single sample takes the mean relative variance of the
+    clusters with more. Clusters without a sample are left out and the rest
+    scaled up to the ROI's instructions.
+    """
+    k = len(weights)
+    counts = np.bincount(cluster, minlength=k).astype(float)
+    sums = np.zeros((k, per_inst.shape[1]))
+    np.add.at(sums, cluster, per_inst)
+    means = sums / np.maximum(counts, 1)[:, None]
+    squares = np.zeros_like(sums)
+    np.add.at(squares, cluster, (per_inst - means[cluster]) ** 2)
+    spread = counts > 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variance = squares / (counts - 1)[:, None]
+        relative = np.where(means != 0, variance / means ** 2, 0.0)
+        pooled = relative[spread].mean(axis=0) if spread.any() else np.full(per_inst.shape[1], np.nan)
+    variance = np.where(spread[:, None], variance, pooled * means ** 2)
+    finite = 1 - np.minimum(counts, sizes) / sizes  # finite population correction
+    sampled = counts > 0
+    scale = weights.sum() / weights[sampled].sum()
+    total = scale * (weights[sampled, None] * means[sampled]).sum(axis=0)
+    # Clusters simulated in full contribute no variance
+    terms = weights[sampled, None] ** 2 * variance[sampled] * (finite[sampled] / counts[sampled])[:, None]
+    var = scale ** 2 * np.where(finite[sampled, None] > 0, terms, 0.0).sum(axis=0)
+    return total, var
+
+
+def reconstruct_samples(values, columns, samples, confidence=DEFAULT_CONFIDENCE):
+    """One estimated stats row per ROI from the stats blocks of its samples.
+
+    `values`/`columns` are the stats matrix of the detailed pass, with one
+    block per sample in samples["samples"] order, and `samples` is the
+    content of samples.json. Counts are estimated per instruction and
+    stratified by cluster. CPI is weighted by instructions, bandwidth by
+    simulated time, and clocks are taken as they are. Returns (values,
+    calls, runtime_ci, cpi_ci): one row per ROI with samples, the ROIs'
+    call numbers, and the half-widths of the confidence intervals of each
+    ROI's simSeconds and system CPI (core_stats.aggregate_cores).
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    blocks = samples["samples"][:values.shape[0]]
+    seconds_idx = columns.get("simSeconds")
+    cpi_idx = [idx for name, idx in columns.items() if name.endswith(".cpi")]
+    bandwidth_idx = [idx for name, idx in columns.items() if name.endswith(("avgRdBWSys", "avgWrBWSys"))]
+    clock_idx = [idx for name, idx in columns.items() if name.endswith(".clock")]
+    rows, calls, runtime_ci, cpi_ci = [], [], [], []
+    for roi in samples["rois"]:
+        own = [i for i, block in enumerate(blocks) if block["call"] == roi["call"]]
+        if not own:
+            continue
+        block_values = np.nan_to_num(values[own])
+        lengths = np.array([blocks[i]["insts"] for i in own], dtype=float)
+        seconds = block_values[:, seconds_idx] if seconds_idx is not None else np.zeros(len(own))
+        # Per instruction: counts divided by the sample length, CPI as it
+        # is (cycles per instruction) and bandwidth times time (bytes)
+        per_inst = block_values / lengths[:, None]
+        per_inst[:, cpi_idx] = block_values[:, cpi_idx]
+        per_inst[:, bandwidth_idx] = block_values[:, bandwidth_idx] * (seconds / lengths)[:, None]
+        # The system CPI of each sample, weighted by instructions like the cpi stats
+        system_cpi = np.nan_to_num(aggregate_cores(block_values, columns)[0]["cpi"])
+        per_inst = np.column_stack([per_inst, system_cpi])
+        weights = np.array([cluster["insts"] for cluster in roi["clusters"]], dtype=float)
+        sizes = np.array([cluster["intervals"] for cluster in roi["clusters"]], dtype=float)
+        cluster = np.array([blocks[i]["cluster"] for i in own])
+        row, variance = stratified_total(per_inst, cluster, weights, sizes)
+        row, cpi_variance = row[:-1], variance[-1]
+
+        row[cpi_idx] /= weights.sum()
+        if seconds_idx is not None and row[seconds_idx] > 0:
+            row[bandwidth_idx] /= row[seconds_idx]
+        row[clock_idx] = block_values[0, clock_idx]
+        rows.append(row)
+        calls.append(roi["call"])
+        runtime_ci.append(z * np.sqrt(variance[seconds_idx]) if seconds_idx is not None else np.nan)
+        cpi_ci.append(z * np.sqrt(cpi_variance) / weights.sum())
+    return np.array(rows).reshape(len(rows), values.shape[1]), calls, np.array(runtime_ci), np.array(cpi_ci)
+
+
+def read_samples(run_dir):
+    """samples.json of a sampled detailed pass, or None."""
+    path = os.path.join(run_dir, SAMPLES_FILE)
+    return load_json(path) if os.path.exists(path) else None
+
+
+def load_json(path):
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pick the GEMM ROI intervals to simulate in detail from a profile pass.")
+    parser.add_argument("profile_dir", help=f"output directory of the --bbv-interval pass ({BBV_FILE}, {ROI_FILE})")
+    parser.add_argument("--max-k", type=int, default=MAX_CLUSTERS, help=f"most clusters per ROI (default: {MAX_CLUSTERS})")
+    parser.add_argument("--per-cluster", type=int, default=DEFAULT_PER_CLUSTER,
+                        help=f"intervals simulated per cluster; 2 or more give confidence intervals "
+                             f"(default: {DEFAULT_PER_CLUSTER})")
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP,
+                        help=f"detailed warm-up instructions before each interval (default: {DEFAULT_WARMUP})")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the projection, k-means and random picks")
+    parser.add_argument("--output", help=f"output file (default: PROFILE_DIR/{SIMPOINTS_FILE})")
+    args = parser.parse_args()
+
+    roi_log = load_json(os.path.join(args.profile_dir, ROI_FILE))
+    bbv = read_bbv(os.path.join(args.profile_dir, BBV_FILE))
+    simpoints = select_simpoints(bbv, roi_log["rois"], roi_log["interval"], args.max_k, args.per_cluster,
+                                 args.warmup, args.seed)
+    output = args.output or os.path.join(args.profile_dir, SIMPOINTS_FILE)
+    with open(output, "w") as file:
+        json.dump(simpoints, file, indent=4)
+
+    total = sum(roi["insts"] for roi in simpoints["rois"])
+    detailed = sum(sample["length"] + simpoints["warmup"] for roi in simpoints["rois"] for sample in roi["samples"])
+    print(f"{len(simpoints['rois'])} ROIs, {len(bbv)} intervals of {roi_log['interval']} instructions: "
+          f"{sum(len(roi['samples']) for roi in simpoints['rois'])} samples, "
+          f"{100.0 * min(detailed, total) / max(total, 1):.1f}% of the ROI instructions simulated in detail")
+    print(f"Simpoints saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
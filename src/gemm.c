@@ -4,9 +4,290 @@
 #include <stdlib.h>
 #include <stdio.h>
 #include <math.h>
+#include <string.h>
+#include <strings.h>
+#include <stdint.h>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+#ifdef GEMM_NO_M5
+// Host builds (gemm_bench) run the same kernels with the gem5 ops compiled out
+#define m5_checkpoint(delay, period)
+#define m5_reset_stats(delay, period)
+#define m5_dump_stats(delay, period)
+#define m5_exit(delay)
+#define m5_work_begin(workid, threadid)
+#define m5_work_end(workid, threadid)
+#else
 #include "gem5/m5ops.h"
+#endif
 
 static int gemm_counter = 0;
+static int gemm_layer = -1;
+static int gemm_verbose = -1; // GEMM_VERBOSE=1 restores the per-call printf lines
+
+// Open `name` in GEMM_LOG_DIR (or the working directory if it is unset)
+static FILE *open_log_file(const char *name, const char *mode)
+{
+    const char *log_dir = getenv("GEMM_LOG_DIR");
+    char path[4096];
+    snprintf(path, sizeof(path), "%s%s%s", log_dir ? log_dir : "", log_dir ? "/" : "", name);
+    FILE *fp = fopen(path, mode);
+    if (!fp) fprintf(stderr, "gemm: cannot write %s\n", path);
+    return fp;
+}
+
+// Binary call log, GEMM_LOG_DIR/gemm_calls.bin: a 16-byte header (magic
+// "GEMMCALL", uint32 version, uint32 record size) followed by one
+// fixed-size little-endian record per gemm_cpu call. Records are buffered
+// and written in bulk, and always before a profiled region starts, so the
+// log costs no simulated I/O inside the ROI. process.py reads it with a
+// matching numpy dtype (GEMM_CALL_DTYPE).
+#define CALL_LOG_VERSION 1
+#define CALL_LOG_BUFFER 256
+typedef struct {
+    int32_t call, layer, ta, tb;
+    int32_t m, n, k, lda, ldb, ldc;
+    float alpha, beta;
+} gemm_call_record;
+static gemm_call_record call_log_buffer[CALL_LOG_BUFFER];
+static int num_buffered_calls = 0;
+static FILE *call_log = NULL;
+static int call_log_opened = 0;
+
+static void flush_call_log(void)
+{
+    if (call_log && num_buffered_calls) {
+        fwrite(call_log_buffer, sizeof(gemm_call_record), num_buffered_calls, call_log);
+        fflush(call_log);
+    }
+    num_buffered_calls = 0;
+}
+
+static void open_call_log(void)
+{
+    call_log_opened = 1;
+    call_log = open_log_file("gemm_calls.bin", "wb");
+    if (!call_log) return;
+    uint32_t header[2] = {CALL_LOG_VERSION, sizeof(gemm_call_record)};
+    fwrite("GEMMCALL", 1, 8, call_log);
+    fwrite(header, sizeof(header), 1, call_log);
+    atexit(flush_call_log);
+}
+
+static void log_gemm_call(int TA, int TB, int M, int N, int K, float ALPHA, int lda, int ldb, float BETA, int ldc)
+{
+    if (!call_log_opened) open_call_log();
+    gemm_call_record *r = &call_log_buffer[num_buffered_calls++];
+    r->call = gemm_counter;
+    r->layer = gemm_layer;
+    r->ta = TA;
+    r->tb = TB;
+    r->m = M;
+    r->n = N;
+    r->k = K;
+    r->lda = lda;
+    r->ldb = ldb;
+    r->ldc = ldc;
+    r->alpha = ALPHA;
+    r->beta = BETA;
+    if (num_buffered_calls == CALL_LOG_BUFFER) flush_call_log();
+}
+
+// The first GEMM call ends the network's start-up (weights, image, layer
+// setup), which is the same for every design point: gem5 checkpoints here
+// once per workload and later runs restore the checkpoint (see
+// cpuconf/ckptstore.py). Everything the call log, method selection and
+// profiling read is read lazily after this point. The environment is part
+// of the checkpointed memory, so a restored run gets its own GEMM_* and
+// OMP_* settings from the KEY=VALUE lines of the file named by GEMM_ENV_FILE.
+static int gemm_started = 0;
+
+static void load_env_file(const char *path)
+{
+    char line[4096];
+    if (!path || !*path) return;
+    FILE *fp = fopen(path, "r");
+    if (!fp) {
+        fprintf(stderr, "GEMM_ENV_FILE: cannot open %s\n", path);
+        return;
+    }
+    while (fgets(line, sizeof(line), fp)) {
+        char *value = strchr(line, '=');
+        line[strcspn(line, "\r\n")] = '\0';
+        if (!value || value == line) continue;
+        *value++ = '\0';
+        setenv(line, value, 1);
+    }
+    fclose(fp);
+}
+
+static void gemm_start(void)
+{
+    gemm_started = 1;
+    m5_checkpoint(0, 0);
+    load_env_file(getenv("GEMM_ENV_FILE"));
+}
+
+// Darknet can tag the following GEMM calls with its layer index
+void gemm_log_set_layer(int layer)
+{
+    gemm_layer = layer;
+}
+
+// The replay driver (gemm_replay.c) gives each call the number it had in
+// the run it replays, so the call log and GEMM_PROFILE=list: match that run
+void gemm_log_set_call(int call)
+{
+    gemm_counter = call - 1;
+}
+
+// Shapes listed in the file named by GEMM_SKIP_SHAPES ("M N K" per line) are
+// already characterised in the memo and run without gem5 profiling
+#define MAX_SKIP_SHAPES 4096
+static int skip_shapes[MAX_SKIP_SHAPES][3];
+static int num_skip_shapes = -1; // -1 until the file has been read
+
+static void load_skip_shapes(void)
+{
+    num_skip_shapes = 0;
+    const char *path = getenv("GEMM_SKIP_SHAPES");
+    if (!path || !*path) return;
+    FILE *fp = fopen(path, "r");
+    if (!fp) {
+        fprintf(stderr, "GEMM_SKIP_SHAPES: cannot open %s\n", path);
+        return;
+    }
+    int m, n, k;
+    while (num_skip_shapes < MAX_SKIP_SHAPES && fscanf(fp, "%d %d %d", &m, &n, &k) == 3) {
+        skip_shapes[num_skip_shapes][0] = m;
+        skip_shapes[num_skip_shapes][1] = n;
+        skip_shapes[num_skip_shapes][2] = k;
+        num_skip_shapes++;
+    }
+    fclose(fp);
+    printf("GEMM_SKIP_SHAPES: %d memoised shapes will not be profiled\n", num_skip_shapes);
+}
+
+static int is_skipped_shape(int M, int N, int K)
+{
+    int s;
+    if (num_skip_shapes < 0) load_skip_shapes();
+    for (s = 0; s < num_skip_shapes; ++s) {
+        if (skip_shapes[s][0] == M && skip_shapes[s][1] == N && skip_shapes[s][2] == K) return 1;
+    }
+    return 0;
+}
+
+// Which GEMM calls are profiled, from GEMM_PROFILE or the first line of
+// the file named by GEMM_PROFILE_FILE, read once at the first call:
+//   first       profile and m5_exit at the first call (default)
+//   all         profile every call
+//   every:N     profile calls N, 2N, 3N, ...
+//   list:A,B,.. profile the listed call numbers
+//   unique      profile the first call of every (M, N, K) shape
+// Except for "first", the simulation continues after each profiled call and
+// every profiled call is appended to GEMM_LOG_DIR/gemm_profile.txt as
+// "call M N K", one line per stats dump. Calls that are not profiled run
+// without stats resets or exits.
+//
+// GEMM_SAMPLED=1 leaves the stats to gem5: profiled calls are only marked
+// as work items, and generic_cpu_config.py --bbv-interval/--simpoints reset
+// and dump the stats around the intervals it samples (see sampling.py).
+enum { PROFILE_FIRST, PROFILE_ALL, PROFILE_EVERY, PROFILE_LIST, PROFILE_UNIQUE };
+static int profile_mode = -1; // -1 until the control has been read
+static int profile_every = 1;
+static int *profile_calls = NULL;
+static int num_profile_calls = 0;
+static int (*seen_shapes)[3] = NULL;
+static int num_seen_shapes = 0;
+static FILE *profile_log = NULL;
+static int roi_stats = 1;
+
+static void parse_profile_control(const char *control)
+{
+    profile_mode = PROFILE_FIRST;
+    if (!control || !*control || !strcmp(control, "first")) return;
+
+    if (!strcmp(control, "all")) {
+        profile_mode = PROFILE_ALL;
+    } else if (!strcmp(control, "unique")) {
+        profile_mode = PROFILE_UNIQUE;
+    } else if (!strncmp(control, "every:", 6) && atoi(control + 6) > 0) {
+        profile_mode = PROFILE_EVERY;
+        profile_every = atoi(control + 6);
+    } else if (!strncmp(control, "list:", 5)) {
+        const char *p = control + 5;
+        profile_mode = PROFILE_LIST;
+        while (*p) {
+            char *end;
+            long call = strtol(p, &end, 10);
+            if (end == p) break;
+            profile_calls = realloc(profile_calls, (num_profile_calls + 1) * sizeof(int));
+            profile_calls[num_profile_calls++] = (int)call;
+            p = (*end == ',') ? end + 1 : end;
+        }
+    } else {
+        fprintf(stderr, "GEMM_PROFILE: unknown control '%s', profiling the first call only\n", control);
+        return;
+    }
+
+    profile_log = open_log_file("gemm_profile.txt", "w");
+    printf("GEMM_PROFILE: %s\n", control);
+}
+
+static void load_profile_control(void)
+{
+    const char *control = getenv("GEMM_PROFILE");
+    const char *path = getenv("GEMM_PROFILE_FILE");
+    const char *sampled = getenv("GEMM_SAMPLED");
+    char line[4096] = "";
+    roi_stats = !(sampled && atoi(sampled));
+    if ((!control || !*control) && path && *path) {
+        FILE *fp = fopen(path, "r");
+        if (fp) {
+            if (fgets(line, sizeof(line), fp)) line[strcspn(line, " \r\n")] = '\0';
+            fclose(fp);
+        } else {
+            fprintf(stderr, "GEMM_PROFILE_FILE: cannot open %s\n", path);
+        }
+        control = line;
+    }
+    parse_profile_control(control);
+}
+
+static int first_seen_shape(int M, int N, int K)
+{
+    int s;
+    for (s = 0; s < num_seen_shapes; ++s) {
+        if (seen_shapes[s][0] == M && seen_shapes[s][1] == N && seen_shapes[s][2] == K) return 0;
+    }
+    seen_shapes = realloc(seen_shapes, (num_seen_shapes + 1) * sizeof(*seen_shapes));
+    seen_shapes[num_seen_shapes][0] = M;
+    seen_shapes[num_seen_shapes][1] = N;
+    seen_shapes[num_seen_shapes][2] = K;
+    num_seen_shapes++;
+    return 1;
+}
+
+static int selected_for_profiling(int call, int M, int N, int K)
+{
+    int c;
+    if (profile_mode < 0) load_profile_control();
+    switch (profile_mode) {
+    case PROFILE_EVERY:
+        return call % profile_every == 0;
+    case PROFILE_LIST:
+        for (c = 0; c < num_profile_calls; ++c) {
+            if (profile_calls[c] == call) return 1;
+        }
+        return 0;
+    case PROFILE_UNIQUE:
+        return first_seen_shape(M, N, K);
+    default:
+        return 1;
+    }
+}
 
 void gemm(int TA, int TB, int M, int N, int K, float ALPHA, 
         float *A, int lda, 
@@ -17,23 +298,72 @@ void gemm(int TA, int TB, int M, int N, int K, float ALPHA,
     gemm_cpu( TA,  TB,  M, N, K, ALPHA,A,lda, B, ldb,BETA,C,ldc);
 }
 
-void gemm_nn(int M, int N, int K, float ALPHA, 
-        float *A, int lda, 
+// GEMM kernels, computing C = ALPHA * A * B + BETA * C. All of them are
+// compiled in; gemm_nn dispatches to one per call through gemm_kernels[].
+// Each kernel scales a row or tile of C by BETA just before its first K
+// update, while it is in cache, so C is streamed once per call.
+//
+// The cache blocking is read once, with the method selection:
+//   GEMM_BLOCK_SIZE=56                tile of the tiled kernel
+//   GEMM_PACKED_BLOCKS=120,256,2048   MC,KC,NC of the packed kernel
+// autotune.py derives both per hardware description and stores them in
+// cpuconf/tuning.json, and generic_cpu_config.py passes them in.
+typedef void (*gemm_kernel)(int M, int N, int K, float ALPHA,
+        float *A, int lda,
         float *B, int ldb,
+        float BETA,
+        float *C, int ldc);
+
+// c[0..n) *= BETA; nothing to do for darknet's usual BETA = 1
+static void scale_c(float *c, int n, float BETA)
+{
+    int j;
+    if (BETA == 1) return;
+    for (j = 0; j < n; ++j) c[j] *= BETA;
+}
+
+// Default GEMM_NN implementation
+static void gemm_nn_basic(int M, int N, int K, float ALPHA,
+        float *A, int lda,
+        float *B, int ldb,
+        float BETA,
         float *C, int ldc)
 {
-    m5_checkpoint(0, 0);
-    m5_reset_stats(0, 0); 
-    
-    int i, j, k; // Common variables used across implementations
+    int i, j, k;
+    #pragma omp parallel for schedule(runtime) private(j, k)
+    for (i = 0; i < M; ++i) {
+        scale_c(C + i * ldc, N, BETA);
+        for (k = 0; k < K; ++k) {
+            register float A_PART = ALPHA * A[i * lda + k];
+            for (j = 0; j < N; ++j) {
+                C[i * ldc + j] += A_PART * B[k * ldb + j];
+            }
+        }
+    }
+}
 
-    #ifdef GEMM_TILED
+#ifndef GEMM_BLOCK_SIZE
+#define GEMM_BLOCK_SIZE 64
+#endif
+static int tile_size = GEMM_BLOCK_SIZE;
+
+static void gemm_nn_tiled(int M, int N, int K, float ALPHA,
+        float *A, int lda,
+        float *B, int ldb,
+        float BETA,
+        float *C, int ldc)
+{
+    int i, j, k;
     int ii, jj, kk; // Variables for Tiled GEMM
-    const int BLOCK_SIZE = 64; // Block size specific to Tiled GEMM
-    #pragma omp parallel for collapse(2) private(ii, jj, kk, i, j, k)
+    const int BLOCK_SIZE = tile_size; // GEMM_BLOCK_SIZE
+    // Threads split C blocks (ii, jj); splitting kk would race on C
+    #pragma omp parallel for schedule(runtime) collapse(2) private(ii, jj, kk, i, j, k)
     for (ii = 0; ii < M; ii += BLOCK_SIZE) {
-        for (kk = 0; kk < K; kk += BLOCK_SIZE) {
-            for (jj = 0; jj < N; jj += BLOCK_SIZE) {
+        for (jj = 0; jj < N; jj += BLOCK_SIZE) {
+            for (i = ii; i < ii + BLOCK_SIZE && i < M; ++i) {
+                scale_c(C + i * ldc + jj, N - jj < BLOCK_SIZE ? N - jj : BLOCK_SIZE, BETA);
+            }
+            for (kk = 0; kk < K; kk += BLOCK_SIZE) {
                 for (i = ii; i < ii + BLOCK_SIZE && i < M; ++i) {
                     for (k = kk; k < kk + BLOCK_SIZE && k < K; ++k) {
                         register float A_PART = ALPHA * A[i * lda + k];
@@ -45,10 +375,19 @@ void gemm_nn(int M, int N, int K, float ALPHA,
             }
         }
     }
-    #elif defined(GEMM_OPTIMIZED)
+}
+
+static void gemm_nn_optimized(int M, int N, int K, float ALPHA,
+        float *A, int lda,
+        float *B, int ldb,
+        float BETA,
+        float *C, int ldc)
+{
+    int i, j, k;
     const int UNROLL_FACTOR = 4; // Unrolling factor specific to Optimized GEMM
-    #pragma omp parallel for private(i, j, k)
+    #pragma omp parallel for schedule(runtime) private(i, j, k)
     for (i = 0; i < M; ++i) {
+        scale_c(C + i * ldc, N, BETA);
         for (k = 0; k < K; ++k) {
             register float A_PART = ALPHA * A[i * lda + k];
             for (j = 0; j < N; j += UNROLL_FACTOR) {
@@ -60,44 +399,539 @@ void gemm_nn(int M, int N, int K, float ALPHA,
             }
         }
     }
-    #else
-    // Default GEMM_NN implementation
-    #pragma omp parallel for
+}
+
+// Packed-panel GEMM in the style of BLIS/GotoBLAS. C is updated in
+// GEMM_NC-wide column panels, GEMM_KC-deep rank-k steps and GEMM_MC-tall row
+// blocks. For each step the B panel (KC x NC) and the A block (MC x KC) are
+// copied into contiguous, aligned micro-panels of GEMM_NR columns and
+// GEMM_MR rows, so the micro-kernel reads both with unit stride and keeps
+// its MR x NR block of C in vector registers for the whole KC loop. ALPHA
+// is folded into the packed A. GEMM_PACKED_BLOCKS overrides the defaults
+// below; MC is rounded down to a multiple of MR and NC to one of NR.
+#ifndef GEMM_MC
+#define GEMM_MC 120
+#endif
+#ifndef GEMM_KC
+#define GEMM_KC 256
+#endif
+#ifndef GEMM_NC
+#define GEMM_NC 2048
+#endif
+
+// Micro-kernel register block for the instruction set the file is built for.
+// gem5's x86 CPU models implement SSE but not AVX, so the default -Ofast
+// build uses the SSE kernel; the AVX2 kernel needs -mavx2 -mfma (host only).
+#if defined(__AVX2__) && defined(__FMA__)
+#include <immintrin.h>
+#define GEMM_MR 6
+#define GEMM_NR 16
+#elif defined(__SSE__)
+#include <xmmintrin.h>
+#define GEMM_MR 4
+#define GEMM_NR 8
+#elif defined(__ARM_NEON)
+#include <arm_neon.h>
+#define GEMM_MR 4
+#define GEMM_NR 8
+#else
+#define GEMM_MR 4
+#define GEMM_NR 4
+#endif
+
+static int block_mc = GEMM_MC, block_kc = GEMM_KC, block_nc = GEMM_NC;
+
+// c[MR x NR] = beta * c + a[MR micro-panel] * b[NR micro-panel] over kc steps
+static void gemm_micro_kernel(int kc, const float *a, const float *b, float beta, float *c, int ldc)
+{
+    int i, p;
+#if defined(__AVX2__) && defined(__FMA__)
+    __m256 acc[GEMM_MR][2];
+    for (i = 0; i < GEMM_MR; ++i) acc[i][0] = acc[i][1] = _mm256_setzero_ps();
+    for (p = 0; p < kc; ++p, a += GEMM_MR, b += GEMM_NR) {
+        __m256 b0 = _mm256_load_ps(b), b1 = _mm256_load_ps(b + 8);
+        for (i = 0; i < GEMM_MR; ++i) {
+            __m256 ai = _mm256_broadcast_ss(a + i);
+            acc[i][0] = _mm256_fmadd_ps(ai, b0, acc[i][0]);
+            acc[i][1] = _mm256_fmadd_ps(ai, b1, acc[i][1]);
+        }
+    }
+    for (i = 0; i < GEMM_MR; ++i) {
+        __m256 c0 = _mm256_loadu_ps(c + i * ldc), c1 = _mm256_loadu_ps(c + i * ldc + 8);
+        if (beta != 1) {
+            c0 = _mm256_mul_ps(c0, _mm256_set1_ps(beta));
+            c1 = _mm256_mul_ps(c1, _mm256_set1_ps(beta));
+        }
+        _mm256_storeu_ps(c + i * ldc, _mm256_add_ps(c0, acc[i][0]));
+        _mm256_storeu_ps(c + i * ldc + 8, _mm256_add_ps(c1, acc[i][1]));
+    }
+#elif defined(__SSE__)
+    __m128 acc[GEMM_MR][2];
+    for (i = 0; i < GEMM_MR; ++i) acc[i][0] = acc[i][1] = _mm_setzero_ps();
+    for (p = 0; p < kc; ++p, a += GEMM_MR, b += GEMM_NR) {
+        __m128 b0 = _mm_load_ps(b), b1 = _mm_load_ps(b + 4);
+        for (i = 0; i < GEMM_MR; ++i) {
+            __m128 ai = _mm_set1_ps(a[i]);
+            acc[i][0] = _mm_add_ps(acc[i][0], _mm_mul_ps(ai, b0));
+            acc[i][1] = _mm_add_ps(acc[i][1], _mm_mul_ps(ai, b1));
+        }
+    }
+    for (i = 0; i < GEMM_MR; ++i) {
+        __m128 c0 = _mm_loadu_ps(c + i * ldc), c1 = _mm_loadu_ps(c + i * ldc + 4);
+        if (beta != 1) {
+            c0 = _mm_mul_ps(c0, _mm_set1_ps(beta));
+            c1 = _mm_mul_ps(c1, _mm_set1_ps(beta));
+        }
+        _mm_storeu_ps(c + i * ldc, _mm_add_ps(c0, acc[i][0]));
+        _mm_storeu_ps(c + i * ldc + 4, _mm_add_ps(c1, acc[i][1]));
+    }
+#elif defined(__ARM_NEON)
+    float32x4_t acc[GEMM_MR][2];
+    for (i = 0; i < GEMM_MR; ++i) acc[i][0] = acc[i][1] = vdupq_n_f32(0.0f);
+    for (p = 0; p < kc; ++p, a += GEMM_MR, b += GEMM_NR) {
+        float32x4_t b0 = vld1q_f32(b), b1 = vld1q_f32(b + 4);
+        for (i = 0; i < GEMM_MR; ++i) {
+            acc[i][0] = vmlaq_n_f32(acc[i][0], b0, a[i]);
+            acc[i][1] = vmlaq_n_f32(acc[i][1], b1, a[i]);
+        }
+    }
+    for (i = 0; i < GEMM_MR; ++i) {
+        float32x4_t c0 = vld1q_f32(c + i * ldc), c1 = vld1q_f32(c + i * ldc + 4);
+        if (beta != 1) {
+            c0 = vmulq_n_f32(c0, beta);
+            c1 = vmulq_n_f32(c1, beta);
+        }
+        vst1q_f32(c + i * ldc, vaddq_f32(c0, acc[i][0]));
+        vst1q_f32(c + i * ldc + 4, vaddq_f32(c1, acc[i][1]));
+    }
+#else
+    int j;
+    float acc[GEMM_MR][GEMM_NR] = {{0}};
+    for (p = 0; p < kc; ++p, a += GEMM_MR, b += GEMM_NR) {
+        for (i = 0; i < GEMM_MR; ++i) {
+            for (j = 0; j < GEMM_NR; ++j) acc[i][j] += a[i] * b[j];
+        }
+    }
+    for (i = 0; i < GEMM_MR; ++i) {
+        for (j = 0; j < GEMM_NR; ++j) c[i * ldc + j] = beta * c[i * ldc + j] + acc[i][j];
+    }
+#endif
+}
+
+// ALPHA * A[mc x kc] as MR-row micro-panels, zero-padded to a multiple of MR
+static void pack_a(int mc, int kc, float ALPHA, const float *A, int lda, float *packed)
+{
+    int ir, i, p;
+    for (ir = 0; ir < mc; ir += GEMM_MR) {
+        int mr = mc - ir < GEMM_MR ? mc - ir : GEMM_MR;
+        for (p = 0; p < kc; ++p, packed += GEMM_MR) {
+            for (i = 0; i < mr; ++i) packed[i] = ALPHA * A[(ir + i) * lda + p];
+            for (; i < GEMM_MR; ++i) packed[i] = 0;
+        }
+    }
+}
+
+// B[kc x nc] as NR-column micro-panels, zero-padded to a multiple of NR
+static void pack_b(int kc, int nc, const float *B, int ldb, float *packed)
+{
+    int jr;
+    #pragma omp parallel for schedule(runtime)
+    for (jr = 0; jr < nc; jr += GEMM_NR) {
+        int nr = nc - jr < GEMM_NR ? nc - jr : GEMM_NR;
+        float *panel = packed + (size_t)jr * kc;
+        int j, p;
+        for (p = 0; p < kc; ++p, panel += GEMM_NR) {
+            for (j = 0; j < nr; ++j) panel[j] = B[p * ldb + jr + j];
+            for (; j < GEMM_NR; ++j) panel[j] = 0;
+        }
+    }
+}
+
+// C[mc x nc] = beta * C + packed A * packed B. Threads split the NR-wide
+// column panels, which is the long dimension for darknet's convolution GEMMs.
+static void gemm_macro_kernel(int mc, int nc, int kc, const float *packed_a, const float *packed_b,
+        float beta, float *C, int ldc)
+{
+    int jr;
+    #pragma omp parallel for schedule(runtime)
+    for (jr = 0; jr < nc; jr += GEMM_NR) {
+        int nr = nc - jr < GEMM_NR ? nc - jr : GEMM_NR;
+        int ir, i, j;
+        for (ir = 0; ir < mc; ir += GEMM_MR) {
+            int mr = mc - ir < GEMM_MR ? mc - ir : GEMM_MR;
+            const float *a = packed_a + (size_t)ir * kc;
+            const float *b = packed_b + (size_t)jr * kc;
+            float *c = C + ir * ldc + jr;
+            if (mr == GEMM_MR && nr == GEMM_NR) {
+                gemm_micro_kernel(kc, a, b, beta, c, ldc);
+            } else {
+                // Edge block: accumulate into a full tile, then add the valid part
+                float tile[GEMM_MR * GEMM_NR] = {0};
+                gemm_micro_kernel(kc, a, b, 1, tile, GEMM_NR);
+                for (i = 0; i < mr; ++i) {
+                    for (j = 0; j < nr; ++j) c[i * ldc + j] = beta * c[i * ldc + j] + tile[i * GEMM_NR + j];
+                }
+            }
+        }
+    }
+}
+
+// Packing buffers, allocated at the first call and reused so later calls do
+// not allocate inside the profiled region
+static float *packed_a_buffer = NULL;
+static float *packed_b_buffer = NULL;
+
+static void gemm_nn_packed(int M, int N, int K, float ALPHA,
+        float *A, int lda,
+        float *B, int ldb,
+        float BETA,
+        float *C, int ldc)
+{
+    int jc, pc, ic;
+    if (K == 0) {
+        for (ic = 0; ic < M; ++ic) scale_c(C + ic * ldc, N, BETA);
+        return;
+    }
+    if (!packed_a_buffer) {
+        void *a = NULL, *b = NULL;
+        if (posix_memalign(&a, 64, (size_t)block_mc * block_kc * sizeof(float))
+            || posix_memalign(&b, 64, (size_t)block_kc * block_nc * sizeof(float))) {
+            free(a);
+            fprintf(stderr, "gemm: cannot allocate packing buffers, using gemm_nn\n");
+            gemm_nn_basic(M, N, K, ALPHA, A, lda, B, ldb, BETA, C, ldc);
+            return;
+        }
+        packed_a_buffer = a;
+        packed_b_buffer = b;
+    }
+    for (jc = 0; jc < N; jc += block_nc) {
+        int nc = N - jc < block_nc ? N - jc : block_nc;
+        for (pc = 0; pc < K; pc += block_kc) {
+            int kc = K - pc < block_kc ? K - pc : block_kc;
+            pack_b(kc, nc, B + pc * ldb + jc, ldb, packed_b_buffer);
+            for (ic = 0; ic < M; ic += block_mc) {
+                int mc = M - ic < block_mc ? M - ic : block_mc;
+                pack_a(mc, kc, ALPHA, A + ic * lda + pc, lda, packed_a_buffer);
+                // BETA is applied by the first KC step's micro-kernel stores
+                gemm_macro_kernel(mc, nc, kc, packed_a_buffer, packed_b_buffer, pc ? 1 : BETA, C + ic * ldc + jc,
+                        ldc);
+            }
+        }
+    }
+}
+
+// Transposed variants (TA and/or TB set), used for every GEMM_METHOD. NT
+// and TT form each element of C as one dot product and write it once.
+static void gemm_nt(int M, int N, int K, float ALPHA,
+        float *A, int lda,
+        float *B, int ldb,
+        float BETA,
+        float *C, int ldc)
+{
+    int i, j, k;
+    #pragma omp parallel for schedule(runtime) private(j, k)
+    for (i = 0; i < M; ++i) {
+        for (j = 0; j < N; ++j) {
+            register float sum = 0;
+            for (k = 0; k < K; ++k) {
+                sum += A[i * lda + k] * B[j * ldb + k];
+            }
+            C[i * ldc + j] = BETA * C[i * ldc + j] + ALPHA * sum;
+        }
+    }
+}
+
+static void gemm_tn(int M, int N, int K, float ALPHA,
+        float *A, int lda,
+        float *B, int ldb,
+        float BETA,
+        float *C, int ldc)
+{
+    int i, j, k;
+    #pragma omp parallel for schedule(runtime) private(j, k)
     for (i = 0; i < M; ++i) {
+        scale_c(C + i * ldc, N, BETA);
         for (k = 0; k < K; ++k) {
-            register float A_PART = ALPHA * A[i * lda + k];
+            register float A_PART = ALPHA * A[k * lda + i];
             for (j = 0; j < N; ++j) {
                 C[i * ldc + j] += A_PART * B[k * ldb + j];
             }
         }
     }
-    #endif
+}
 
-    m5_dump_stats(0, 0);
-    m5_exit(0);
+static void gemm_tt(int M, int N, int K, float ALPHA,
+        float *A, int lda,
+        float *B, int ldb,
+        float BETA,
+        float *C, int ldc)
+{
+    int i, j, k;
+    #pragma omp parallel for schedule(runtime) private(j, k)
+    for (i = 0; i < M; ++i) {
+        for (j = 0; j < N; ++j) {
+            register float sum = 0;
+            for (k = 0; k < K; ++k) {
+                sum += A[i + k * lda] * B[k + j * ldb];
+            }
+            C[i * ldc + j] = BETA * C[i * ldc + j] + ALPHA * sum;
+        }
+    }
 }
 
+// Indexed by [TA][TB]; NN goes through gemm_kernels[]
+static const gemm_kernel transposed_kernels[2][2] = {
+    {NULL, gemm_nt},
+    {gemm_tn, gemm_tt},
+};
 
+static const struct {
+    const char *name;
+    gemm_kernel kernel;
+} gemm_kernels[] = {
+    {"gemm_nn", gemm_nn_basic},
+    {"tiled", gemm_nn_tiled},
+    {"optimized", gemm_nn_optimized},
+    {"packed", gemm_nn_packed},
+};
+#define NUM_GEMM_KERNELS ((int)(sizeof(gemm_kernels) / sizeof(gemm_kernels[0])))
 
+// The build-time choice (make menu) is only the default for GEMM_METHOD
+#if defined(GEMM_TILED)
+#define DEFAULT_GEMM_KERNEL 1
+#elif defined(GEMM_OPTIMIZED)
+#define DEFAULT_GEMM_KERNEL 2
+#elif defined(GEMM_PACKED)
+#define DEFAULT_GEMM_KERNEL 3
+#else
+#define DEFAULT_GEMM_KERNEL 0
+#endif
 
-void gemm_cpu(int TA, int TB, int M, int N, int K, float ALPHA, 
-        float *A, int lda, 
+// Kernel selection, read once at the first call:
+//   GEMM_METHOD=tiled                            kernel for every shape
+//   GEMM_METHOD_RULES=512x512x256=optimized,*x*x1024=tiled
+//                                                per-shape overrides, the
+//                                                first matching rule wins
+#define MAX_METHOD_RULES 64
+static struct {
+    int m, n, k; // -1 matches any size
+    int kernel;
+} method_rules[MAX_METHOD_RULES];
+static int num_method_rules = 0;
+static int default_kernel = -1; // -1 until GEMM_METHOD has been read
+
+static int find_kernel(const char *name, size_t len)
+{
+    int i;
+    for (i = 0; i < NUM_GEMM_KERNELS; ++i) {
+        if (strlen(gemm_kernels[i].name) == len && !strncmp(gemm_kernels[i].name, name, len)) return i;
+    }
+    return -1;
+}
+
+static int parse_rule_size(const char *text, char **end)
+{
+    if (*text == '*') {
+        *end = (char *)text + 1;
+        return -1;
+    }
+    return (int)strtol(text, end, 10);
+}
+
+static void parse_method_rules(const char *rules)
+{
+    const char *p = rules;
+    while (p && *p && num_method_rules < MAX_METHOD_RULES) {
+        const char *rule_end = strchr(p, ',');
+        size_t rule_len = rule_end ? (size_t)(rule_end - p) : strlen(p);
+        const char *eq = memchr(p, '=', rule_len);
+        char *end;
+        int m = parse_rule_size(p, &end), n = -1, k = -1, kernel = -1;
+        int ok = eq && *end == 'x';
+        if (ok) n = parse_rule_size(end + 1, &end);
+        ok = ok && *end == 'x';
+        if (ok) k = parse_rule_size(end + 1, &end);
+        ok = ok && end == eq;
+        if (ok) kernel = find_kernel(eq + 1, p + rule_len - eq - 1);
+        if (kernel < 0) {
+            fprintf(stderr, "GEMM_METHOD_RULES: ignoring rule '%.*s'\n", (int)rule_len, p);
+        } else {
+            method_rules[num_method_rules].m = m;
+            method_rules[num_method_rules].n = n;
+            method_rules[num_method_rules].k = k;
+            method_rules[num_method_rules].kernel = kernel;
+            num_method_rules++;
+        }
+        p = rule_end ? rule_end + 1 : NULL;
+    }
+}
+
+static void load_blocking(void)
+{
+    const char *size = getenv("GEMM_BLOCK_SIZE");
+    const char *blocks = getenv("GEMM_PACKED_BLOCKS");
+    int mc, kc, nc;
+    if (size && *size) {
+        if (atoi(size) > 0) tile_size = atoi(size);
+        else fprintf(stderr, "GEMM_BLOCK_SIZE: ignoring '%s'\n", size);
+    }
+    if (blocks && *blocks) {
+        if (sscanf(blocks, "%d,%d,%d", &mc, &kc, &nc) == 3 && mc > 0 && kc > 0 && nc > 0) {
+            block_mc = mc < GEMM_MR ? GEMM_MR : mc - mc % GEMM_MR;
+            block_kc = kc;
+            block_nc = nc < GEMM_NR ? GEMM_NR : nc - nc % GEMM_NR;
+        } else {
+            fprintf(stderr, "GEMM_PACKED_BLOCKS: expected MC,KC,NC, ignoring '%s'\n", blocks);
+        }
+    }
+}
+
+#ifdef _OPENMP
+// The OpenMP runtime reads OMP_NUM_THREADS and OMP_SCHEDULE at start-up,
+// before a restored checkpoint's GEMM_ENV_FILE is applied, so apply them
+// again. The kernels' loops use schedule(runtime): OMP_SCHEDULE
+// ("kind[,chunk]") picks the schedule, and without it they keep the static
+// default.
+static void load_omp_settings(void)
+{
+    static const struct { const char *name; omp_sched_t kind; } kinds[] = {
+        {"static", omp_sched_static}, {"dynamic", omp_sched_dynamic},
+        {"guided", omp_sched_guided}, {"auto", omp_sched_auto},
+    };
+    const char *threads = getenv("OMP_NUM_THREADS");
+    const char *schedule = getenv("OMP_SCHEDULE");
+    omp_sched_t kind = omp_sched_static;
+    int chunk = 0;
+    size_t i;
+    if (threads && atoi(threads) > 0) omp_set_num_threads(atoi(threads));
+    if (schedule && *schedule) {
+        size_t len = strcspn(schedule, ",");
+        for (i = 0; i < sizeof(kinds) / sizeof(kinds[0]); ++i) {
+            if (strlen(kinds[i].name) == len && !strncasecmp(schedule, kinds[i].name, len)) break;
+        }
+        if (i == sizeof(kinds) / sizeof(kinds[0])) {
+            fprintf(stderr, "OMP_SCHEDULE: unknown schedule '%s', using static\n", schedule);
+        } else {
+            kind = kinds[i].kind;
+            if (schedule[len] == ',') chunk = atoi(schedule + len + 1);
+        }
+    }
+    omp_set_schedule(kind, chunk);
+}
+#endif
+
+static void load_method_selection(void)
+{
+    const char *method = getenv("GEMM_METHOD");
+    default_kernel = DEFAULT_GEMM_KERNEL;
+    if (method && *method) {
+        int kernel = find_kernel(method, strlen(method));
+        if (kernel < 0) {
+            fprintf(stderr, "GEMM_METHOD: unknown method '%s', using %s\n", method, gemm_kernels[default_kernel].name);
+        } else {
+            default_kernel = kernel;
+        }
+    }
+    parse_method_rules(getenv("GEMM_METHOD_RULES"));
+    load_blocking();
+#ifdef _OPENMP
+    load_omp_settings();
+#endif
+}
+
+static int select_kernel(int M, int N, int K)
+{
+    int r;
+    if (default_kernel < 0) load_method_selection();
+    for (r = 0; r < num_method_rules; ++r) {
+        if ((method_rules[r].m < 0 || method_rules[r].m == M) && (method_rules[r].n < 0 || method_rules[r].n == N)
+            && (method_rules[r].k < 0 || method_rules[r].k == K)) {
+            return method_rules[r].kernel;
+        }
+    }
+    return default_kernel;
+}
+
+// Override GEMM_METHOD, e.g. from a command-line argument; 0 if unknown
+int gemm_set_method(const char *name)
+{
+    int kernel = find_kernel(name, strlen(name));
+    if (kernel < 0) return 0;
+    if (default_kernel < 0) load_method_selection();
+    default_kernel = kernel;
+    return 1;
+}
+
+// Name of kernel `index` in the registry, NULL past the end
+const char *gemm_method_name(int index)
+{
+    return index >= 0 && index < NUM_GEMM_KERNELS ? gemm_kernels[index].name : NULL;
+}
+
+// Name of the kernel gemm_nn would run for this shape
+const char *gemm_method_for(int M, int N, int K)
+{
+    return gemm_kernels[select_kernel(M, N, K)].name;
+}
+
+// One GEMM call, inside the profiled region if it is selected. All four
+// TA/TB variants, including the BETA scaling, run between m5_reset_stats
+// and m5_dump_stats. The region is also a gem5 work item: with
+// generic_cpu_config.py --fast-forward, gem5 switches from the atomic cores
+// to the detailed ones at m5_work_begin and back at m5_work_end (otherwise
+// work items are ignored).
+static void gemm_profiled(int TA, int TB, int M, int N, int K, float ALPHA,
+        float *A, int lda,
         float *B, int ldb,
         float BETA,
         float *C, int ldc)
 {
-    gemm_counter++;
-    printf("cpu: %d %d %d %d %d %f %d %d %f %d\n",TA, TB, M, N, K, ALPHA, lda, ldb, BETA, ldc);
-    int i, j;
-    for(i = 0; i < M; ++i){
-        for(j = 0; j < N; ++j){
-            C[i*ldc + j] *= BETA;
+    // Resolve the kernel before the ROI so the lookup is not measured
+    if (default_kernel < 0) load_method_selection();
+    gemm_kernel kernel = TA || TB ? transposed_kernels[!!TA][!!TB] : gemm_kernels[select_kernel(M, N, K)].kernel;
+    int profile = !is_skipped_shape(M, N, K) && selected_for_profiling(gemm_counter, M, N, K);
+    if (profile) {
+        flush_call_log();
+        if (profile_log) {
+            fprintf(profile_log, "%d %d %d %d\n", gemm_counter, M, N, K);
+            fflush(profile_log);
         }
+        m5_work_begin(gemm_counter, 0);
+        if (roi_stats) m5_reset_stats(0, 0);
     }
-    if(!TA && !TB)
-    {
-        printf("gemm_nn called %d\n", gemm_counter );
-        gemm_nn(M, N, K, ALPHA,A,lda, B, ldb,C,ldc);
+
+    kernel(M, N, K, ALPHA, A, lda, B, ldb, BETA, C, ldc);
+
+    if (profile) {
+        if (roi_stats) m5_dump_stats(0, 0);
+        m5_work_end(gemm_counter, 0);
+        if (profile_mode == PROFILE_FIRST) m5_exit(0);
     }
 }
 
+void gemm_nn(int M, int N, int K, float ALPHA, 
+        float *A, int lda, 
+        float *B, int ldb,
+        float *C, int ldc)
+{
+    if (!gemm_started) gemm_start();
+    gemm_profiled(0, 0, M, N, K, ALPHA, A, lda, B, ldb, 1, C, ldc);
+}
+
+
+
+
+void gemm_cpu(int TA, int TB, int M, int N, int K, float ALPHA, 
+        float *A, int lda, 
+        float *B, int ldb,
+        float BETA,
+        float *C, int ldc)
+{
+    if (!gemm_started) gemm_start();
+    gemm_counter++;
+    log_gemm_call(TA, TB, M, N, K, ALPHA, lda, ldb, BETA, ldc);
+    if (gemm_verbose < 0) gemm_verbose = getenv("GEMM_VERBOSE") && atoi(getenv("GEMM_VERBOSE"));
+    if (gemm_verbose) printf("cpu: %d %d %d %d %d %f %d %d %f %d\n",TA, TB, M, N, K, ALPHA, lda, ldb, BETA, ldc);
+    if (gemm_verbose) printf("gemm_%c%c called %d\n", TA ? 't' : 'n', TB ? 't' : 'n', gemm_counter);
+    gemm_profiled(TA, TB, M, N, K, ALPHA, A, lda, B, ldb, BETA, C, ldc);
+}
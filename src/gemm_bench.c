@@ -0,0 +1,428 @@
+// Host-side benchmark of gemm_nn without gem5.
+//
+// Built by `make bench` from the same src/gemm.c as darknet, with the m5 ops
+// compiled out (GEMM_NO_M5). Times gemm_nn over the (M, N, K) list of a
+// gemm_calls.txt or gemm_calls.bin for each method given with -m (default:
+// GEMM_METHOD and GEMM_METHOD_RULES) and writes one row per layer and method
+// in the gemm_metrics.csv schema, followed by benchmark columns.
+//
+//   ./gemm_bench [-m gemm_nn,tiled,optimized] [-w warmup] [-r reps] [-c] [-o out.csv] gemm_calls.txt
+//
+// -c checks every distinct shape against a double-precision reference and
+// exits with status 2 if any result is off by more than K * FLT_EPSILON,
+// relative to sum(|A||B|). Rows are appended if the output file exists.
+//
+//   ./gemm_bench -t [-m method,...]
+//
+// runs every method (default: all of them) on built-in edge-case shapes with
+// ALPHA != 1, BETA != 1, padded leading dimensions and a non-zero C, and
+// compares each result with the reference gemm_nn kernel. The transposed
+// NT/TN/TT paths of gemm_cpu are compared with gemm_nn on explicitly
+// transposed copies of A and B. `make check` runs it.
+#include <float.h>
+#include <math.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+#include <unistd.h>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+#include "gemm.h"
+
+// Kernel entry point and registry in gemm.c
+void gemm_nn(int M, int N, int K, float ALPHA, float *A, int lda, float *B, int ldb, float *C, int ldc);
+int gemm_set_method(const char *name);
+const char *gemm_method_for(int M, int N, int K);
+const char *gemm_method_name(int index);
+
+#define USAGE "usage: %s [-m method,...] [-w warmup] [-r reps] [-c] [-o out.csv] gemm_calls.txt|gemm_calls.bin\n" \
+              "       %s -t [-m method,...]\n"
+
+typedef struct {
+    int m, n, k;
+} shape;
+
+typedef struct {
+    shape s;
+    const char *method;
+    int reps;
+    double mean, min, median, max, stddev;
+    double error; // < 0 if not checked
+} result;
+
+static double now(void)
+{
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return ts.tv_sec + ts.tv_nsec * 1e-9;
+}
+
+static int append_shape(shape **shapes, int *count, int m, int n, int k)
+{
+    *shapes = realloc(*shapes, (*count + 1) * sizeof(shape));
+    if (!*shapes) return 0;
+    (*shapes)[*count].m = m;
+    (*shapes)[*count].n = n;
+    (*shapes)[*count].k = k;
+    (*count)++;
+    return 1;
+}
+
+// gemm_nn calls (TA = TB = 0) from gemm_calls.bin, see gemm_call_record in gemm.c
+static int read_call_log(FILE *fp, shape **shapes, int *count)
+{
+    char magic[8];
+    uint32_t header[2];
+    int32_t record[12];
+    if (fread(magic, 1, 8, fp) != 8 || memcmp(magic, "GEMMCALL", 8) || fread(header, sizeof(header), 1, fp) != 1
+        || header[1] != sizeof(record)) {
+        fprintf(stderr, "gemm_bench: not a gemm_calls.bin file\n");
+        return 0;
+    }
+    while (fread(record, sizeof(record), 1, fp) == 1) {
+        if (!record[2] && !record[3] && !append_shape(shapes, count, record[4], record[5], record[6])) return 0;
+    }
+    return 1;
+}
+
+// "GEMM Layer: <name> -M: 512, N: 512, K: 256" lines of gemm_calls.txt
+static int read_layers(FILE *fp, shape **shapes, int *count)
+{
+    char line[1024];
+    int m, n, k;
+    while (fgets(line, sizeof(line), fp)) {
+        char *dims = strstr(line, "M:");
+        if (strstr(line, "GEMM Layer:") && dims && sscanf(dims, "M: %d, N: %d, K: %d", &m, &n, &k) == 3) {
+            if (!append_shape(shapes, count, m, n, k)) return 0;
+        }
+    }
+    return 1;
+}
+
+static void fill_random(float *x, size_t size)
+{
+    size_t i;
+    for (i = 0; i < size; ++i) x[i] = 2.0f * rand() / RAND_MAX - 1.0f;
+}
+
+static int compare_doubles(const void *a, const void *b)
+{
+    double x = *(const double *)a, y = *(const double *)b;
+    return (x > y) - (x < y);
+}
+
+// Max error of one gemm_nn call on zeroed C, relative to sum_k |A||B|
+static double check_shape(shape s, const float *A, const float *B, float *C)
+{
+    int i, j, k;
+    double worst = 0;
+    memset(C, 0, (size_t)s.m * s.n * sizeof(float));
+    gemm_nn(s.m, s.n, s.k, 1.0f, (float *)A, s.k, (float *)B, s.n, C, s.n);
+    for (i = 0; i < s.m; ++i) {
+        for (j = 0; j < s.n; ++j) {
+            double ref = 0, scale = 0;
+            for (k = 0; k < s.k; ++k) {
+                ref += (double)A[i * s.k + k] * B[k * s.n + j];
+                scale += fabs((double)A[i * s.k + k] * B[k * s.n + j]);
+            }
+            if (scale > 0 && fabs(C[i * s.n + j] - ref) / scale > worst) worst = fabs(C[i * s.n + j] - ref) / scale;
+        }
+    }
+    return worst;
+}
+
+static result bench_shape(shape s, int warmup, int reps, int check)
+{
+    result r = {s, gemm_method_for(s.m, s.n, s.k), reps, 0, 0, 0, 0, 0, -1};
+    size_t a_size = (size_t)s.m * s.k, b_size = (size_t)s.k * s.n, c_size = (size_t)s.m * s.n;
+    float *A = malloc(a_size * sizeof(float));
+    float *B = malloc(b_size * sizeof(float));
+    float *C = calloc(c_size, sizeof(float));
+    double *times = malloc(reps * sizeof(double));
+    int i;
+    if (!A || !B || !C || !times) {
+        fprintf(stderr, "gemm_bench: out of memory for %dx%dx%d\n", s.m, s.n, s.k);
+        exit(1);
+    }
+    fill_random(A, a_size);
+    fill_random(B, b_size);
+
+    if (check) r.error = check_shape(s, A, B, C);
+    for (i = 0; i < warmup; ++i) gemm_nn(s.m, s.n, s.k, 1.0f, A, s.k, B, s.n, C, s.n);
+    for (i = 0; i < reps; ++i) {
+        double start = now();
+        gemm_nn(s.m, s.n, s.k, 1.0f, A, s.k, B, s.n, C, s.n);
+        times[i] = now() - start;
+        r.mean += times[i] / reps;
+    }
+    for (i = 0; i < reps; ++i) r.stddev += (times[i] - r.mean) * (times[i] - r.mean) / reps;
+    r.stddev = sqrt(r.stddev);
+    qsort(times, reps, sizeof(double), compare_doubles);
+    r.min = times[0];
+    r.max = times[reps - 1];
+    r.median = reps % 2 ? times[reps / 2] : 0.5 * (times[reps / 2 - 1] + times[reps / 2]);
+
+    free(A);
+    free(B);
+    free(C);
+    free(times);
+    return r;
+}
+
+// Shapes for -t: sizes of one, and sizes just off the register blocks
+// (MR, NR) and cache blocks (MC, KC, NC) of the packed kernel
+static const shape test_shapes[] = {
+    {1, 1, 1}, {1, 37, 5}, {5, 3, 300}, {7, 17, 13}, {33, 129, 65}, {121, 250, 257}, {130, 2100, 33},
+};
+#define NUM_TEST_SHAPES ((int)(sizeof(test_shapes) / sizeof(test_shapes[0])))
+
+// Compare one gemm_cpu call with the gemm_nn kernel on a strided, scaled,
+// accumulating call; TA/TB store A and B transposed. Returns the number of
+// elements outside the tolerance, including any write to the padding
+// between rows of C.
+static int test_shape(const char *method, shape s, int ta, int tb)
+{
+    const float alpha = 0.5f, beta = 0.75f;
+    int lda = (ta ? s.m : s.k) + 3, ldb = (tb ? s.k : s.n) + 5, ldc = s.n + 7, i, j, k, bad = 0;
+    float *A = malloc((size_t)(ta ? s.k : s.m) * lda * sizeof(float));
+    float *B = malloc((size_t)(tb ? s.n : s.k) * ldb * sizeof(float));
+    float *plain_a = malloc((size_t)s.m * s.k * sizeof(float));
+    float *plain_b = malloc((size_t)s.k * s.n * sizeof(float));
+    float *C0 = malloc((size_t)s.m * ldc * sizeof(float));
+    float *ref = malloc((size_t)s.m * ldc * sizeof(float));
+    float *C = malloc((size_t)s.m * ldc * sizeof(float));
+    if (!A || !B || !plain_a || !plain_b || !C0 || !ref || !C) {
+        fprintf(stderr, "gemm_bench: out of memory for %dx%dx%d\n", s.m, s.n, s.k);
+        exit(1);
+    }
+    fill_random(A, (size_t)(ta ? s.k : s.m) * lda);
+    fill_random(B, (size_t)(tb ? s.n : s.k) * ldb);
+    fill_random(C0, (size_t)s.m * ldc);
+    for (i = 0; i < s.m; ++i) {
+        for (k = 0; k < s.k; ++k) plain_a[i * s.k + k] = ta ? A[k * lda + i] : A[i * lda + k];
+    }
+    for (k = 0; k < s.k; ++k) {
+        for (j = 0; j < s.n; ++j) plain_b[k * s.n + j] = tb ? B[j * ldb + k] : B[k * ldb + j];
+    }
+
+    memcpy(ref, C0, (size_t)s.m * ldc * sizeof(float));
+    gemm_set_method("gemm_nn");
+    gemm_cpu(0, 0, s.m, s.n, s.k, alpha, plain_a, s.k, plain_b, s.n, beta, ref, ldc);
+    memcpy(C, C0, (size_t)s.m * ldc * sizeof(float));
+    gemm_set_method(method);
+    gemm_cpu(ta, tb, s.m, s.n, s.k, alpha, A, lda, B, ldb, beta, C, ldc);
+
+    for (i = 0; i < s.m; ++i) {
+        for (j = 0; j < ldc; ++j) {
+            double scale = fabs(beta * C0[i * ldc + j]);
+            if (j >= s.n) {
+                bad += C[i * ldc + j] != C0[i * ldc + j];
+                continue;
+            }
+            for (k = 0; k < s.k; ++k) scale += fabs(alpha * plain_a[i * s.k + k] * plain_b[k * s.n + j]);
+            bad += fabs(C[i * ldc + j] - ref[i * ldc + j]) > 2 * (s.k + 1) * FLT_EPSILON * scale;
+        }
+    }
+    free(A);
+    free(B);
+    free(plain_a);
+    free(plain_b);
+    free(C0);
+    free(ref);
+    free(C);
+    return bad;
+}
+
+// -t: every method, then the transposed paths, against gemm_nn on
+// test_shapes; returns the failure count
+static int self_test(char *methods)
+{
+    static const char *transposed[] = {"gemm_nt", "gemm_tn", "gemm_tt"};
+    char log_dir[] = "/tmp/gemm_bench_XXXXXX";
+    int i, t, failed = 0, index = 0;
+    const char *method;
+    // Per-shape rules would override the method under test, and gemm_cpu's
+    // call log goes to a scratch directory
+    unsetenv("GEMM_METHOD_RULES");
+    if (mkdtemp(log_dir)) setenv("GEMM_LOG_DIR", log_dir, 1);
+    srand(1);
+    for (method = methods ? strtok(methods, ",") : gemm_method_name(index); method;
+         method = methods ? strtok(NULL, ",") : gemm_method_name(++index)) {
+        for (i = 0; i < NUM_TEST_SHAPES; ++i) {
+            int bad = test_shape(method, test_shapes[i], 0, 0);
+            failed += bad > 0;
+            printf("%s %dx%dx%d: %s\n", method, test_shapes[i].m, test_shapes[i].n, test_shapes[i].k,
+                   bad ? "FAILED" : "ok");
+        }
+    }
+    for (t = 0; t < 3; ++t) {
+        for (i = 0; i < NUM_TEST_SHAPES; ++i) {
+            int bad = test_shape("gemm_nn", test_shapes[i], t > 0, t != 1);
+            failed += bad > 0;
+            printf("%s %dx%dx%d: %s\n", transposed[t], test_shapes[i].m, test_shapes[i].n, test_shapes[i].k,
+                   bad ? "FAILED" : "ok");
+        }
+    }
+    if (strcmp(log_dir + strlen(log_dir) - 6, "XXXXXX")) {
+        char path[64];
+        snprintf(path, sizeof(path), "%s/gemm_calls.bin", log_dir);
+        remove(path);
+        rmdir(log_dir);
+    }
+    return failed;
+}
+
+static long cache_size(int name)
+{
+    long size = sysconf(name);
+    return size > 0 ? size : 0;
+}
+
+static void write_row(FILE *out, result r, int threads)
+{
+    double flops = 2.0 * r.s.m * r.s.n * r.s.k;
+    fprintf(out, "\"GEMM Layer (%d, %d, %d)\",%d,%d,%d,", r.s.m, r.s.n, r.s.k, r.s.m, r.s.n, r.s.k);
+#if defined(_SC_LEVEL1_DCACHE_SIZE) && defined(_SC_LEVEL2_CACHE_SIZE) && defined(_SC_LEVEL3_CACHE_SIZE)
+    fprintf(out, "%ld,%ld,%g,", cache_size(_SC_LEVEL1_DCACHE_SIZE) >> 10, cache_size(_SC_LEVEL2_CACHE_SIZE) >> 10,
+            cache_size(_SC_LEVEL3_CACHE_SIZE) / 1048576.0);
+#else
+    fprintf(out, ",,,");
+#endif
+    // No clocks, DRAM, CPI, bandwidth, energy, power or intensity on the host
+    fprintf(out, ",,,%.9g,,%.9g,,,,,%.9g,", r.mean, flops / r.mean / 1e6, flops);
+    fprintf(out, "%s,%d,%d,%.9g,%.9g,%.9g,%.9g,%.6g,", r.method, threads, r.reps, r.min, r.median, r.max,
+            r.stddev, flops / r.mean / 1e9);
+    if (r.error >= 0) fprintf(out, "%.3g", r.error);
+    fprintf(out, "\n");
+}
+
+// Benchmark every layer with the current method selection into results[]
+static int bench_layers(shape *shapes, int count, int warmup, int reps, int check, result *results)
+{
+    int i, j, failed = 0;
+    for (i = 0; i < count; ++i) {
+        // Repeated shapes are timed once and reported for every layer
+        for (j = 0; j < i; ++j) {
+            if (shapes[j].m == shapes[i].m && shapes[j].n == shapes[i].n && shapes[j].k == shapes[i].k) break;
+        }
+        if (j < i) {
+            results[i] = results[j];
+            continue;
+        }
+        results[i] = bench_shape(shapes[i], warmup, reps, check);
+        printf("%s %dx%dx%d: %.3f GFLOP/s (%.6f s mean)", results[i].method, shapes[i].m, shapes[i].n, shapes[i].k,
+               2.0 * shapes[i].m * shapes[i].n * shapes[i].k / results[i].mean / 1e9, results[i].mean);
+        if (check) {
+            int bad = results[i].error > shapes[i].k * FLT_EPSILON;
+            failed += bad;
+            printf(", max error %.3g%s", results[i].error, bad ? " FAILED" : "");
+        }
+        printf("\n");
+    }
+    return failed;
+}
+
+int main(int argc, char **argv)
+{
+    int warmup = 1, reps = 5, check = 0, test = 0, opt, i, count = 0, failed = 0, threads = 1;
+    const char *output = "gemm_bench.csv";
+    char *methods = NULL;
+    shape *shapes = NULL;
+    result *results;
+
+    while ((opt = getopt(argc, argv, "m:w:r:cto:")) != -1) {
+        switch (opt) {
+        case 'm': methods = optarg; break;
+        case 'w': warmup = atoi(optarg); break;
+        case 'r': reps = atoi(optarg); break;
+        case 'c': check = 1; break;
+        case 't': test = 1; break;
+        case 'o': output = optarg; break;
+        default:
+            fprintf(stderr, USAGE, argv[0], argv[0]);
+            return 1;
+        }
+    }
+    if (optind != argc - !test || reps < 1 || warmup < 0) {
+        fprintf(stderr, USAGE, argv[0], argv[0]);
+        return 1;
+    }
+
+    // Check every method name before writing anything
+    if (methods) {
+        char *copy = strdup(methods), *name;
+        for (name = strtok(copy, ","); name; name = strtok(NULL, ",")) {
+            if (!gemm_set_method(name)) {
+                fprintf(stderr, "gemm_bench: unknown method '%s'\n", name);
+                return 1;
+            }
+        }
+        free(copy);
+    }
+
+    if (test) {
+        failed = self_test(methods);
+        if (failed) {
+            fprintf(stderr, "gemm_bench: %d shapes failed the self-test\n", failed);
+            return 2;
+        }
+        printf("All methods match gemm_nn\n");
+        return 0;
+    }
+
+    FILE *fp = fopen(argv[optind], "rb");
+    if (!fp) {
+        fprintf(stderr, "gemm_bench: cannot open %s\n", argv[optind]);
+        return 1;
+    }
+    size_t name_len = strlen(argv[optind]);
+    int ok = name_len > 4 && !strcmp(argv[optind] + name_len - 4, ".bin") ? read_call_log(fp, &shapes, &count)
+                                                                           : read_layers(fp, &shapes, &count);
+    fclose(fp);
+    if (!ok || !count) {
+        fprintf(stderr, "gemm_bench: no GEMM layers in %s\n", argv[optind]);
+        return 1;
+    }
+#ifdef _OPENMP
+    threads = omp_get_max_threads();
+#endif
+    printf("%d layers, %d threads\n", count, threads);
+
+    FILE *existing = fopen(output, "r");
+    int append = existing && fgetc(existing) != EOF;
+    if (existing) fclose(existing);
+    FILE *out = fopen(output, append ? "a" : "w");
+    if (!out) {
+        fprintf(stderr, "gemm_bench: cannot write %s\n", output);
+        return 1;
+    }
+    if (!append) {
+        fprintf(out, "Layer,M,N,K,L1 Cache [kB],L2 Cache [kB],L3 Cache [MB],CPU Clock [MHz],Memory Clock [MHz],DRAM,"
+                     "Mean Runtime (RDTSC) [s],Mean CPI,Mean DP [MFLOP/s],Memory Bandwidth [MB/s],Energy [J],"
+                     "Power [W],Operational Intensity,MaxFLOPS,gemm_method,Threads,Repetitions,Min Runtime [s],"
+                     "Median Runtime [s],Max Runtime [s],Stddev Runtime [s],GFLOP/s,Max Rel Error\n");
+    }
+
+    results = calloc(count, sizeof(result));
+    char *method = methods ? strtok(methods, ",") : NULL;
+    do {
+        if (method) gemm_set_method(method);
+        srand(1);
+        failed += bench_layers(shapes, count, warmup, reps, check, results);
+        for (i = 0; i < count; ++i) write_row(out, results[i], threads);
+    } while (method && (method = strtok(NULL, ",")));
+    fclose(out);
+    printf("Results written to %s\n", output);
+
+    free(shapes);
+    free(results);
+    if (failed) {
+        fprintf(stderr, "gemm_bench: %d shapes failed the correctness check\n", failed);
+        return 2;
+    }
+    return 0;
+}
@@ -0,0 +1,186 @@
+// Replay of a network's GEMM calls without the network.
+//
+// Built by `make replay` from the same src/gemm.c as darknet, with the m5
+// ops. Reads the calls of a gemm_calls.bin (or the shapes of a
+// gemm_calls.txt) and makes the same gemm_cpu calls: same TA/TB, ALPHA,
+// BETA and leading dimensions, same call numbers and layer tags, so
+// GEMM_PROFILE, GEMM_METHOD and the ROI markers behave as in the full run
+// and process.py reads the output directory like a darknet run. There are
+// no weights to load, no image to decode and no non-GEMM layers to run.
+//
+//   ./gemm_replay [-c call,...] [-u] gemm_calls.bin|gemm_calls.txt
+//
+// -c replays only the listed call numbers and -u only the first call of
+// each distinct call (TA, TB, M, N, K and leading dimensions). For every
+// call, A, C and B are allocated and written in the order darknet's
+// convolutional layer touches them (weights loaded at start-up, output
+// zeroed, then the im2col input), and freed afterwards. A text log has no
+// leading dimensions, ALPHA or BETA; it replays gemm_nn calls on packed
+// matrices with ALPHA = BETA = 1.
+//
+// cpuconf/generic_cpu_config.py --replay runs it in gem5, and
+// replay_check.py compares the result with the full-network run.
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+
+#include "gemm.h"
+
+// Call numbering and layer tags of the call log in gemm.c
+void gemm_log_set_layer(int layer);
+void gemm_log_set_call(int call);
+
+#define USAGE "usage: %s [-c call,...] [-u] gemm_calls.bin|gemm_calls.txt\n"
+
+// Same layout as gemm_call_record in gemm.c
+typedef struct {
+    int32_t call, layer, ta, tb;
+    int32_t m, n, k, lda, ldb, ldc;
+    float alpha, beta;
+} replay_call;
+
+static int append_call(replay_call **calls, int *count, replay_call call)
+{
+    *calls = realloc(*calls, (*count + 1) * sizeof(replay_call));
+    if (!*calls) return 0;
+    (*calls)[(*count)++] = call;
+    return 1;
+}
+
+static int read_call_log(FILE *fp, replay_call **calls, int *count)
+{
+    char magic[8];
+    uint32_t header[2];
+    replay_call call;
+    if (fread(magic, 1, 8, fp) != 8 || memcmp(magic, "GEMMCALL", 8) || fread(header, sizeof(header), 1, fp) != 1
+        || header[1] != sizeof(replay_call)) {
+        fprintf(stderr, "gemm_replay: not a gemm_calls.bin file\n");
+        return 0;
+    }
+    while (fread(&call, sizeof(call), 1, fp) == 1) {
+        if (!append_call(calls, count, call)) return 0;
+    }
+    return 1;
+}
+
+// "GEMM Layer: <name> -M: 512, N: 512, K: 256" lines of gemm_calls.txt,
+// numbered from 1 like gemm_cpu calls
+static int read_layers(FILE *fp, replay_call **calls, int *count)
+{
+    char line[1024];
+    replay_call call = {0, -1, 0, 0, 0, 0, 0, 0, 0, 0, 1.0f, 1.0f};
+    while (fgets(line, sizeof(line), fp)) {
+        char *dims = strstr(line, "M:");
+        if (strstr(line, "GEMM Layer:") && dims && sscanf(dims, "M: %d, N: %d, K: %d", &call.m, &call.n, &call.k) == 3) {
+            call.call = *count + 1;
+            call.lda = call.k;
+            call.ldb = call.n;
+            call.ldc = call.n;
+            if (!append_call(calls, count, call)) return 0;
+        }
+    }
+    return 1;
+}
+
+static int same_call(const replay_call *a, const replay_call *b)
+{
+    return a->ta == b->ta && a->tb == b->tb && a->m == b->m && a->n == b->n && a->k == b->k && a->lda == b->lda
+           && a->ldb == b->ldb && a->ldc == b->ldc;
+}
+
+// Keep the calls listed in `list` ("3,7,12") and, with `unique`, the first
+// of each distinct call; returns the new count
+static int select_calls(replay_call *calls, int count, char *list, int unique)
+{
+    int i, j, kept = 0;
+    for (i = 0; i < count; ++i) {
+        int keep = !list;
+        if (list) {
+            char *copy = strdup(list), *item;
+            for (item = strtok(copy, ","); item && !keep; item = strtok(NULL, ",")) keep = atoi(item) == calls[i].call;
+            free(copy);
+        }
+        for (j = 0; keep && unique && j < kept; ++j) keep = !same_call(&calls[j], &calls[i]);
+        if (keep) calls[kept++] = calls[i];
+    }
+    return kept;
+}
+
+// Deterministic values in [-1, 1), so every replay computes the same thing
+static void fill_values(float *x, size_t size, uint32_t seed)
+{
+    size_t i;
+    for (i = 0; i < size; ++i) {
+        seed = seed * 1664525u + 1013904223u;
+        x[i] = (seed >> 8) * (2.0f / 16777216.0f) - 1.0f;
+    }
+}
+
+static void replay(const replay_call *call)
+{
+    size_t a_size = (size_t)(call->ta ? call->k : call->m) * call->lda;
+    size_t b_size = (size_t)(call->tb ? call->n : call->k) * call->ldb;
+    size_t c_size = (size_t)call->m * call->ldc;
+    float *A = malloc(a_size * sizeof(float));
+    float *C = malloc(c_size * sizeof(float));
+    float *B = malloc(b_size * sizeof(float));
+    if (!A || !B || !C) {
+        fprintf(stderr, "gemm_replay: out of memory for call %d (%dx%dx%d)\n", call->call, call->m, call->n, call->k);
+        exit(1);
+    }
+    fill_values(A, a_size, call->call);
+    memset(C, 0, c_size * sizeof(float));
+    fill_values(B, b_size, ~(uint32_t)call->call);
+
+    gemm_log_set_layer(call->layer);
+    gemm_log_set_call(call->call);
+    gemm_cpu(call->ta, call->tb, call->m, call->n, call->k, call->alpha, A, call->lda, B, call->ldb, call->beta, C,
+             call->ldc);
+
+    free(A);
+    free(B);
+    free(C);
+}
+
+int main(int argc, char **argv)
+{
+    int opt, unique = 0, count = 0, i;
+    char *list = NULL;
+    replay_call *calls = NULL;
+
+    while ((opt = getopt(argc, argv, "c:u")) != -1) {
+        switch (opt) {
+        case 'c': list = optarg; break;
+        case 'u': unique = 1; break;
+        default:
+            fprintf(stderr, USAGE, argv[0]);
+            return 1;
+        }
+    }
+    if (optind != argc - 1) {
+        fprintf(stderr, USAGE, argv[0]);
+        return 1;
+    }
+
+    FILE *fp = fopen(argv[optind], "rb");
+    if (!fp) {
+        fprintf(stderr, "gemm_replay: cannot open %s\n", argv[optind]);
+        return 1;
+    }
+    size_t name_len = strlen(argv[optind]);
+    int ok = name_len > 4 && !strcmp(argv[optind] + name_len - 4, ".bin") ? read_call_log(fp, &calls, &count)
+                                                                           : read_layers(fp, &calls, &count);
+    fclose(fp);
+    count = ok ? select_calls(calls, count, list, unique) : 0;
+    if (!count) {
+        fprintf(stderr, "gemm_replay: no GEMM calls to replay from %s\n", argv[optind]);
+        return 1;
+    }
+    printf("Replaying %d GEMM calls from %s\n", count, argv[optind]);
+
+    for (i = 0; i < count; ++i) replay(&calls[i]);
+    free(calls);
+    return 0;
+}
@@ -0,0 +1,365 @@
+"""Design-space-exploration sweep scheduler for gem5 GEMM runs.
+
+Expands a sweep spec (CPU configs x networks x GEMM methods x threading x
+tile sizes) into jobs and runs at most N gem5 processes at once. Every job
+gets its own output directory, used both as gem5's --outdir and as
+GEMM_LOG_DIR, so concurrent runs never overwrite each other. Job state is
+saved to sweep_state.json after every change, so an interrupted sweep can
+be resumed by running the same command again.
+
+With "memo" set to a gemm_memo.csv path, shapes already characterised for
+a job's configuration are written to memo_shapes.txt in its directory and
+passed to gemm.c through GEMM_SKIP_SHAPES, so gem5 does not profile them
+again; process.py --memo fills those layers from the memo afterwards.
+"profile" is passed to gemm.c as GEMM_PROFILE (e.g. "unique" or "every:4")
+to profile several GEMM calls in one continuous simulation.
+
+"threads" lists OpenMP thread counts; each multiplies the threading modes
+other than "single", so one sweep gives a scaling curve. Counts above a
+config's core count are skipped for that config. "placement" (the
+clusters threads fill first, e.g. "little_cores,big_cores") applies to the
+configs that have those clusters, and "schedule" (an OMP_SCHEDULE value
+such as "dynamic,4") to every job.
+
+"checkpoint_store" names a cpuconf/ckptstore.py directory shared by every
+job: the first job of a workload saves a checkpoint at its first GEMM call
+and the others restore it instead of simulating start-up again. With
+"fast_forward": true every job runs outside its GEMM ROIs on AtomicSimpleCPU
+and only the ROIs on the configured cores (generic_cpu_config.py
+--fast-forward). "replay" maps networks to a gemm_calls.bin (or .txt) of an
+earlier run; jobs of those networks run gemm_replay on it instead of
+darknet (generic_cpu_config.py --replay), optionally only for the
+"replay_calls" ("3,7,12" or "unique").
+
+Example spec (JSON):
+
+    {
+        "configs": ["IntelCorei7_11370H", "pynqz2"],
+        "networks": ["darknet", "resnet"],
+        "gemm_methods": ["gemm_nn", "tiled", "optimized"],
+        "threading": ["single", "openmp"],
+        "tile_sizes": [32, 64],
+        "threads": [1, 2, 4]
+    }
+
+Usage:
+    python3 sweep.py sweep.json [--max-jobs N] [--dry-run]
+"""
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+
+from gemm_memo import SHAPES_FILE, known_shapes, load_memo, run_key, write_shapes_file
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT_DIR, "cpuconf"))
+
+from hwdesc import hardware_hash, load_hardware, total_cores
+
+DEFAULT_GEM5 = "/opt/GEMM-ArchProfiler/gem5/build/X86/gem5.opt"
+DEFAULT_WORKDIR = "/opt/GEMM-ArchProfiler/darknet"
+DEFAULT_OUTPUT_ROOT = "/opt/GEMM-ArchProfiler/output/sweep"
+DEFAULT_CONFIG_SCRIPT = os.path.join(ROOT_DIR, "cpuconf", "generic_cpu_config.py")
+DEFAULT_JOB_MEMORY_GIB = 4.0
+
+# GEMM methods whose kernel takes a tile size
+TILED_METHODS = ("tiled",)
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+
+def load_spec(path):
+    """Load a sweep spec and fill in defaults."""
+    with open(path, "r") as file:
+        spec = json.load(file)
+    for key in ("configs", "networks"):
+        if not spec.get(key):
+            raise ValueError(f"sweep spec {path}: '{key}' must be a non-empty list")
+    spec.setdefault("gemm_methods", ["gemm_nn"])
+    spec.setdefault("threading", ["single"])
+    spec.setdefault("tile_sizes", [])
+    spec.setdefault("threads", [])
+    spec.setdefault("placement", None)
+    spec.setdefault("schedule", None)
+    spec.setdefault("binaries", {})
+    spec.setdefault("gem5", DEFAULT_GEM5)
+    spec.setdefault("config_script", DEFAULT_CONFIG_SCRIPT)
+    spec.setdefault("workdir", DEFAULT_WORKDIR)
+    spec.setdefault("output_root", DEFAULT_OUTPUT_ROOT)
+    spec.setdefault("memo", None)
+    spec.setdefault("profile", None)
+    spec.setdefault("checkpoint_store", None)
+    spec.setdefault("fast_forward", False)
+    spec.setdefault("replay", {})
+    spec.setdefault("replay_calls", None)
+    return spec
+
+
+def expand_jobs(spec):
+    """Return the jobs of a sweep spec as {job_id: job}.
+
+    Tile sizes only multiply the methods in TILED_METHODS and thread counts
+    only the threading modes other than "single"; thread counts above a
+    config's core count are dropped for that config, and so is the
+    placement of a config without the clusters it names. The job id is also
+    the job's output directory relative to output_root.
+    """
+    hws = {config: load_hardware(config) for config in spec["configs"]}
+    cores, placements = {}, {}
+    for config, hw in hws.items():
+        cores[config] = total_cores(hw)
+        dropped = [threads for threads in spec["threads"] if threads > cores[config]]
+        if dropped:
+            print(f"{config} has {cores[config]} cores; skipping threads {', '.join(map(str, dropped))}")
+        names = [cluster["name"] for cluster in hw["clusters"]]
+        placements[config] = spec["placement"]
+        if spec["placement"] and not set(spec["placement"].split(",")) <= set(names):
+            print(f"{config} has clusters {', '.join(names)}; running it without placement {spec['placement']}")
+            placements[config] = None
+    jobs = {}
+    for config, network, method, threading in itertools.product(
+        spec["configs"], spec["networks"], spec["gemm_methods"], spec["threading"]
+    ):
+        tiles = spec["tile_sizes"] if method in TILED_METHODS and spec["tile_sizes"] else [None]
+        if threading == "single":
+            thread_counts = [1]
+        elif spec["threads"]:
+            thread_counts = [threads for threads in spec["threads"] if threads <= cores[config]]
+        else:
+            thread_counts = [None]
+        for tile, threads in itertools.product(tiles, thread_counts):
+            threading_dir = threading if threading == "single" or threads is None else f"{threading}_t{threads}"
+            parts = [config, network, method if tile is None else f"{method}_bs{tile}", threading_dir]
+            job_id = "/".join(parts)
+            jobs[job_id] = {
+                "config": config,
+                "network": network,
+                "gemm_method": method,
+                "threading": threading,
+                "threads": threads,
+                "placement": placements[config],
+                "schedule": spec["schedule"],
+                "tile_size": tile,
+                "outdir": os.path.join(spec["output_root"], *parts),
+            }
+    return jobs
+
+
+def job_command(spec, job):
+    """gem5 command line for one job."""
+    command = [
+        spec["gem5"],
+        f"--outdir={job['outdir']}",
+        spec["config_script"],
+        "--hw", job["config"],
+        "--network", job["network"],
+        "--outdir", job["outdir"],
+        "--checkpoint-dir", os.path.join(job["outdir"], "checkpoints"),
+        "--gemm-method", job["gemm_method"],
+        "--threading", job["threading"],
+    ]
+    if job["tile_size"] is not None:
+        command += ["--tile-size", str(job["tile_size"])]
+    if job["threads"] is not None:
+        command += ["--threads", str(job["threads"])]
+    if job["placement"]:
+        command += ["--placement", job["placement"]]
+    if job["schedule"]:
+        command += ["--schedule", job["schedule"]]
+    if spec["checkpoint_store"]:
+        command += ["--checkpoint-store", spec["checkpoint_store"]]
+    if spec["fast_forward"]:
+        command.append("--fast-forward")
+    trace = spec["replay"].get(job["network"])
+    if trace:
+        command += ["--replay", trace]
+        if spec["replay_calls"]:
+            command += ["--replay-calls", spec["replay_calls"]]
+    # "binaries" are darknet builds; a replay job runs gemm_replay
+    binary = None if trace else spec["binaries"].get(job["gemm_method"])
+    if binary:
+        command += ["--binary", binary]
+    return command
+
+
+def job_env(job, shapes_file=None, profile=None):
+    """Environment for one job; GEMM_* and OMP_* reach the simulated process."""
+    env = dict(os.environ)
+    env["GEMM_LOG_DIR"] = job["outdir"]
+    if profile:
+        env["GEMM_PROFILE"] = profile
+    if shapes_file:
+        env["GEMM_SKIP_SHAPES"] = shapes_file
+    env["GEMM_METHOD"] = job["gemm_method"]
+    if job["tile_size"] is not None:
+        env["GEMM_BLOCK_SIZE"] = str(job["tile_size"])
+    if job["threads"] is not None:
+        env["OMP_NUM_THREADS"] = str(job["threads"])
+    return env
+
+
+def write_job_shapes(job, memo):
+    """Write the job's already-memoised shapes to memo_shapes.txt; returns its path or None."""
+    shapes_file = os.path.join(job["outdir"], SHAPES_FILE)
+    metadata = dict(job, hw_hash=hardware_hash(load_hardware(job["config"])))
+    shapes = known_shapes(memo, run_key(metadata))
+    if not shapes:
+        # A stale file from an earlier attempt would hide layers from process.py
+        if os.path.exists(shapes_file):
+            os.remove(shapes_file)
+        return None
+    write_shapes_file(shapes_file, shapes)
+    return shapes_file
+
+
+def host_memory_gib():
+    """Physical memory of the host in GiB."""
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / (1 << 30)
+
+
+def default_max_jobs(job_memory_gib=DEFAULT_JOB_MEMORY_GIB):
+    """Host cores, capped by how many jobs of `job_memory_gib` fit in memory."""
+    by_memory = int(host_memory_gib() // job_memory_gib) if job_memory_gib > 0 else os.cpu_count()
+    return max(1, min(os.cpu_count() or 1, by_memory))
+
+
+def load_state(state_file, jobs):
+    """Merge saved job state into `jobs`; jobs left running by a crash become pending."""
+    state = {job_id: dict(job, status=PENDING, attempts=0) for job_id, job in jobs.items()}
+    if os.path.exists(state_file):
+        with open(state_file, "r") as file:
+            saved = json.load(file)
+        for job_id, job in saved.items():
+            if job_id in state:
+                status = job.get("status", PENDING)
+                state[job_id].update(
+                    status=PENDING if status == RUNNING else status,
+                    attempts=job.get("attempts", 0),
+                    returncode=job.get("returncode"),
+                )
+    return state
+
+
+def save_state(state_file, state):
+    """Write job state atomically."""
+    tmp_file = state_file + ".tmp"
+    with open(tmp_file, "w") as file:
+        json.dump(state, file, indent=4, sort_keys=True)
+    os.replace(tmp_file, state_file)
+
+
+def run_sweep(spec, state_file=None, max_jobs=None, retry_failed=False, poll_interval=1.0):
+    """Run every unfinished job of a sweep with at most `max_jobs` at once.
+
+    Returns the final job state. Ctrl-C stops the running gem5 processes
+    and leaves them pending for the next run.
+    """
+    jobs = expand_jobs(spec)
+    os.makedirs(spec["output_root"], exist_ok=True)
+    state_file = state_file or os.path.join(spec["output_root"], "sweep_state.json")
+    state = load_state(state_file, jobs)
+    if retry_failed:
+        for job in state.values():
+            if job["status"] == FAILED:
+                job["status"] = PENDING
+    save_state(state_file, state)
+
+    memo = load_memo(spec["memo"]) if spec["memo"] else None
+    max_jobs = max_jobs or default_max_jobs()
+    pending = [job_id for job_id in sorted(state) if state[job_id]["status"] == PENDING]
+    done = sum(job["status"] == DONE for job in state.values())
+    print(f"{len(state)} jobs, {done} already done, {len(pending)} to run, up to {max_jobs} at once.")
+
+    running = {}
+    try:
+        while pending or running:
+            while pending and len(running) < max_jobs:
+                job_id = pending.pop(0)
+                job = state[job_id]
+                os.makedirs(job["outdir"], exist_ok=True)
+                shapes_file = write_job_shapes(job, memo) if memo is not None else None
+                log = open(os.path.join(job["outdir"], "gem5_status.log"), "w")
+                process = subprocess.Popen(
+                    job_command(spec, job),
+                    cwd=spec["workdir"],
+                    env=job_env(job, shapes_file, spec["profile"]),
+                    stdout=log,
+                    stderr=subprocess.STDOUT,
+                )
+                running[job_id] = (process, log)
+                job.update(status=RUNNING, attempts=job["attempts"] + 1, started=time.time())
+                save_state(state_file, state)
+                print(f"Started {job_id} (pid {process.pid})")
+
+            for job_id, (process, log) in list(running.items()):
+                returncode = process.poll()
+                if returncode is None:
+                    continue
+                log.close()
+                del running[job_id]
+                state[job_id].update(
+                    status=DONE if returncode == 0 else FAILED, returncode=returncode, finished=time.time()
+                )
+                save_state(state_file, state)
+                print(f"{'Finished' if returncode == 0 else 'FAILED'} {job_id} (exit code {returncode})")
+
+            if running:
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("\nInterrupted; stopping running jobs, they will be rerun on resume.")
+        for job_id, (process, log) in running.items():
+            process.terminate()
+            process.wait()
+            log.close()
+            state[job_id]["status"] = PENDING
+        save_state(state_file, state)
+        raise
+
+    failed = [job_id for job_id, job in state.items() if job["status"] == FAILED]
+    print(f"Sweep finished: {len(state) - len(failed)} done, {len(failed)} failed. State saved to {state_file}")
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a gem5 design-space sweep with bounded concurrency.")
+    parser.add_argument("spec", help="sweep spec (JSON)")
+    parser.add_argument("--max-jobs", type=int, help="concurrent gem5 jobs (default: host cores, capped by memory)")
+    parser.add_argument(
+        "--job-memory",
+        type=float,
+        default=DEFAULT_JOB_MEMORY_GIB,
+        help=f"host memory per gem5 job in GiB for the default --max-jobs (default: {DEFAULT_JOB_MEMORY_GIB:g})",
+    )
+    parser.add_argument("--state", help="job state file (default: <output_root>/sweep_state.json)")
+    parser.add_argument("--retry-failed", action="store_true", help="rerun jobs that failed in a previous run")
+    parser.add_argument("--gem5", help="gem5 binary, overriding the spec (e.g. a stub for testing)")
+    parser.add_argument("--dry-run", action="store_true", help="print the job commands without running them")
+    args = parser.parse_args()
+
+    spec = load_spec(args.spec)
+    if args.gem5:
+        spec["gem5"] = args.gem5
+
+    if args.dry_run:
+        for job_id, job in expand_jobs(spec).items():
+            print(f"{job_id}: {' '.join(job_command(spec, job))}")
+        return
+
+    try:
+        state = run_sweep(
+            spec,
+            state_file=args.state,
+            max_jobs=args.max_jobs or default_max_jobs(args.job_memory),
+            retry_failed=args.retry_failed,
+        )
+    except KeyboardInterrupt:
+        sys.exit(130)
+    sys.exit(1 if any(job["status"] == FAILED for job in state.values()) else 0)
+
+
+if __name__ == "__main__":
+    main()